@@ -0,0 +1,187 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Run as `python benchmarks/run_benchmarks.py` from anywhere, the tva package lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+from tva.situation import Situation
+from tva.schemes import Schemes
+from tva.happiness import Happiness
+from tva.strategies import Strategies
+from tva.models.BTVA import BTVA
+from tva.models.ATVA1 import ATVA1
+from tva.models.ATVA2 import ATVA2
+from tva.models.ATVA3 import ATVA3
+from tva.models.ATVA4 import ATVA4
+
+########## Benchmark settings ##########
+SEED = 2024
+# (num_voters, num_candidates) of the component and BTVA benchmarks
+SCALES = [(10, 4), (50, 5), (200, 6)]
+# The advanced models search coalitions, so they run on smaller electorates
+MODEL_SCALES = [(5, 4), (8, 5)]
+QUICK_SCALES = [(10, 4), (30, 5)]
+QUICK_MODEL_SCALES = [(5, 4)]
+NUM_SITUATIONS = 20
+########################################
+
+
+def situations(num_voters, num_candidates, num_situations=NUM_SITUATIONS, info=None):
+    """Fresh situations (with empty caches) that are the same on every run."""
+    return Situation.generate(num_situations, num_voters, num_candidates, seed=[SEED, num_voters, num_candidates], info=info)
+
+
+def benchmark_cases(scales, model_scales):
+    """
+    Yields (name, setup) pairs. setup() builds fresh inputs and returns the function to time, so caches
+    (situation tallies, strategy caches) never carry over between repeats.
+    """
+    schemes = Schemes()
+    happiness = Happiness()
+    for num_voters, num_candidates in scales:
+        scale = f'n{num_voters}_m{num_candidates}'
+        for voting_scheme in VotingScheme:
+            def setup(voting_scheme=voting_scheme, num_voters=num_voters, num_candidates=num_candidates):
+                voter_lists = [situation.voters for situation in situations(num_voters, num_candidates)]
+                return lambda: [schemes.apply_voting_scheme(voting_scheme, voters) for voters in voter_lists]
+            yield f'schemes/{voting_scheme.name}/{scale}', setup
+
+            def setup(voting_scheme=voting_scheme, num_voters=num_voters, num_candidates=num_candidates):
+                profiles = [situation.get_profile() for situation in situations(num_voters, num_candidates)]
+                return lambda: [schemes.apply_voting_scheme(voting_scheme, profile) for profile in profiles]
+            yield f'schemes/{voting_scheme.name}/profile/{scale}', setup
+
+        for happiness_func in HappinessFunc:
+            def setup(happiness_func=happiness_func, num_voters=num_voters, num_candidates=num_candidates):
+                batch = situations(num_voters, num_candidates)
+                rankings = [schemes.apply_voting_scheme(VotingScheme.BORDA, situation.get_profile(), return_ranking=True) for situation in batch]
+                return lambda: [happiness.calculate_outcome(situation.get_profile(), ranking, happiness_func) for situation, ranking in zip(batch, rankings)]
+            yield f'happiness/{happiness_func.name}/{scale}', setup
+
+        for strategy_type in StrategyType:
+            def setup(strategy_type=strategy_type, num_voters=num_voters, num_candidates=num_candidates):
+                batch = situations(num_voters, num_candidates)
+                strategies = Strategies()
+                return lambda: [strategies.get_strategic_preferences_for_voter(situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR, strategy_type, False)
+                                for situation in batch for voter_index in range(num_voters)]
+            yield f'strategies/{strategy_type.name}/{scale}', setup
+
+        def setup(num_voters=num_voters, num_candidates=num_candidates):
+            batch = situations(num_voters, num_candidates)
+            btva = BTVA()
+            return lambda: btva.analyse_multiple(batch, VotingScheme.BORDA, HappinessFunc.KENDALL_TAU, StrategyType.COMPROMISING, True)
+        yield f'models/BTVA.analyse_multiple/{scale}', setup
+
+    for num_voters, num_candidates in model_scales:
+        scale = f'n{num_voters}_m{num_candidates}'
+
+        def setup(num_voters=num_voters, num_candidates=num_candidates):
+            batch = situations(num_voters, num_candidates)
+            atva1 = ATVA1()
+            return lambda: atva1.analyse_multiple_ATVA(batch, len(batch), VotingScheme.PLURALITY, HappinessFunc.LINEAR, 3)
+        yield f'models/ATVA1.analyse_multiple_ATVA/{scale}', setup
+
+        def setup(num_voters=num_voters, num_candidates=num_candidates):
+            batch = situations(num_voters, num_candidates, num_situations=3)
+            atva2 = ATVA2()
+            return lambda: [atva2.analyse_single(situation, HappinessFunc.LINEAR, VotingScheme.BORDA, StrategyType.COMPROMISING) for situation in batch]
+        yield f'models/ATVA2.analyse_single/{scale}', setup
+
+        def setup(num_voters=num_voters, num_candidates=num_candidates):
+            batch = situations(num_voters, num_candidates, info=0.10)
+            atva3 = ATVA3()
+            return lambda: [atva3.monte_carlo_best_preferences(situation, VotingScheme.BORDA, num_simulations=100, seed=[SEED, i]) for i, situation in enumerate(batch)]
+        yield f'models/ATVA3.monte_carlo_best_preferences/{scale}', setup
+
+        def setup(num_voters=num_voters, num_candidates=num_candidates):
+            batch = situations(num_voters, num_candidates)
+            atva4 = ATVA4(3)
+            return lambda: atva4.analyse_multiple(len(batch), num_voters, num_candidates, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.BURYING, situations=batch)
+        yield f'models/ATVA4.analyse_multiple/{scale}', setup
+
+
+def run(cases, repeats, pattern=None):
+    results = {}
+    for name, setup in cases:
+        if pattern is not None and pattern not in name:
+            continue
+        timings = []
+        for _ in range(repeats):
+            benchmark = setup()
+            # The models print their progress, keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                start = time.perf_counter()
+                benchmark()
+                timings.append(time.perf_counter() - start)
+        results[name] = {'best': min(timings), 'mean': sum(timings) / len(timings), 'repeats': repeats}
+        print(f'{name:<55} {min(timings) * 1000:10.2f} ms')
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': SEED
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change of every benchmark against a baseline and return the names that slowed down by more than `threshold`."""
+    regressions = []
+    print(f'\n{"benchmark":<55} {"baseline":>10} {"current":>10} {"change":>8}')
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['best'], result['best']
+        change = new / old - 1 if old > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<55} {old * 1000:8.2f}ms {new * 1000:8.2f}ms {change:+8.1%}{flag}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the voting schemes, happiness functions, strategies and models over a grid of electorate sizes.')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.20, help='slowdown (as a fraction of the baseline) counted as a regression')
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per benchmark, the best one is reported')
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this text')
+    parser.add_argument('--quick', action='store_true', help='smaller grid, for a fast check')
+    args = parser.parse_args()
+
+    cases = benchmark_cases(QUICK_SCALES if args.quick else SCALES, QUICK_MODEL_SCALES if args.quick else MODEL_SCALES)
+    results = run(cases, args.repeats, args.filter)
+    report = {'metadata': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} benchmark(s) slowed down by more than {args.threshold:.0%}')
+            sys.exit(1)
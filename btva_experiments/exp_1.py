@@ -26,10 +26,11 @@ results = []
 
 for voting_scheme in voting_schemes:
     for num_voters in voter_range:
-        situations = [Situation(num_voters, num_candidates) for _ in range(num_repetitions)]
+        situations = Situation.generate(num_repetitions, num_voters, num_candidates)
         total_happiness = 0
-        for situation in situations:
-            total_h, _ = situation.calculate_happiness(situation.voters, happiness_func, voting_scheme)
+        # Score all honest elections of this configuration in one batch
+        for situation, ranking in zip(situations, btva.honest_rankings(situations, voting_scheme)):
+            total_h, _ = situation.calculate_outcome_happiness(ranking, happiness_func)
             total_happiness += total_h
         avg_happiness = total_happiness / num_repetitions
         results.append((num_voters, voting_scheme.value, avg_happiness))
@@ -1,10 +1,9 @@
 import pandas as pd
 from matplotlib import pyplot as plt
 import seaborn as sns
-import os
 from tva.models.BTVA import BTVA
 from tva.enums import StrategyType, VotingScheme, HappinessFunc
-from tva.situation import Situation
+from tva.grid import ExperimentGrid
 
 # Experiment settings
 num_repetitions = 25
@@ -17,27 +16,26 @@ strategy_type = StrategyType.COMPROMISING
 title = f"{num_candidates} candidates, {happiness_func.value.lower()}, {strategy_type.value.lower()}"
 results_file = title + ' step 2.csv'
 
-if not os.path.exists(results_file):
+seed = 0
 
+btva = BTVA()
 
-    btva = BTVA()
+# Every voting scheme is analysed on the same situations of each voter count
+grid = ExperimentGrid(num_repetitions, voter_range, num_candidates, voting_schemes, [happiness_func], [strategy_type], seed=seed)
 
-    # Store results for strategic voting
-    strategic_results = []
+def evaluate(batch, voting_scheme, happiness_func, strategy_type):
+    risk, avg_strategic_happiness, avg_honest_happiness = btva.analyse_multiple(batch.situations, voting_scheme, happiness_func, strategy_type, return_avg_happiness=True, verbose=False,
+                                                                                 honest_rankings=batch.honest_rankings(voting_scheme),
+                                                                                 honest_happiness=batch.honest_happiness(voting_scheme, happiness_func))
+    return {"avg_honest_happiness": avg_honest_happiness, "avg_strategic_happiness": avg_strategic_happiness, "risk": risk}
 
-    for voting_scheme in voting_schemes:
-        for num_voters in voter_range:
-            situations = [Situation(num_voters, num_candidates) for _ in range(num_repetitions)]
-            risk, avg_strategic_happiness, avg_honest_happiness = btva.analyse_multiple(situations, voting_scheme, happiness_func, strategy_type, return_avg_happiness=True, verbose=False)
-            # avg_strategic_happiness = total_strategic_happiness / num_repetitions
-            strategic_results.append((num_voters, voting_scheme.value, avg_honest_happiness, avg_strategic_happiness, risk))
+# Completed cells are kept in the checkpoint directory, a rerun only analyses the missing ones
+strategic_results = grid.run(evaluate, checkpoint='checkpoints/exp_2')
 
-    # Convert results to DataFrame
-    strategic_df = pd.DataFrame(strategic_results, columns=["num_voters", "voting_scheme", "avg_honest_happiness", "avg_strategic_happiness", "risk"])
-    strategic_df.to_csv(title)
-
-else:
-    strategic_df = pd.read_csv(results_file)
+# Convert results to DataFrame
+strategic_df = pd.DataFrame(strategic_results, columns=["num_voters", "voting_scheme", "avg_honest_happiness", "avg_strategic_happiness", "risk"])
+strategic_df["voting_scheme"] = strategic_df["voting_scheme"].map(lambda voting_scheme: voting_scheme.value)
+strategic_df.to_csv(results_file, index=False)
 
 # Plot results
 plt.figure(figsize=(12, 8))
@@ -39,13 +39,13 @@ def compare_btva_atva1_modified():
     # Loop over happiness functions and max colluders values
     for happiness_func in happiness_funcs:
         print(f"\nHappiness Function: {happiness_func}")
-        for max_c in max_collusion_values:
-            print(f"  Testing with max colluders = {max_c}")
-            # Generate simulation situations
-            situations = [Situation(num_voters, num_candidates) for _ in range(num_repetitions)]
-            # Run analysis for current configuration
-            analysis_result = atva1.analyse_multiple_ATVA(situations,num_repetitions, voting_scheme, happiness_func, max_collusion=max_c, verbose=False)
-            avg_risk = analysis_result['atva1_risk']  # Assuming this key returns the average risk value
+        # Generate simulation situations
+        situations = Situation.generate(num_repetitions, num_voters, num_candidates)
+        # One pass reports every max colluders value, the strategies and coalitions of a situation are searched once
+        analysis_results = atva1.analyse_multiple_per_cap(situations, num_repetitions, voting_scheme, happiness_func, max_collusion_values, verbose=False)
+        for max_c, analysis_result in analysis_results.items():
+            print(f"  Max colluders = {max_c}")
+            avg_risk = analysis_result['atva1_risk']
             results.append({
                 'happiness_func': str(happiness_func),
                 'max_colluders': max_c,
@@ -106,12 +106,12 @@ def compare_schemes_kendall_tau():
     
     for scheme in voting_schemes:
         print(f"\nVoting Scheme: {scheme}")
-        for max_c in max_collusion_values:
-            print(f"  Testing with max colluders = {max_c}")
-            # Generate simulation situations for each configuration
-            situations = [Situation(num_voters, num_candidates) for _ in range(num_repetitions)]
-            # Run analysis for current voting scheme and max colluders value
-            analysis_result = atva1.analyse_multiple_ATVA(situations,num_repetitions, scheme, happiness_func, max_collusion=max_c, verbose=False)
+        # Generate simulation situations for each voting scheme
+        situations = Situation.generate(num_repetitions, num_voters, num_candidates)
+        # One pass reports every max colluders value, the strategies and coalitions of a situation are searched once
+        analysis_results = atva1.analyse_multiple_per_cap(situations, num_repetitions, scheme, happiness_func, max_collusion_values, verbose=False)
+        for max_c, analysis_result in analysis_results.items():
+            print(f"  Max colluders = {max_c}")
             avg_risk = analysis_result['atva1_risk']  # Retrieve the average risk
             results.append({
                 'voting_scheme': str(scheme),
@@ -1,5 +1,6 @@
 from tva.models.ATVA3 import BTVA, ATVA3
 from tva.situation import Situation
+from tva.grid import ExperimentGrid, SharedBatch
 from tva.enums import VotingScheme, HappinessFunc, StrategyType
 import pandas as pd
 from tabulate import tabulate
@@ -13,6 +14,7 @@ def compare_btva_atva3():
     num_voters = 4
     num_candidates = 5
     max_simultaneous_voters = 3  # Maximum number of voters that can vote strategically simultaneously
+    seed = 0  # Seeds the situations, so an interrupted comparison resumes on the same ones
     
     voting_schemes = [
         VotingScheme.PLURALITY,
@@ -39,42 +41,44 @@ def compare_btva_atva3():
     btva = BTVA()
     atva3 = ATVA3()
     
-    results = []
+    # Every cell is evaluated on the same situations, generated once
+    grid = ExperimentGrid(num_repetitions, num_voters, num_candidates, voting_schemes, happiness_funcs, strategy_types, seed=seed)
+    batch_atva3 = SharedBatch(Situation.generate(num_repetitions, num_voters, num_candidates, seed=[seed, 1], info=0.10), num_voters, num_candidates)
     
     print(f"Comparing BTVA and ATVA4 (max simultaneous voters: {max_simultaneous_voters})")
     print(f"Running {num_repetitions} simulations for each configuration")
     print(f"Number of voters: {num_voters}, Number of candidates: {num_candidates}")
     print("-" * 80)
     
-    for voting_scheme in voting_schemes:
-        print(f"\nVoting Scheme: {voting_scheme}")
-        for happiness_func in happiness_funcs:
-            print(f"\n  Happiness Function: {happiness_func}")
-            for strategy_type in strategy_types:
-                print(f"\n    Strategy Type: {strategy_type}")
-                
-                situations = [Situation(num_voters, num_candidates) for _ in range(num_repetitions)]
-                situations_atva3 = [Situation(num_voters, num_candidates, info=0.10) for _ in range(num_repetitions)]
-                atva_3_situations = []
-                for situation in situations_atva3:
-                    atva_3_situation, _ = atva3.monte_carlo_best_preferences(situation, voting_scheme)
-                    atva_3_situations.append(atva_3_situation)
-                btva_risk = btva.analyse_multiple(situations, 
-                    voting_scheme, happiness_func, strategy_type, False)
-                
-                atva3_result = btva.analyse_multiple(atva_3_situations, 
-                    voting_scheme, happiness_func, strategy_type, False)
-                
-                results.append({
-                    'voting_scheme': voting_scheme,
-                    'happiness_func': happiness_func,
-                    'strategy_type': strategy_type,
-                    'btva_risk': btva_risk,
-                    'atva3_risk': atva3_result,
-                })
-                
-                print(f"      BTVA Risk:                 {btva_risk:.2f}%")
-                print(f"      ATVA3 Risk:                {atva3_result:.2f}%")    
+    def complete_situations(voting_scheme):
+        atva_3_situations = []
+        for index, situation in enumerate(batch_atva3.situations):
+            atva_3_situation, _ = atva3.monte_carlo_best_preferences(situation, voting_scheme, seed=[seed, index, voting_schemes.index(voting_scheme)])
+            atva_3_situations.append(atva_3_situation)
+        return atva_3_situations
+    
+    def evaluate(batch, voting_scheme, happiness_func, strategy_type):
+        print(f"\nVoting Scheme: {voting_scheme}, Happiness Function: {happiness_func}, Strategy Type: {strategy_type}")
+        
+        # The completed preferences only depend on the voting scheme
+        atva_3_situations = batch_atva3.derive(('atva3', voting_scheme), lambda: complete_situations(voting_scheme))
+        btva_risk = btva.analyse_multiple(batch.situations, 
+            voting_scheme, happiness_func, strategy_type, False,
+            honest_rankings=batch.honest_rankings(voting_scheme),
+            honest_happiness=batch.honest_happiness(voting_scheme, happiness_func))
+        
+        atva3_result = btva.analyse_multiple(atva_3_situations, 
+            voting_scheme, happiness_func, strategy_type, False)
+        
+        print(f"      BTVA Risk:                 {btva_risk:.2f}%")
+        print(f"      ATVA3 Risk:                {atva3_result:.2f}%")
+        return {
+            'btva_risk': btva_risk,
+            'atva3_risk': atva3_result,
+        }
+    
+    # Completed cells are kept in a checkpoint directory, a rerun only evaluates the missing ones
+    results = grid.run(evaluate, checkpoint='checkpoints/compare_btva_atva3', config={'atva3_info': 0.10})
     df = pd.DataFrame(results)
     df['voting_scheme'] = df['voting_scheme'].astype(str)
     df['happiness_func'] = df['happiness_func'].astype(str)
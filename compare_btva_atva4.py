@@ -1,6 +1,7 @@
 from tva.models.ATVA4 import BTVA, ATVA4
-from tva.situation import Situation
+from tva.grid import ExperimentGrid
 from tva.enums import VotingScheme, HappinessFunc, StrategyType
+from tva import instrumentation
 import pandas as pd
 from tabulate import tabulate
 
@@ -13,6 +14,8 @@ def compare_btva_atva4():
     num_voters = 7
     num_candidates = 5
     max_simultaneous_voters = 4  # Maximum number of voters that can vote strategically simultaneously
+    seed = 0  # Seeds the situations, so an interrupted comparison resumes on the same ones
+    profile_file = None  # Set to a path to record where the run spends its time (see tva.instrumentation)
     
     voting_schemes = [
         VotingScheme.PLURALITY,
@@ -35,44 +38,46 @@ def compare_btva_atva4():
         StrategyType.COMPROMISING
     ]
     
+    if profile_file is not None:
+        instrumentation.enable()
+    
     # Initialize models
     btva = BTVA()
     atva4 = ATVA4(max_simultaneous_voters)
     
-    results = []
+    # Every cell is evaluated on the same situations, generated once
+    grid = ExperimentGrid(num_repetitions, num_voters, num_candidates, voting_schemes, happiness_funcs, strategy_types, seed=seed)
     
     print(f"Comparing BTVA and ATVA4 (max simultaneous voters: {max_simultaneous_voters})")
     print(f"Running {num_repetitions} simulations for each configuration")
     print(f"Number of voters: {num_voters}, Number of candidates: {num_candidates}")
     print("-" * 80)
     
-    for voting_scheme in voting_schemes:
-        print(f"\nVoting Scheme: {voting_scheme}")
-        for happiness_func in happiness_funcs:
-            print(f"\n  Happiness Function: {happiness_func}")
-            for strategy_type in strategy_types:
-                print(f"\n    Strategy Type: {strategy_type}")
-                
-                btva_risk = btva.analyse_multiple(
-                    num_repetitions, num_voters, num_candidates, 
-                    voting_scheme, happiness_func, strategy_type, False)
-                
-                atva4_result = atva4.analyse_multiple(
-                    num_repetitions, num_voters, num_candidates, 
-                    voting_scheme, happiness_func, strategy_type, False)
-                
-                results.append({
-                    'voting_scheme': voting_scheme,
-                    'happiness_func': happiness_func,
-                    'strategy_type': strategy_type,
-                    'btva_risk': btva_risk,
-                    'atva4_risk': atva4_result['atva4_risk'],
-                    'happiness_improvement_rate': atva4_result['happiness_improvement_rate']
-                })
-                
-                print(f"      BTVA Risk:                 {btva_risk:.2f}%")
-                print(f"      ATVA4 Risk:                {atva4_result['atva4_risk']:.2f}%")
-                print(f"      Happiness Improvement:      {atva4_result['happiness_improvement_rate']:.2f}%")
+    def evaluate(batch, voting_scheme, happiness_func, strategy_type):
+        print(f"\nVoting Scheme: {voting_scheme}, Happiness Function: {happiness_func}, Strategy Type: {strategy_type}")
+        
+        btva_risk = btva.analyse_multiple(
+            batch.situations, voting_scheme, happiness_func, strategy_type, False,
+            honest_rankings=batch.honest_rankings(voting_scheme),
+            honest_happiness=batch.honest_happiness(voting_scheme, happiness_func))
+        
+        atva4_result = atva4.analyse_multiple(
+            num_repetitions, num_voters, num_candidates, 
+            voting_scheme, happiness_func, strategy_type, False, situations=batch.situations)
+        
+        print(f"      BTVA Risk:                 {btva_risk:.2f}%")
+        print(f"      ATVA4 Risk:                {atva4_result['atva4_risk']:.2f}%")
+        print(f"      Happiness Improvement:      {atva4_result['happiness_improvement_rate']:.2f}%")
+        return {
+            'btva_risk': btva_risk,
+            'atva4_risk': atva4_result['atva4_risk'],
+            'happiness_improvement_rate': atva4_result['happiness_improvement_rate']
+        }
+    
+    # Completed cells are kept in a checkpoint directory, a rerun only evaluates the missing ones
+    results = grid.run(evaluate, checkpoint='checkpoints/compare_btva_atva4', config={'max_simultaneous_voters': max_simultaneous_voters})
+    if profile_file is not None:
+        instrumentation.export_json(profile_file)
     
     df = pd.DataFrame(results)
     df['voting_scheme'] = df['voting_scheme'].astype(str)
@@ -21,8 +21,8 @@ verbose = False
 
 
 btva = BTVA()
-situations = [Situation(num_voters, num_candidates) for _ in range(num_repetitions)]
-risk, avg_strat_happiness, avg_honest_happiness  = btva.analyse_multiple(situations, voting_scheme, happiness_func, strategy_type, True, verbose)
+situations = Situation.generate(num_repetitions, num_voters, num_candidates)
+risk, avg_strat_happiness, avg_honest_happiness  = btva.analyse_multiple(situations, voting_scheme, happiness_func, strategy_type, True, verbose, progress=True)
 print(f'Risk of strategic voting: {risk}%, Average Strategic Happiness: {avg_strat_happiness:.3f}, Average Honest Happiness: {avg_honest_happiness:.3f}')
 
 # situation = Situation(num_voters=num_voters, num_candidates=num_candidates)
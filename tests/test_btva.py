@@ -0,0 +1,25 @@
+import pytest
+from tva.situation import Situation
+from tva.models.BTVA import BTVA
+from tva.enums import VotingScheme, HappinessFunc, StrategyType, HEURISTIC_STRATEGIES
+
+
+def test_progress_bar_is_opt_in(capsys):
+    situations = Situation.generate(5, 5, 4, seed=93)
+    btva = BTVA()
+    risk = btva.analyse_multiple(situations, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING)
+    assert capsys.readouterr().err == ''
+    assert btva.analyse_multiple(situations, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, progress=True) == risk
+    assert '5/5' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('happiness_func', [HappinessFunc.LINEAR, HappinessFunc.KENDALL_TAU])
+def test_process_pool_matches_the_serial_loop(happiness_func):
+    # 13 situations in chunks of 4 leave a last chunk of 1
+    situations = Situation.generate(13, 6, 4, seed=94)
+    btva = BTVA()
+    for strategy_type in HEURISTIC_STRATEGIES:
+        serial = btva.analyse_multiple(situations, VotingScheme.BORDA, happiness_func, strategy_type, return_avg_happiness=True)
+        parallel = btva.analyse_multiple(situations, VotingScheme.BORDA, happiness_func, strategy_type, return_avg_happiness=True, workers=2, chunk_size=4)
+        assert parallel == serial
+        assert btva.analyse_multiple(situations, VotingScheme.BORDA, happiness_func, strategy_type, workers=3, chunk_size=5) == serial[0]
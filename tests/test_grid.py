@@ -0,0 +1,49 @@
+import pytest
+from tva.grid import ExperimentGrid
+from tva.checkpoint import CellStore
+from tva.situation import Situation
+from tva.models.ATVA3 import ATVA3
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+
+
+def grid(seed):
+    return ExperimentGrid(3, [4, 5], 4, [VotingScheme.BORDA, VotingScheme.PLURALITY], [HappinessFunc.LINEAR], [StrategyType.COMPROMISING], seed=seed)
+
+
+def honest_winners(batch, voting_scheme, happiness_func, strategy_type):
+    return {'winners': [situation.score_tally(voting_scheme).evaluate()[2] for situation in batch.situations]}
+
+
+def test_checkpointed_cells_are_not_evaluated_again(tmp_path):
+    calls = []
+
+    def evaluate(*args):
+        calls.append(args[1:])
+        return honest_winners(*args)
+
+    first = grid(7).run(evaluate, checkpoint=str(tmp_path / 'cells'))
+    assert len(calls) == 4
+    assert grid(7).run(evaluate, checkpoint=str(tmp_path / 'cells')) == first
+    assert len(calls) == 4
+    # Another seed is another experiment
+    grid(8).run(evaluate, checkpoint=str(tmp_path / 'cells'))
+    assert len(calls) == 8
+
+
+def test_checkpointing_needs_a_seed(tmp_path):
+    with pytest.raises(ValueError):
+        grid(None).run(honest_winners, checkpoint=str(tmp_path / 'cells'))
+    with pytest.raises(ValueError):
+        CellStore(str(tmp_path / 'cells')).put({'seed': None}, {})
+    # Without a checkpoint an unseeded grid still runs
+    assert len(grid(None).run(honest_winners)) == 4
+
+
+def test_seeded_monte_carlo_completion_is_reproducible():
+    atva3 = ATVA3()
+    for situation in Situation.generate(5, 5, 5, seed=9, info=0.3):
+        first, first_happiness = atva3.monte_carlo_best_preferences(situation, VotingScheme.BORDA, num_simulations=20, seed=[9, 1])
+        second, second_happiness = atva3.monte_carlo_best_preferences(situation, VotingScheme.BORDA, num_simulations=20, seed=[9, 1])
+        assert [voter.preferences for voter in first.voters] == [voter.preferences for voter in second.voters]
+        assert first_happiness == second_happiness
+        assert all('?' not in voter.preferences for voter in first.voters)
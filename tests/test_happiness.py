@@ -0,0 +1,124 @@
+import math
+import random
+import pytest
+from tva.situation import Situation
+from tva.happiness import Happiness
+from tva.schemes import Schemes
+from tva.profile import Profile
+from tva.strategies import Strategies
+from tva.models.BTVA import BTVA
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+
+WINNER_FUNCS = [HappinessFunc.LOG, HappinessFunc.EXP, HappinessFunc.LINEAR]
+
+
+def scalar_happiness(situation, winner, happiness_func):
+    """Happiness of every voter from the scalar functions, one voter at a time."""
+    happiness = Happiness()
+    individual = {voter.voter_id: happiness.calculate_individual(voter.preferences, winner, happiness_func) for voter in situation.voters}
+    return sum(individual.values()), individual
+
+
+@pytest.mark.parametrize('happiness_func', WINNER_FUNCS)
+def test_table_matches_scalar_functions(happiness_func):
+    for situation in Situation.generate(20, 7, 5, seed=1):
+        for winner in situation.candidates:
+            total, individual = situation.calculate_outcome_happiness([winner], happiness_func)
+            expected_total, expected_individual = scalar_happiness(situation, winner, happiness_func)
+            assert individual == pytest.approx(expected_individual)
+            assert total == pytest.approx(expected_total)
+
+
+def test_hidden_winner_raises_like_the_scalar_function():
+    # Voter 1 does not rank A, so LOG and EXP happiness is undefined if A wins
+    situation = Situation(3, 3, candidates=['A', 'B', 'C'], voters=[['A', 'B', 'C'], ['?', 'C', 'B'], ['A', 'C', 'B']])
+    for happiness_func in (HappinessFunc.LOG, HappinessFunc.EXP):
+        with pytest.raises(ValueError):
+            scalar_happiness(situation, 'A', happiness_func)
+        with pytest.raises(ValueError):
+            situation.calculate_outcome_happiness(['A', 'C', 'B'], happiness_func)
+        with pytest.raises(ValueError):
+            situation.calculate_happiness(happiness_func, VotingScheme.PLURALITY)
+        with pytest.raises(ValueError):
+            Happiness().calculate(situation.get_profile(), 'A', happiness_func)
+        # A winner every voter ranks is still fine
+        total, _ = situation.calculate_outcome_happiness(['C', 'A', 'B'], happiness_func)
+        assert total == pytest.approx(scalar_happiness(situation, 'C', happiness_func)[0])
+    # LINEAR scores an unranked winner like rank 0
+    assert situation.calculate_outcome_happiness(['A'], HappinessFunc.LINEAR)[1][1] == 1.5
+
+
+@pytest.mark.parametrize('happiness_func', [HappinessFunc.LOG, HappinessFunc.EXP])
+def test_masked_situations_never_give_nan(happiness_func):
+    btva = BTVA()
+    for situation in Situation.generate(30, 6, 4, seed=2, info=0.3):
+        try:
+            total, _ = situation.calculate_happiness(happiness_func, VotingScheme.BORDA)
+        except ValueError:
+            continue
+        assert not math.isnan(total)
+        # Profiles with hidden candidates are not filtered, so a hidden winner raises instead of silently dropping the voter
+        if any('?' in voter.preferences for voter in situation.voters):
+            assert len(situation.pivotal_voters(VotingScheme.BORDA, happiness_func)) == len(situation.voters)
+        try:
+            btva.analyse_single(situation, happiness_func, VotingScheme.BORDA, StrategyType.COMPROMISING)
+        except ValueError:
+            pass
+
+
+def test_masked_profiles_keep_every_voter_in_the_pivotal_filter():
+    situation = Situation(3, 3, candidates=['A', 'B', 'C'], voters=[['A', 'B', 'C'], ['?', 'C', 'B'], ['A', 'C', 'B']])
+    assert set(situation.pivotal_voters(VotingScheme.PLURALITY, HappinessFunc.LOG)) == {0, 1, 2}
+    # Voter 1's search scores the honest winner A, which it does not rank
+    with pytest.raises(ValueError):
+        Strategies().get_strategic_preferences_for_voter(situation, 1, VotingScheme.PLURALITY, HappinessFunc.LOG, StrategyType.COMPROMISING, True)
+
+
+def pairwise_kendall_tau(preferences, ranking):
+    """Kendall tau happiness counted pair by pair, as a reference for the inversion count."""
+    shared = [candidate for candidate in dict.fromkeys(preferences) if candidate in ranking]
+    pairs = [(a, b) for i, a in enumerate(shared) for b in shared[i + 1:]]
+    if not pairs:
+        return 1.0
+    concordant = sum(ranking.index(a) < ranking.index(b) for a, b in pairs)
+    return concordant / len(pairs)
+
+
+def ranked_cases():
+    """Profiles (complete, masked and partial ballots) with election rankings, some of which leave candidates out."""
+    rng = random.Random(8)
+    for situation in Situation.generate(10, 6, 5, seed=4) + Situation.generate(10, 6, 5, seed=5, info=0.3):
+        profile = situation.get_profile()
+        yield profile, Schemes().apply_voting_scheme(VotingScheme.BORDA, profile, return_ranking=True)
+        ranking = list(situation.candidates)
+        rng.shuffle(ranking)
+        yield profile, ranking[:rng.randint(1, len(ranking))]
+    partial = Profile.from_preferences([['B'], ['C', 'A'], ['A', 'B', 'C', 'D'], ['D', '?', 'B'], []], ['A', 'B', 'C', 'D'])
+    yield partial, ['C', 'A', 'D', 'B']
+    yield partial, ['B', 'D']
+
+
+def test_kendall_tau_matches_pairwise_counting():
+    happiness = Happiness()
+    for profile, ranking in ranked_cases():
+        expected = [pairwise_kendall_tau(preferences, ranking) for preferences in profile.to_preferences()]
+        assert [happiness.calculate_individual_ranked(preferences, ranking, HappinessFunc.KENDALL_TAU) for preferences in profile.to_preferences()] == pytest.approx(expected)
+        assert happiness.kendall_tau_batch(profile, ranking).tolist() == pytest.approx(expected)
+        _, individual = happiness.calculate_ranked(profile, ranking, HappinessFunc.KENDALL_TAU)
+        assert list(individual.values()) == pytest.approx(expected)
+
+
+def test_weighted_positional_batch_matches_the_scalar_function():
+    happiness = Happiness()
+    for profile, ranking in ranked_cases():
+        try:
+            expected = [happiness.calculate_individual_ranked(preferences, ranking, HappinessFunc.WEIGHTED_POSITIONAL) for preferences in profile.to_preferences()]
+        except IndexError:
+            # The scalar function has no weight for a label repeated past the last rank (several '?'), the batch falls back to it
+            with pytest.raises(IndexError):
+                happiness.weighted_positional_batch(profile, ranking)
+            continue
+        assert happiness.weighted_positional_batch(profile, ranking).tolist() == pytest.approx(expected)
+        total, individual = happiness.calculate_ranked(profile, ranking, HappinessFunc.WEIGHTED_POSITIONAL)
+        assert list(individual.values()) == pytest.approx(expected)
+        assert total == pytest.approx(sum(expected))
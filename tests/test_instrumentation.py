@@ -0,0 +1,42 @@
+from tva import instrumentation
+from tva.situation import Situation
+from tva.models.BTVA import BTVA, _analyse_chunk
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+
+
+def chunk(situations, instrument):
+    rankings = BTVA().honest_rankings(situations, VotingScheme.BORDA)
+    return situations, rankings, [None] * len(situations), VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, False, instrument
+
+
+def test_disabled_chunks_return_no_counters():
+    situations = Situation.generate(5, 5, 4, seed=91)
+    try:
+        # Counters left over from an earlier instrumented run, as a forked worker inherits them
+        instrumentation.enable()
+        instrumentation.count('elections', 7)
+        results, counters, phases = _analyse_chunk(chunk(situations, False))
+        assert counters == {} and phases == {}
+        assert len(results) == 5
+        results, counters, phases = _analyse_chunk(chunk(situations, True))
+        assert counters['elections'] > 0
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
+
+
+def test_parallel_runs_only_merge_when_enabled():
+    situations = Situation.generate(8, 5, 4, seed=92)
+    btva = BTVA()
+    try:
+        instrumentation.enable()
+        instrumentation.count('elections', 7)
+        instrumentation.disable()
+        btva.analyse_multiple(situations, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, workers=2)
+        assert instrumentation.counters == {'elections': 7}
+        instrumentation.enable()
+        btva.analyse_multiple(situations, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, workers=2)
+        assert instrumentation.counters['elections'] > 0
+    finally:
+        instrumentation.disable()
+        instrumentation.reset()
@@ -0,0 +1,77 @@
+import csv
+import math
+import pytest
+from tva.results import ResultSink, BTVA_SITUATION_SCHEMA, ATVA4_SIMULATION_SCHEMA
+
+
+def situation_record(situation, strategic_happiness=2.5):
+    return {
+        'situation': situation,
+        'voting_scheme': 'BORDA',
+        'happiness_func': 'LINEAR',
+        'strategy_type': 'BURYING',
+        'honest_happiness': 1.5,
+        'strategic_happiness': strategic_happiness,
+        'has_strategy': strategic_happiness is not None
+    }
+
+
+def read_csv(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_csv_records_are_written_in_batches(tmp_path):
+    path = str(tmp_path / 'situations.csv')
+    with ResultSink(path, BTVA_SITUATION_SCHEMA, batch_size=2) as sink:
+        sink.extend(situation_record(i) for i in range(5))
+        sink.append(situation_record(5, None))
+    rows = read_csv(path)
+    assert rows[0] == list(BTVA_SITUATION_SCHEMA)
+    assert len(rows) == 7
+    assert rows[1] == ['0', 'BORDA', 'LINEAR', 'BURYING', '1.5', '2.5', 'True']
+    assert math.isnan(float(rows[6][5])) and rows[6][6] == 'False'
+    assert sink.rows_written == 6
+
+
+def test_empty_sink_writes_the_header(tmp_path):
+    path = str(tmp_path / 'empty.csv')
+    ResultSink(path, BTVA_SITUATION_SCHEMA).close()
+    assert read_csv(path) == [list(BTVA_SITUATION_SCHEMA)]
+
+
+def test_closing_twice_keeps_the_records(tmp_path):
+    path = str(tmp_path / 'situations.csv')
+    with ResultSink(path, BTVA_SITUATION_SCHEMA) as sink:
+        sink.extend(situation_record(i) for i in range(3))
+        sink.close()
+    sink.close()
+    assert len(read_csv(path)) == 4
+    with pytest.raises(ValueError):
+        sink.append(situation_record(3))
+
+
+def test_values_are_not_coerced(tmp_path):
+    sink = ResultSink(str(tmp_path / 'simulations.csv'), ATVA4_SIMULATION_SCHEMA)
+    record = {'situation': 0, 'voting_scheme': 'BORDA', 'happiness_func': 'LINEAR', 'strategy_type': 'BURYING', 'max_coalition': 2, 'beneficial': 'False'}
+    with pytest.raises(TypeError):
+        sink.append(record)
+    with pytest.raises(TypeError):
+        sink.append(dict(record, beneficial=False, max_coalition=2.0))
+    sink.append(dict(record, beneficial=False))
+    sink.close()
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow'])
+def test_arrow_formats(tmp_path, extension):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+    path = str(tmp_path / ('situations' + extension))
+    with ResultSink(path, BTVA_SITUATION_SCHEMA, batch_size=2) as sink:
+        sink.extend(situation_record(i) for i in range(5))
+        sink.close()
+    table = pq.read_table(path) if extension == '.parquet' else ipc.open_file(path).read_all()
+    assert table.num_rows == 5
+    assert table.column('situation').to_pylist() == list(range(5))
+    assert table.schema.field('has_strategy').type == pa.bool_()
@@ -0,0 +1,38 @@
+import math
+from tva.models.BTVA import BTVA
+from tva.sampling import Proportion, Mean, Conditional, z_score
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+
+
+def test_zero_risk_converges():
+    # A single voter always elects their first preference, so nobody ever has a strategy
+    result = BTVA().analyse_adaptive(1, 4, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, risk_width=10.0,
+                                     batch_size=50, max_samples=2000, seed=1)
+    assert result['converged']
+    assert result['num_samples'] < 2000
+    assert result['risk'] == 0.0
+    assert result['strategic_happiness_interval'] == (-math.inf, math.inf)
+
+
+def test_adaptive_run_converges_with_strategies():
+    result = BTVA().analyse_adaptive(5, 4, VotingScheme.PLURALITY, HappinessFunc.LINEAR, StrategyType.COMPROMISING, risk_width=20.0,
+                                     happiness_rel_width=0.1, batch_size=50, max_samples=2000, seed=2)
+    assert result['converged']
+    assert 0.0 < result['risk'] < 100.0
+    low, high = result['strategic_happiness_interval']
+    assert high - low <= 0.1 * result['avg_strategic_happiness']
+
+
+def test_conditional_mean_waits_for_the_proportion():
+    z = z_score(0.95)
+    proportion, mean = Proportion(width=0.1), Mean(rel_width=0.01)
+    conditional = Conditional(mean, proportion)
+    proportion.add(False)
+    assert not conditional.converged(z)
+    for _ in range(100):
+        proportion.add(False)
+    assert conditional.converged(z)
+    # Once the mean has an interval it has to converge itself
+    mean.add(1.0)
+    mean.add(3.0)
+    assert not conditional.converged(z)
@@ -0,0 +1,56 @@
+import pytest
+from tva.situation import Situation
+from tva.schemes import Schemes
+from tva.profile import Profile, EMPTY, stack_profiles
+from tva.enums import VotingScheme
+
+
+def situations():
+    yield from Situation.generate(20, 7, 5, seed=11)
+    yield from Situation.generate(20, 6, 4, seed=12, info=0.3)
+    # Ties everywhere
+    yield Situation(4, 4, candidates=['A', 'B', 'C', 'D'], voters=[['D', 'C', 'B', 'A'], ['C', 'D', 'A', 'B'], ['B', 'A', 'D', 'C'], ['A', 'B', 'C', 'D']])
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_profile_scoring_matches_list_scoring(voting_scheme):
+    schemes = Schemes()
+    for situation in situations():
+        expected = schemes.apply_voting_scheme(voting_scheme, situation.voters, return_scores=True, return_ranking=True)
+        profile = Profile.from_voters(situation.voters, situation.candidates)
+        inputs = [profile, profile.compress()]
+        if profile.candidates == Profile(profile.ballots).candidates:
+            # A bare matrix is labelled A, B, ... by column
+            inputs.append(profile.ballots)
+        for voters in inputs:
+            ranking, scores = schemes.apply_voting_scheme(voting_scheme, voters, return_scores=True, return_ranking=True)
+            assert ranking == expected[0]
+            assert scores == {candidate: expected[1][candidate] for candidate in ranking}
+        assert schemes.apply_voting_scheme(voting_scheme, profile) == schemes.apply_voting_scheme(voting_scheme, situation.voters)
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_partial_ballots_match_list_scoring(voting_scheme):
+    # Bullet and truncated ballots change the Borda points of everyone and leave candidates out
+    preference_lists = [['B'], ['C', 'A'], ['A', 'B', 'C', 'D'], ['D', 'C', 'B', 'A'], ['C']]
+    situation = Situation(5, 4, candidates=['A', 'B', 'C', 'D'], voters=[['A', 'B', 'C', 'D']] * 5)
+    for voter_id, preferences in enumerate(preference_lists):
+        situation.set_preferences(voter_id, preferences)
+    schemes = Schemes()
+    expected = schemes.apply_voting_scheme(voting_scheme, situation.voters, return_scores=True, return_ranking=True)
+    assert schemes.apply_voting_scheme(voting_scheme, Profile.from_preferences(preference_lists), return_scores=True, return_ranking=True) == expected
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+@pytest.mark.parametrize('info', [None, 0.3])
+def test_batch_scoring_matches_per_profile_scoring(voting_scheme, info):
+    schemes = Schemes()
+    profiles = [situation.get_profile() for situation in Situation.generate(40, 6, 5, seed=13, info=info)]
+    ballots, candidates = stack_profiles(profiles)
+    winners, rankings, scores = schemes.apply_voting_scheme_batch(voting_scheme, ballots, candidates)
+    for profile, winner, ranking, profile_scores in zip(profiles, winners, rankings, scores):
+        expected_ranking, expected_scores = schemes.apply_voting_scheme(voting_scheme, profile, return_scores=True, return_ranking=True)
+        # Candidates on no ballot are padded with EMPTY at the end of the batch ranking
+        assert [candidates[c] for c in ranking if c != EMPTY] == expected_ranking
+        assert candidates[winner] == expected_ranking[0]
+        assert {candidates[c]: int(profile_scores[c]) for c in ranking if c != EMPTY} == expected_scores
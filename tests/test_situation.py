@@ -0,0 +1,99 @@
+from copy import deepcopy
+from tva.situation import Situation
+from tva.profile import Profile
+from tva.context import AnalysisContext
+from tva.models.BTVA import BTVA
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+
+
+def test_generated_situations_follow_changed_preferences():
+    situation = Situation.generate(1, 5, 4, seed=3, info=0.2)[0]
+    assert situation.get_profile() is situation.profile
+    ranking = situation.score_tally(VotingScheme.BORDA).evaluate()[1]
+    # Creating the voters does not change the profile
+    assert Profile.from_voters(situation.voters, situation.candidates).ballots.tolist() == situation.get_profile().ballots.tolist()
+    situation.set_preferences(0, ranking[::-1])
+    situation.set_preferences(1, ranking[::-1])
+    assert situation.get_profile().to_preferences()[:2] == [ranking[::-1]] * 2
+    assert situation.score_tally(VotingScheme.BORDA).evaluate() == Situation(5, 4, candidates=situation.candidates,
+                                                                               voters=[voter.preferences for voter in situation.voters]).score_tally(VotingScheme.BORDA).evaluate()
+
+
+def test_generated_profile_is_not_served_stale():
+    situation = Situation.generate(1, 4, 4, seed=4)[0]
+    # Voters changed before the situation was analysed (as the scripts do when building a situation by hand)
+    situation.voters[0].preferences = ['D', 'C', 'B', 'A']
+    assert situation.get_profile().to_preferences()[0] == ['D', 'C', 'B', 'A']
+    assert situation.get_profile() is situation.get_profile()
+
+
+def test_assigning_preferences_directly_drops_the_cache():
+    situation = Situation.generate(1, 5, 4, seed=3)[0]
+    assert situation.score_tally(VotingScheme.PLURALITY).evaluate()[2] == 'A'
+    situation.pivotal_voters(VotingScheme.PLURALITY, HappinessFunc.LINEAR)
+    AnalysisContext.of(situation).honest_outcome(VotingScheme.PLURALITY)
+    for voter in situation.voters:
+        voter.preferences = ['D', 'C', 'B', 'A']
+    assert situation.score_tally(VotingScheme.PLURALITY).evaluate()[2] == 'D'
+    assert AnalysisContext.of(situation).honest_outcome(VotingScheme.PLURALITY)[2] == 'D'
+    assert situation.calculate_happiness(HappinessFunc.LINEAR, VotingScheme.PLURALITY)[0] == 5.0
+    # Nobody can improve on their first preference
+    assert situation.pivotal_voters(VotingScheme.PLURALITY, HappinessFunc.LINEAR) == {}
+    # Copies belong to themselves
+    copied = deepcopy(situation)
+    copied.voters[0].preferences = ['A', 'B', 'C', 'D']
+    assert copied.voters[0].situation is copied
+    assert situation.voters[0].preferences == ['D', 'C', 'B', 'A']
+
+
+def test_overlays_follow_direct_assignments():
+    situation = Situation(3, 3, candidates=['A', 'B', 'C'], voters=[['A', 'B', 'C'], ['B', 'A', 'C'], ['C', 'B', 'A']])
+    overlay = situation.with_overrides({0: ['B', 'C', 'A']})
+    assert overlay.score_tally(VotingScheme.PLURALITY).evaluate()[2] == 'B'
+    # A change of the base reaches the overlay
+    situation.voters[1].preferences = ['C', 'A', 'B']
+    assert overlay.score_tally(VotingScheme.PLURALITY).evaluate()[2] == 'C'
+    assert overlay.get_profile().to_preferences() == [['B', 'C', 'A'], ['C', 'A', 'B'], ['C', 'B', 'A']]
+    # A change of an overridden voter stays in the overlay
+    overlay.voters[0].preferences = ['A', 'C', 'B']
+    assert overlay.overrides[0] == ['A', 'C', 'B']
+    assert overlay.score_tally(VotingScheme.BORDA).evaluate() == Situation(3, 3, candidates=['A', 'B', 'C'], voters=overlay.get_profile().to_preferences()).score_tally(VotingScheme.BORDA).evaluate()
+    assert situation.voters[0].preferences == ['A', 'B', 'C']
+
+
+def test_analysis_context_is_shared_until_preferences_change():
+    situation = Situation.generate(1, 5, 4, seed=5)[0]
+    context = AnalysisContext.of(situation)
+    assert AnalysisContext.of(situation) is context
+    outcome = context.honest_outcome(VotingScheme.BORDA)
+    assert context.honest_outcome(VotingScheme.BORDA) is outcome
+    calls = []
+    compute = lambda: calls.append(1) or {0: []}
+    context.improving_strategies(VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, compute)
+    AnalysisContext.of(situation).improving_strategies(VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, compute)
+    assert len(calls) == 1
+
+    situation.set_preferences(0, outcome[1][::-1])
+    rebuilt = AnalysisContext.of(situation)
+    assert rebuilt is not context
+    assert rebuilt.honest_outcome(VotingScheme.BORDA) == situation.score_tally(VotingScheme.BORDA).evaluate()
+    rebuilt.improving_strategies(VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, compute)
+    assert len(calls) == 2
+
+
+def test_repeated_analysis_reuses_the_context():
+    situation = Situation.generate(1, 6, 4, seed=7)[0]
+    btva = BTVA()
+    first = btva.analyse_single(situation, HappinessFunc.LINEAR, VotingScheme.BORDA, StrategyType.COMPROMISING)
+    assert first
+    searches = btva.strategy.cache_info()
+    assert searches['misses'] > 0
+    # The second analysis is answered by the context, without asking the strategy searches (or their cache) again
+    assert btva.analyse_single(situation, HappinessFunc.LINEAR, VotingScheme.BORDA, StrategyType.COMPROMISING) == first
+    assert btva.strategy.cache_info() == searches
+    # A changed situation is analysed again, like a fresh one
+    situation.set_preferences(0, situation.voters[0].preferences[::-1])
+    fresh = Situation(6, 4, candidates=situation.candidates, voters=[voter.preferences for voter in situation.voters])
+    second = btva.analyse_single(situation, HappinessFunc.LINEAR, VotingScheme.BORDA, StrategyType.COMPROMISING)
+    assert second != first
+    assert second == BTVA().analyse_single(fresh, HappinessFunc.LINEAR, VotingScheme.BORDA, StrategyType.COMPROMISING)
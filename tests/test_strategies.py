@@ -0,0 +1,270 @@
+from itertools import permutations
+from types import SimpleNamespace
+import pytest
+from tva.situation import Situation
+from tva.schemes import Schemes
+from tva.happiness import Happiness
+from tva.strategies import Strategies
+from tva.grid import ExperimentGrid
+from tva.enums import VotingScheme, HappinessFunc, StrategyType, HEURISTIC_STRATEGIES
+
+RANKED_FUNCS = [HappinessFunc.KENDALL_TAU, HappinessFunc.WEIGHTED_POSITIONAL]
+
+
+def test_best_response_is_opt_in():
+    assert StrategyType.BEST_RESPONSE not in HEURISTIC_STRATEGIES
+    assert ExperimentGrid(1, 5, 3).strategy_types == HEURISTIC_STRATEGIES
+    strategies = Strategies()
+    for situation in Situation.generate(10, 5, 4, seed=3):
+        for voter_index in range(5):
+            found = strategies.apply_all_strategies_to_voter(situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR, exhaustive_search=True)
+            assert set(found) <= set(HEURISTIC_STRATEGIES)
+            assert {strategy for strategy, _ in strategies.iter_all_strategies_to_voter(situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR)} <= set(HEURISTIC_STRATEGIES)
+    situation = Situation.generate(1, 5, 4, seed=3)[0]
+    found = strategies.apply_all_strategies_to_voter(situation, 0, VotingScheme.BORDA, HappinessFunc.LINEAR, strategy_types=[StrategyType.BEST_RESPONSE])
+    assert set(found) <= {StrategyType.BEST_RESPONSE}
+
+
+def recount_ranking(situation, voter_index, ballot, voting_scheme):
+    voters = [SimpleNamespace(preferences=ballot if voter.voter_id == voter_index else voter.preferences) for voter in situation.voters]
+    return Schemes().apply_voting_scheme(voting_scheme, voters, return_ranking=True)
+
+
+def sincere_happiness(situation, voter_index, ranking, happiness_func):
+    """Happiness of the outcome, always measured on the voter's sincere preferences."""
+    preferences = situation.voters[voter_index].preferences
+    if happiness_func in RANKED_FUNCS:
+        return Happiness().calculate_individual_ranked(preferences, ranking, happiness_func)
+    return Happiness().calculate_individual(preferences, ranking[0], happiness_func)
+
+
+def reference_bullet(situation, voter_index, voting_scheme, happiness_func):
+    """Drop the winner from the ballot until the ballot is empty, keeping every improving ballot."""
+    preferences = situation.voters[voter_index].preferences
+    ranking = recount_ranking(situation, voter_index, preferences, voting_scheme)
+    original = sincere_happiness(situation, voter_index, ranking, happiness_func)
+    if ranking[0] == preferences[0]:
+        return []
+    found, ballot = [], list(preferences)
+    while ballot and ranking[0] in ballot:
+        ballot.remove(ranking[0])
+        ranking = recount_ranking(situation, voter_index, ballot, voting_scheme)
+        if sincere_happiness(situation, voter_index, ranking, happiness_func) > original:
+            found.append(list(ballot))
+    return found
+
+
+def reference_bury(situation, voter_index, voting_scheme, happiness_func):
+    """The recursive burying search, recounting every ballot and keeping a copy of every improving one."""
+    preferences = situation.voters[voter_index].preferences
+    ranking = recount_ranking(situation, voter_index, preferences, voting_scheme)
+    original = sincere_happiness(situation, voter_index, ranking, happiness_func)
+    if ranking[0] == preferences[0]:
+        return []
+    found, visited = [], [preferences]
+
+    def search(ballot, winner):
+        ballot = list(ballot)
+        for i in range(ballot.index(winner) + 1, len(ballot)):
+            ballot[i - 1], ballot[i] = ballot[i], ballot[i - 1]
+            if ballot in visited:
+                continue
+            visited.append(list(ballot))
+            ranking = recount_ranking(situation, voter_index, ballot, voting_scheme)
+            if ranking[0] != winner:
+                if sincere_happiness(situation, voter_index, ranking, happiness_func) > original:
+                    found.append(list(ballot))
+                search(ballot, ranking[0])
+
+    search(preferences, ranking[0])
+    return found
+
+
+def reference_compromise(situation, voter_index, voting_scheme, happiness_func):
+    """Swap the candidates the voter prefers to the winner into first place, in the order of the election ranking."""
+    preferences = situation.voters[voter_index].preferences
+    ranking = recount_ranking(situation, voter_index, preferences, voting_scheme)
+    original, winner = sincere_happiness(situation, voter_index, ranking, happiness_func), ranking[0]
+    found, ballot = [], list(preferences)
+    for candidate in ranking[1:]:
+        i = preferences.index(candidate)
+        if i >= preferences.index(winner):
+            continue
+        ballot[0], ballot[i] = ballot[i], ballot[0]
+        new_ranking = recount_ranking(situation, voter_index, ballot, voting_scheme)
+        if new_ranking[0] != winner and sincere_happiness(situation, voter_index, new_ranking, happiness_func) > original:
+            found.append(list(ballot))
+    return found
+
+
+REFERENCES = {StrategyType.BULLET: reference_bullet, StrategyType.BURYING: reference_bury, StrategyType.COMPROMISING: reference_compromise}
+
+
+def search(strategies, strategy_type, situation, voter_index, voting_scheme, happiness_func, exhaustive_search):
+    if strategy_type == StrategyType.BULLET:
+        return strategies.bullet_vote(situation, voter_index, voting_scheme, happiness_func, exhaustive_search)
+    elif strategy_type == StrategyType.BURYING:
+        return strategies.bury(situation, voter_index, voting_scheme, happiness_func, exhaustive_search)
+    elif strategy_type == StrategyType.BEST_RESPONSE:
+        return strategies.best_response(situation, voter_index, voting_scheme, happiness_func, exhaustive_search)
+    return strategies.compromise(situation, voter_index, voting_scheme, happiness_func, exhaustive_search)
+
+
+@pytest.mark.parametrize('strategy_type', list(REFERENCES))
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_searches_match_a_full_recount_reference(strategy_type, voting_scheme):
+    strategies = Strategies()
+    for happiness_func in HappinessFunc:
+        for situation in Situation.generate(6, 5, 4, seed=[31, list(VotingScheme).index(voting_scheme)]):
+            for voter_index in range(5):
+                expected = REFERENCES[strategy_type](situation, voter_index, voting_scheme, happiness_func)
+                assert (search(strategies, strategy_type, situation, voter_index, voting_scheme, happiness_func, True) or []) == expected
+                # Without exhaustive search the first ballot is returned, also for burying
+                assert search(strategies, strategy_type, situation, voter_index, voting_scheme, happiness_func, False) == (expected[:1] or None)
+
+
+def test_exhaustive_ballots_are_separate_copies():
+    # Voter 0 can bury A behind several candidates, every found ballot used to be the same (last) list
+    situation = Situation.generate(1, 5, 4, seed=1)[0]
+    strategies = Strategies()
+    for strategy_type in REFERENCES:
+        for voter_index in range(5):
+            found = search(strategies, strategy_type, situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR, True) or []
+            assert len({id(ballot) for ballot in found}) == len(found)
+            assert all(ballot != situation.voters[voter_index].preferences for ballot in found)
+            for ballot in found:
+                ballot.reverse()
+            assert (search(strategies, strategy_type, situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR, True) or []) == [ballot[::-1] for ballot in found]
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_best_response_matches_brute_force(voting_scheme):
+    strategies = Strategies()
+    for happiness_func in HappinessFunc:
+        for situation in Situation.generate(4, 5, 4, seed=[41, list(VotingScheme).index(voting_scheme)]):
+            for voter_index in range(5):
+                preferences = situation.voters[voter_index].preferences
+                original = sincere_happiness(situation, voter_index, recount_ranking(situation, voter_index, preferences, voting_scheme), happiness_func)
+                # Happiness of every outcome a complete ranking can cause
+                outcomes = {}
+                for ballot in permutations(situation.candidates):
+                    ranking = recount_ranking(situation, voter_index, list(ballot), voting_scheme)
+                    outcome = tuple(ranking) if happiness_func in RANKED_FUNCS else ranking[0]
+                    outcomes[outcome] = sincere_happiness(situation, voter_index, ranking, happiness_func)
+                improving = {outcome for outcome, value in outcomes.items() if value > original}
+
+                best = strategies.best_response(situation, voter_index, voting_scheme, happiness_func)
+                if not improving:
+                    assert best is None
+                    continue
+                ranking = recount_ranking(situation, voter_index, best[0], voting_scheme)
+                assert sincere_happiness(situation, voter_index, ranking, happiness_func) == pytest.approx(max(outcomes.values()))
+                # One ballot per improving outcome
+                found = strategies.best_response(situation, voter_index, voting_scheme, happiness_func, True)
+                caused = [recount_ranking(situation, voter_index, ballot, voting_scheme) for ballot in found]
+                assert {tuple(ranking) if happiness_func in RANKED_FUNCS else ranking[0] for ranking in caused} == improving
+                assert len(found) == len(improving)
+
+
+@pytest.mark.parametrize('strategy_type', list(StrategyType))
+def test_cached_searches_match_uncached_searches(strategy_type):
+    cached, uncached = Strategies(), Strategies(cache_size=0)
+    # Small electorates repeat the same strategic problems, so most searches hit the cache
+    for situation in Situation.generate(40, 3, 3, seed=51):
+        for voting_scheme in VotingScheme:
+            for happiness_func in HappinessFunc:
+                for voter_index in range(3):
+                    args = (situation, voter_index, voting_scheme, happiness_func, strategy_type)
+                    expected = uncached.get_strategic_preferences_for_voter(*args, True)
+                    # First ballots, partial streams and complete answers in every order
+                    assert cached.get_strategic_preferences_for_voter(*args, False) == (expected[:1] if expected else None)
+                    assert next(cached.iter_strategic_preferences_for_voter(*args), None) == (expected[0] if expected else None)
+                    assert cached.get_strategic_preferences_for_voter(*args, True) == expected
+                    assert list(cached.iter_strategic_preferences_for_voter(*args)) == (expected or [])
+                    # Changing a returned ballot does not change the cached one
+                    for ballot in cached.get_strategic_preferences_for_voter(*args, True) or []:
+                        ballot.clear()
+                    assert cached.get_strategic_preferences_for_voter(*args, True) == expected
+    assert cached.cache_info()['hits'] > cached.cache_info()['misses'] > 0
+    assert uncached.cache_info() == {'hits': 0, 'misses': 0, 'size': 0, 'max_size': 0}
+
+
+def test_cache_is_bounded():
+    strategies = Strategies(cache_size=5)
+    for situation in Situation.generate(20, 5, 4, seed=52):
+        for voter_index in range(5):
+            strategies.get_strategic_preferences_for_voter(situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR, StrategyType.COMPROMISING, True)
+    assert strategies.cache_info()['size'] <= 5
+    strategies.clear_cache()
+    assert strategies.cache_info() == {'hits': 0, 'misses': 0, 'size': 0, 'max_size': 5}
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_pivotal_filter_only_skips_voters_without_strategies(voting_scheme):
+    strategies = Strategies(cache_size=0)
+    skipped = 0
+    for happiness_func in HappinessFunc:
+        for situation in Situation.generate(10, 6, 4, seed=[61, list(VotingScheme).index(voting_scheme)]):
+            pivotal = situation.pivotal_voters(voting_scheme, happiness_func)
+            for voter_index in range(6):
+                for strategy_type in StrategyType:
+                    # The public searches do not apply the filter
+                    expected = search(strategies, strategy_type, situation, voter_index, voting_scheme, happiness_func, True)
+                    assert strategies.get_strategic_preferences_for_voter(situation, voter_index, voting_scheme, happiness_func, strategy_type, True) == expected
+                    if voter_index not in pivotal:
+                        skipped += 1
+                        assert expected is None
+                    for ballot in expected or []:
+                        # Every ballot makes one of the voter's target candidates win
+                        assert recount_ranking(situation, voter_index, ballot, voting_scheme)[0] in pivotal[voter_index]
+    assert skipped > 0
+
+
+def is_subsequence(part, whole):
+    remaining = iter(whole)
+    return all(any(ballot == other for other in remaining) for ballot in part)
+
+
+def test_bury_budgets():
+    strategies = Strategies()
+    truncated = 0
+    for situation in Situation.generate(10, 7, 6, seed=71):
+        for voter_index in range(7):
+            args = (situation, voter_index, VotingScheme.BORDA, HappinessFunc.LINEAR, True)
+            full, stats = strategies.bury(*args, return_stats=True)
+            assert not stats['truncated']
+            assert strategies.bury(*args, max_nodes=10 ** 6, max_depth=10 ** 6) == full
+            # A node budget cuts the depth first search, keeping the ballots found before the cut
+            nodes = stats['nodes_expanded'] // 2
+            cut, cut_stats = strategies.bury(*args, max_nodes=nodes, return_stats=True)
+            assert cut_stats['nodes_expanded'] <= nodes
+            assert cut_stats['truncated'] == (stats['nodes_expanded'] > nodes)
+            assert (cut or []) == (full or [])[:len(cut or [])]
+            truncated += cut_stats['truncated']
+            # Without going deeper than the first winner change, only the first level of the search is left
+            shallow, shallow_stats = strategies.bury(*args, max_depth=1, return_stats=True)
+            assert shallow_stats['max_depth_reached'] <= 1
+            assert is_subsequence(shallow or [], full or [])
+    assert truncated > 0
+
+
+def test_exhaustive_bullet_keeps_found_ballots():
+    # Voter 1 ranks D, B, A, C: dropping A makes B win and dropping B then makes D win.
+    # The search ends on a winner the ballot no longer ranks, which used to throw the found ballots away
+    situation = Situation(5, 4, seed=1)
+    strategies = Strategies()
+    assert strategies.bullet_vote(situation, 1, VotingScheme.ANTI_PLURALITY, HappinessFunc.LINEAR, True) == [['D', 'B', 'C'], ['D', 'C']]
+    assert strategies.bullet_vote(situation, 1, VotingScheme.ANTI_PLURALITY, HappinessFunc.LINEAR) == [['D', 'B', 'C']]
+    assert strategies.bullet_vote(situation, 2, VotingScheme.VOTE_FOR_TWO, HappinessFunc.LINEAR, True) == [['A', 'C']]
+
+
+@pytest.mark.parametrize('strategy_type', list(StrategyType))
+def test_streamed_ballots_match_the_collected_searches(strategy_type):
+    strategies = Strategies(cache_size=0)
+    for situation in Situation.generate(10, 5, 4, seed=81):
+        for voter_index in range(5):
+            args = (situation, voter_index, VotingScheme.BORDA, HappinessFunc.EXP, strategy_type)
+            found = strategies.get_strategic_preferences_for_voter(*args, True)
+            assert list(strategies.iter_strategic_preferences_for_voter(*args)) == (found or [])
+            assert next(strategies.iter_strategic_preferences_for_voter(*args), None) == (found[0] if found else None)
+            assert strategies.get_strategic_preferences_for_voter(*args, False) == (found[:1] if found else None)
@@ -0,0 +1,86 @@
+import random
+from types import SimpleNamespace
+import pytest
+from tva.situation import Situation
+from tva.schemes import Schemes
+from tva.enums import VotingScheme
+
+
+def recount(situation, voting_scheme, overrides):
+    """Scores, ranking and winner of a full recount by the list based schemes, with some ballots replaced."""
+    voters = [SimpleNamespace(preferences=overrides.get(voter.voter_id, voter.preferences)) for voter in situation.voters]
+    ranking, scores = Schemes().apply_voting_scheme(voting_scheme, voters, return_scores=True, return_ranking=True)
+    return {candidate: scores[candidate] for candidate in ranking}, ranking, ranking[0]
+
+
+def random_overrides(situation, rng):
+    """Up to three replaced ballots, some of them truncated (which shifts the Borda points of every ballot)."""
+    overrides = {}
+    for voter_id in rng.sample(range(len(situation.voters)), rng.randint(1, 3)):
+        ballot = list(situation.candidates)
+        rng.shuffle(ballot)
+        overrides[voter_id] = ballot[:rng.randint(1, len(ballot))]
+    return overrides
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_overrides_match_a_full_recount(voting_scheme):
+    rng = random.Random(5)
+    for situation in Situation.generate(30, 6, 5, seed=21):
+        tally = situation.score_tally(voting_scheme)
+        assert tally.evaluate() == recount(situation, voting_scheme, {})
+        for _ in range(5):
+            overrides = random_overrides(situation, rng)
+            expected = recount(situation, voting_scheme, overrides)
+            assert tally.evaluate_with_overrides(overrides) == expected
+            # A derived tally continues from the overridden ballots
+            derived = tally.with_overrides(overrides)
+            assert derived.evaluate() == expected
+            more = random_overrides(situation, rng)
+            assert derived.evaluate_with_overrides(more) == recount(situation, voting_scheme, {**overrides, **more})
+            assert situation.with_overrides(overrides).score_tally(voting_scheme).evaluate() == expected
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_single_override_matches_a_full_recount(voting_scheme):
+    for situation in Situation.generate(10, 5, 4, seed=22):
+        tally = situation.score_tally(voting_scheme)
+        for voter in situation.voters:
+            for length in range(1, len(situation.candidates) + 1):
+                ballot = voter.preferences[::-1][:length]
+                assert tally.evaluate_with_override(voter.voter_id, ballot) == recount(situation, voting_scheme, {voter.voter_id: ballot})
+
+
+def test_tally_follows_set_preferences():
+    situation = Situation.generate(1, 5, 4, seed=23)[0]
+    before = situation.score_tally(VotingScheme.BORDA)
+    situation.set_preferences(2, ['D'])
+    assert situation.score_tally(VotingScheme.BORDA) is not before
+    assert situation.score_tally(VotingScheme.BORDA).evaluate() == recount(situation, VotingScheme.BORDA, {})
+
+
+@pytest.mark.parametrize('voting_scheme', list(VotingScheme))
+def test_summed_ballot_deltas_match_overrides(voting_scheme):
+    # ATVA1 scores a coalition from the sum of its members' deltas, unless the ballots shift the Borda points
+    rng = random.Random(6)
+    branches = set()
+    for situation in Situation.generate(30, 5, 4, seed=24):
+        # One long ballot among truncated ones, so truncating it shortens the longest ballot
+        for voter in situation.voters[1:]:
+            voter.preferences = voter.preferences[:rng.randint(1, 3)]
+        tally = situation.score_tally(voting_scheme)
+        for _ in range(5):
+            actions = random_overrides(situation, rng)
+            expected = tally.evaluate_with_overrides(actions)
+            assert expected == recount(situation, voting_scheme, actions)
+            shifts = tally.shifts_points(actions)
+            branches.add(shifts)
+            if shifts:
+                continue
+            score_delta, appearance_delta = 0, 0
+            for voter_id, ballot in actions.items():
+                delta = tally.ballot_delta(voter_id, ballot)
+                score_delta = score_delta + delta[0]
+                appearance_delta = appearance_delta + delta[1]
+            assert tally.evaluate_with_delta(score_delta, appearance_delta) == expected
+    assert branches == ({False, True} if voting_scheme == VotingScheme.BORDA else {False})
@@ -0,0 +1,52 @@
+import hashlib
+import json
+import os
+import tempfile
+from enum import Enum
+
+
+def config_hash(config:dict) -> str:
+    """Stable hash of a cell configuration (enums are hashed by value)."""
+    encoded = json.dumps(config, sort_keys=True, default=lambda value: value.value if isinstance(value, Enum) else str(value))
+    return hashlib.sha256(encoded.encode()).hexdigest()[:20]
+
+
+class CellStore:
+    """
+    Directory of completed experiment cells, one JSON file per cell named after the hash of its configuration
+    (including the seed, which is required: an unseeded cell draws different situations on every run). Every file is written to a temporary file first and renamed into place, so a crash
+    never leaves a half written cell behind and a restarted sweep only runs the cells that are missing.
+    """
+    def __init__(self, directory:str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __path(self, config:dict) -> str:
+        if config.get('seed') is None:
+            raise ValueError('A checkpointed cell needs a seed, otherwise a resumed run mixes results of different situations')
+        return os.path.join(self.directory, config_hash(config) + '.json')
+
+    def __contains__(self, config:dict) -> bool:
+        return os.path.exists(self.__path(config))
+
+    def get(self, config:dict):
+        """Result of a completed cell, or None."""
+        try:
+            with open(self.__path(config)) as file:
+                return json.load(file)['result']
+        except FileNotFoundError:
+            return None
+
+    def put(self, config:dict, result:dict):
+        """Store the result of a completed cell atomically."""
+        entry = json.dumps({'config': config, 'result': result}, default=lambda value: value.value if isinstance(value, Enum) else str(value))
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'w') as file:
+                file.write(entry)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self.__path(config))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
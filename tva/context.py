@@ -0,0 +1,42 @@
+from tva.enums import VotingScheme, HappinessFunc, StrategyType
+
+
+class AnalysisContext:
+    """
+    Memoized analysis of one situation, shared by every model stage that looks at it: the honest outcome per voting
+    scheme, the honest happiness per (voting scheme, happiness function) and the improving strategies per
+    (voting scheme, happiness function, strategy type).
+    The context lives in the situation's cache, so it is dropped together with the cache when preferences change
+    and copies of the situation start without one. Get it with AnalysisContext.of(situation).
+    """
+    def __init__(self, situation):
+        self.situation = situation
+        self.__outcomes = {}
+        self.__happiness = {}
+        self.__strategies = {}
+
+    @classmethod
+    def of(cls, situation) -> 'AnalysisContext':
+        """The analysis context of a situation, created on first use."""
+        return situation._cached('analysis_context', lambda: cls(situation))
+
+    def honest_outcome(self, voting_scheme:VotingScheme) -> tuple[dict[str, int], list[str], str]:
+        """Scores, ranking and winner of the honest election."""
+        if voting_scheme not in self.__outcomes:
+            self.__outcomes[voting_scheme] = self.situation.score_tally(voting_scheme).evaluate()
+        return self.__outcomes[voting_scheme]
+
+    def honest_happiness(self, voting_scheme:VotingScheme, happiness_func:HappinessFunc) -> tuple[float, dict[int, float]]:
+        """Total and individual happiness of the honest election."""
+        key = (voting_scheme, happiness_func)
+        if key not in self.__happiness:
+            _, ranking, _ = self.honest_outcome(voting_scheme)
+            self.__happiness[key] = self.situation.calculate_outcome_happiness(ranking, happiness_func)
+        return self.__happiness[key]
+
+    def improving_strategies(self, voting_scheme:VotingScheme, happiness_func:HappinessFunc, strategy_type:StrategyType, compute) -> dict:
+        """Memoize the improving strategies per voter of one strategy type, as computed by compute() (e.g. BTVA.analyse_single's search)."""
+        key = (voting_scheme, happiness_func, strategy_type)
+        if key not in self.__strategies:
+            self.__strategies[key] = compute()
+        return self.__strategies[key]
@@ -26,6 +26,11 @@ class StrategyType(Enum):
     COMPROMISING = 'COMPROMISING'
     BURYING = 'BURYING'
     BULLET = 'BULLET'
+    BEST_RESPONSE = 'BEST RESPONSE'
 
     def __str__(self):
-        return self.value
\ No newline at end of file
+        return self.value
+
+# The strategies used when "all strategies" are tried. BEST_RESPONSE is an exact (and more expensive) search that
+# subsumes them, so it is opt-in: pass it explicitly where it is wanted.
+HEURISTIC_STRATEGIES = [StrategyType.COMPROMISING, StrategyType.BURYING, StrategyType.BULLET]
\ No newline at end of file
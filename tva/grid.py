@@ -0,0 +1,138 @@
+from itertools import product
+from tqdm import tqdm
+from tva.situation import Situation
+from tva.checkpoint import CellStore
+from tva.schemes import Schemes
+from tva.profile import EMPTY, stack_profiles
+from tva.enums import VotingScheme, HappinessFunc, HEURISTIC_STRATEGIES
+
+
+class SharedBatch:
+    """
+    One batch of random situations shared by every cell of an experiment grid.
+    Honest rankings are scored for all voting schemes on one stacked ballot array, and honest happiness is
+    computed once per (voting scheme, happiness function). The situations keep their own caches (tallies,
+    happiness tables, pivotal voters) between cells, so every model fed from the batch reuses them.
+    """
+    def __init__(self, situations:list[Situation], num_voters:int, num_candidates:int):
+        self.situations = situations
+        self.num_voters = num_voters
+        self.num_candidates = num_candidates
+        self.schemes = Schemes()
+        self.__stacked = None
+        self.__rankings = {}
+        self.__happiness = {}
+        self.__derived = {}
+
+    def honest_rankings(self, voting_scheme:VotingScheme) -> list[list[str]]:
+        """Honest election ranking of every situation."""
+        if voting_scheme not in self.__rankings:
+            if self.__stacked is None:
+                self.__stacked = stack_profiles([situation.get_profile() for situation in self.situations])
+            ballots, candidates = self.__stacked
+            _, rankings, _ = self.schemes.apply_voting_scheme_batch(voting_scheme, ballots, candidates)
+            self.__rankings[voting_scheme] = [[candidates[c] for c in ranking if c != EMPTY] for ranking in rankings.tolist()]
+        return self.__rankings[voting_scheme]
+
+    def honest_happiness(self, voting_scheme:VotingScheme, happiness_func:HappinessFunc) -> list[tuple[float, dict[int, float]]]:
+        """Total and individual honest happiness of every situation."""
+        key = (voting_scheme, happiness_func)
+        if key not in self.__happiness:
+            self.__happiness[key] = [situation.calculate_outcome_happiness(ranking, happiness_func)
+                                     for situation, ranking in zip(self.situations, self.honest_rankings(voting_scheme))]
+        return self.__happiness[key]
+
+    def precompute(self, voting_schemes, happiness_funcs):
+        """Score all voting schemes and happiness functions in one pass over the batch."""
+        for voting_scheme in voting_schemes:
+            for happiness_func in happiness_funcs:
+                self.honest_happiness(voting_scheme, happiness_func)
+
+    def derive(self, key, compute):
+        """Memoize data a model derives from the batch (e.g. ATVA3's completed situations per voting scheme)."""
+        if key not in self.__derived:
+            self.__derived[key] = compute()
+        return self.__derived[key]
+
+
+class ExperimentGrid:
+    """
+    Declarative experiment grid: voter counts x candidate counts x voting schemes x happiness functions x strategies.
+    Without strategy_types the heuristic strategies are used, StrategyType.BEST_RESPONSE has to be asked for.
+    Every (num_voters, num_candidates) pair draws one batch of situations that all its cells share, so cells are
+    compared on common random numbers. With a seed the batch of (num_voters, num_candidates) is seeded with
+    (seed, num_voters, num_candidates) and does not depend on the rest of the grid.
+    """
+    def __init__(self, num_repetitions:int, num_voters, num_candidates, voting_schemes=None, happiness_funcs=None, strategy_types=None, seed=None, info=None):
+        self.num_repetitions = num_repetitions
+        self.voter_counts = [num_voters] if isinstance(num_voters, int) else list(num_voters)
+        self.candidate_counts = [num_candidates] if isinstance(num_candidates, int) else list(num_candidates)
+        self.voting_schemes = list(VotingScheme) if voting_schemes is None else list(voting_schemes)
+        self.happiness_funcs = list(HappinessFunc) if happiness_funcs is None else list(happiness_funcs)
+        self.strategy_types = list(HEURISTIC_STRATEGIES) if strategy_types is None else list(strategy_types)
+        self.seed = seed
+        self.info = info
+
+    def batches(self):
+        """Yields the shared batch of every (num_voters, num_candidates) pair."""
+        for num_voters, num_candidates in product(self.voter_counts, self.candidate_counts):
+            yield self.batch(num_voters, num_candidates)
+
+    def batch(self, num_voters:int, num_candidates:int) -> SharedBatch:
+        batch_seed = None if self.seed is None else [self.seed, num_voters, num_candidates]
+        situations = Situation.generate(self.num_repetitions, num_voters, num_candidates, seed=batch_seed, info=self.info)
+        return SharedBatch(situations, num_voters, num_candidates)
+
+    def cell_config(self, num_voters:int, num_candidates:int, voting_scheme, happiness_func, strategy_type, config=None) -> dict:
+        """Everything that determines the result of a cell, the key of its checkpoint."""
+        cell = {
+            'num_repetitions': self.num_repetitions,
+            'num_voters': num_voters,
+            'num_candidates': num_candidates,
+            'voting_scheme': voting_scheme,
+            'happiness_func': happiness_func,
+            'strategy_type': strategy_type,
+            'seed': self.seed,
+            'info': self.info
+        }
+        if config:
+            cell['config'] = config
+        return cell
+
+    def run(self, evaluate, verbose=False, checkpoint=None, config=None) -> list[dict]:
+        """
+        Call evaluate(batch, voting_scheme, happiness_func, strategy_type) for every cell and return one row per cell,
+        the cell's coordinates followed by the dict evaluate returned.
+        With a checkpoint directory every completed cell is stored there (see CellStore), keyed by the cell's
+        configuration, the seed and `config` (the model settings, e.g. a maximum coalition size). Cells found there are
+        not evaluated again and batches whose cells are all complete are not generated, so an interrupted sweep
+        resumes where it stopped and a grown grid only runs its new cells. The results must be JSON serializable.
+        Checkpointing needs a seeded grid, an unseeded one draws different situations on every run.
+        """
+        if checkpoint is not None and self.seed is None:
+            raise ValueError('Checkpointing needs a seeded grid, set ExperimentGrid(..., seed=...)')
+        store = None if checkpoint is None else CellStore(checkpoint)
+        rows = []
+        cells = list(product(self.voting_schemes, self.happiness_funcs, self.strategy_types))
+        for num_voters, num_candidates in product(self.voter_counts, self.candidate_counts):
+            configs = [self.cell_config(num_voters, num_candidates, *cell, config=config) for cell in cells]
+            done = [store.get(cell_config) if store is not None else None for cell_config in configs]
+            batch = None
+            if any(result is None for result in done):
+                batch = self.batch(num_voters, num_candidates)
+                batch.precompute(self.voting_schemes, self.happiness_funcs)
+            for (voting_scheme, happiness_func, strategy_type), cell_config, result in tqdm(zip(cells, configs, done), total=len(cells), disable=not verbose):
+                if result is None:
+                    result = evaluate(batch, voting_scheme, happiness_func, strategy_type)
+                    if store is not None:
+                        store.put(cell_config, result)
+                row = {
+                    'num_voters': num_voters,
+                    'num_candidates': num_candidates,
+                    'voting_scheme': voting_scheme,
+                    'happiness_func': happiness_func,
+                    'strategy_type': strategy_type
+                }
+                row.update(result)
+                rows.append(row)
+        return rows
@@ -0,0 +1,108 @@
+# Built-in profiling of the analysis hot paths. Counters (elections, situation copies, strategy probes, happiness
+# calls) are bumped inline behind an `if instrumentation.enabled:` check and coarse phases are timed with @timed,
+# so while disabled (the default) a counter costs one attribute check and a timed phase one extra call.
+import functools
+import inspect
+import json
+from time import perf_counter
+
+enabled = False
+counters: dict[str, int] = {}
+# Phase name -> [calls, seconds], nested phases are included in the time of the phases around them
+phases: dict[str, list] = {}
+_started = perf_counter()
+
+
+def enable():
+    """Start counting and timing, from zero."""
+    global enabled
+    reset()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    global _started
+    counters.clear()
+    phases.clear()
+    _started = perf_counter()
+
+
+def count(name:str, amount=1):
+    counters[name] = counters.get(name, 0) + amount
+
+
+def record(name:str, seconds:float):
+    phase = phases.setdefault(name, [0, 0.0])
+    phase[0] += 1
+    phase[1] += seconds
+
+
+def merge(other_counters:dict[str, int], other_phases:dict[str, list]):
+    """Add counters and phases recorded elsewhere (e.g. by a worker process)."""
+    for name, amount in other_counters.items():
+        count(name, amount)
+    for name, (calls, seconds) in other_phases.items():
+        phase = phases.setdefault(name, [0, 0.0])
+        phase[0] += calls
+        phase[1] += seconds
+
+
+def timed(name:str):
+    """Decorator recording the calls and wall time of a function (or of the iterations of a generator) as a phase."""
+    def decorate(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not enabled:
+                    return (yield from func(*args, **kwargs))
+                generator = func(*args, **kwargs)
+                elapsed = 0.0
+                try:
+                    while True:
+                        start = perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            elapsed += perf_counter() - start
+                        yield item
+                finally:
+                    generator.close()
+                    record(name, elapsed)
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def snapshot() -> dict:
+    """Counters, phase timings and election throughput since instrumentation was enabled or reset."""
+    wall_time = perf_counter() - _started
+    elections = counters.get('elections', 0)
+    return {
+        'enabled': enabled,
+        'wall_time': wall_time,
+        'counters': dict(counters),
+        'phases': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in sorted(phases.items())},
+        'elections_per_second': elections / wall_time if wall_time > 0 else 0.0
+    }
+
+
+def export_json(path:str):
+    with open(path, 'w') as file:
+        json.dump(snapshot(), file, indent=2)
@@ -1,10 +1,12 @@
 from concurrent.futures import ProcessPoolExecutor
-from copy import deepcopy
 from itertools import combinations
 from collections import defaultdict
 from tva.models.BTVA import BTVA
 from tva.situation import Situation
+from tva.context import AnalysisContext
+from tva.sampling import Proportion, sample_until_converged, z_score
 from tva.enums import HappinessFunc, VotingScheme, StrategyType
+from tva import instrumentation
 import tqdm
 
 class ATVA1(BTVA):
@@ -86,18 +88,28 @@ class ATVA1(BTVA):
         return coalitions
 
 
-    def collude(self, coalitions, rank, original_total_happiness, strategies, situation:Situation, voting_scheme:VotingScheme, happiness_func:HappinessFunc):
-       
+    @instrumentation.timed('ATVA1.collude')
+    def collude(self, coalitions, rank, original_total_happiness, strategies, situation:Situation, voting_scheme:VotingScheme, happiness_func:HappinessFunc,
+                evaluated=None):
+        """
+        First coalition (largest first) whose joint strategic ballots make every member at least as happy and one happier.
+        A coalition's election is the honest score vector plus the summed score deltas of its members' ballots, and the
+        happiness of an outcome is looked up per winner (per ranking for the ranked happiness functions).
+        `evaluated` memoizes the outcome per (aim, colluding voters), pass the same dict to share it between calls.
+        """
         #Sort the coalitions by the number of voters. e.g. ('A', (1,3,5)) has 3 voters with aim to have A win. Sorts it by most voters with aim.
         coalitions = sorted(coalitions, key=lambda x: -len(x[1]))
 
-        #best_coalition = None
-        #max_happiness_gain = float('-inf')
-        #coalition_results = []
+        tally = situation.score_tally(voting_scheme)
+        ranked = happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU
+        # (voter, ballot) -> score and appearance deltas, outcome -> total and individual happiness
+        deltas = {}
+        outcomes = {}
+        if evaluated is None:
+            evaluated = {}
         processed_coalitions=set()
 
         for aim, voters in coalitions:
-            temp_situation: Situation = deepcopy(situation)
             best_strategies = self.select_best_strategy(voters, strategies, rank, aim)
     
             # Filter out voters who don't have a strategy towards aim
@@ -109,16 +121,30 @@ class ATVA1(BTVA):
             processed_coalitions.add(voters)
             
             # IF we removed voters based on finding strategies, we must ensure there is more than one agent who can collude
-            if len(voters)>1:
-            # Change the preferences to the colluding preferences.
-                for voter in voters:
-                    temp_situation.voters[voter].preferences = best_strategies[voter]['strategy']
-                        
+            if len(voters)>1 and (aim, voters) in evaluated:
+                if evaluated[(aim, voters)]:
+                    return evaluated[(aim, voters)]
+            elif len(voters)>1:
+                # The colluding preferences
+                strategic_actions = {voter: best_strategies[voter]['strategy'] for voter in voters}
 
                 # Get new result
-                temp_election = self.schemes.apply_voting_scheme(voting_scheme, temp_situation.voters, return_ranking=True)
-                new_winner = temp_election[0]
-                temp_total_h, temp_individual_h, new_winner = temp_situation.calculate_happiness(situation.voters, happiness_func, voting_scheme, return_winner=True) # type: ignore
+                if tally.shifts_points(strategic_actions):
+                    _, temp_ranking, new_winner = tally.evaluate_with_overrides(strategic_actions)
+                else:
+                    score_delta, appearance_delta = 0, 0
+                    for voter, ballot in strategic_actions.items():
+                        key = (voter, tuple(ballot))
+                        if key not in deltas:
+                            deltas[key] = tally.ballot_delta(voter, ballot)
+                        score_delta = score_delta + deltas[key][0]
+                        appearance_delta = appearance_delta + deltas[key][1]
+                    _, temp_ranking, new_winner = tally.evaluate_with_delta(score_delta, appearance_delta)
+                # Happiness is measured against the honest preferences of the colluding voters
+                outcome = tuple(temp_ranking) if ranked else new_winner
+                if outcome not in outcomes:
+                    outcomes[outcome] = situation.calculate_outcome_happiness(temp_ranking, happiness_func)
+                temp_total_h, temp_individual_h = outcomes[outcome]
                 
                 # Get happiness gain sum among all colluding voters. We choose the biggest one.
                 happiness_gain = sum(temp_individual_h.get(voter, 0) - strategies[voter][0]['original_individual_happiness'] for voter in voters)
@@ -126,27 +152,22 @@ class ATVA1(BTVA):
                 happiness_valid = any(
                     temp_individual_h.get(voter, 0) > strategies[voter][0]['original_individual_happiness'] for voter in voters) and all(temp_individual_h.get(voter, 0) >= strategies[voter][0]['original_individual_happiness'] for voter in voters)
                 
-                # Compute happiness gain for each voter and store as a dictionary
-                individual_happiness_gain = {
-                    voter: temp_individual_h.get(voter, 0) - strategies[voter][0]['original_individual_happiness']
-                    for voter in voters
-                }
-                #list dictionary of colluding voters happiness after colluding
-                colluders_strategy_happiness = {
-                    voter: temp_individual_h.get(voter, 0) 
-                    for voter in voters
-                }
-                #list dictionary of original happiness of the colluding voters
-                colluders_original_happiness = {
-                    voter: strategies[voter][0]['original_individual_happiness']
-                    for voter in voters
-                }
-                strategic_actions = {
-                    voter: temp_situation.voters[voter].preferences
-                    for voter in voters
-                }
-                
                 if happiness_valid:
+                    # Compute happiness gain for each voter and store as a dictionary
+                    individual_happiness_gain = {
+                        voter: temp_individual_h.get(voter, 0) - strategies[voter][0]['original_individual_happiness']
+                        for voter in voters
+                    }
+                    #list dictionary of colluding voters happiness after colluding
+                    colluders_strategy_happiness = {
+                        voter: temp_individual_h.get(voter, 0) 
+                        for voter in voters
+                    }
+                    #list dictionary of original happiness of the colluding voters
+                    colluders_original_happiness = {
+                        voter: strategies[voter][0]['original_individual_happiness']
+                        for voter in voters
+                    }
                     coalition_info = {
                         'coalition': voters,
                         'original_winner': rank[0][0],
@@ -157,10 +178,12 @@ class ATVA1(BTVA):
                         'colluders_original_happiness': colluders_original_happiness,
                         'colluders_strategic_happiness': colluders_strategy_happiness,
                         'colluders_happiness_gain': individual_happiness_gain,
-                        'strategic_collusion_action' : strategic_actions
+                        'strategic_collusion_action' : {voter: list(ballot) for voter, ballot in strategic_actions.items()}
                     }
                 
+                    evaluated[(aim, voters)] = coalition_info
                     return coalition_info
+                evaluated[(aim, voters)] = False
 
         return False
 
@@ -181,40 +204,98 @@ class ATVA1(BTVA):
 
         return selected_strategies
 
-    def analyse_multiple_ATVA(self, situations,num_repititions, voting_scheme, happiness_func, max_collusion, verbose=False):
-  
-        counter = 0
-        happinessGain = 0
-
-        for situation in situations:
+    @instrumentation.timed('ATVA1.analyse_situation_ATVA')
+    def analyse_situation_ATVA(self, situation, voting_scheme, happiness_func, max_collusion):
+        """Whether a coalition can collude in the situation, and whether its collusion raises the total happiness."""
+        return self.analyse_situation_per_cap(situation, voting_scheme, happiness_func, [max_collusion])[max_collusion]
 
-            bullet=self.analyse_single(situation,happiness_func,voting_scheme,StrategyType.BULLET,False)
-            bury=self.analyse_single(situation,happiness_func,voting_scheme,StrategyType.BURYING,False)
-            comp=self.analyse_single(situation,happiness_func,voting_scheme,StrategyType.COMPROMISING,False)
-            
-            result = self.merge_strategies(bury=bury,bullets=bullet,comp=comp)
-            if result[0]:  # if there is more than one voter with strategic moves. Otherwise no collusion possible
-                merged_strats, stratVoters = result[1], result[2]  
-                total_h, individual_h, original_winner = situation.calculate_happiness(situation.voters, happiness_func, voting_scheme, return_winner=True) # type: ignore
-                original_rank = self.schemes.apply_voting_scheme(voting_scheme, situation.voters, True, True)
+    def analyse_situation_per_cap(self, situation, voting_scheme, happiness_func, max_collusion_values) -> dict[int, tuple[bool, bool]]:
+        """
+        analyse_situation_ATVA for several maximum coalition sizes at once. The strategies are searched and the coalitions
+        enumerated once (up to the largest size), every size then scans the coalitions it allows, sharing the evaluated ones.
+        Each size gets the result a separate analyse_situation_ATVA run would give.
+        """
+        results = {max_collusion: (False, False) for max_collusion in max_collusion_values}
+        bullet=self.analyse_single(situation,happiness_func,voting_scheme,StrategyType.BULLET,False)
+        bury=self.analyse_single(situation,happiness_func,voting_scheme,StrategyType.BURYING,False)
+        comp=self.analyse_single(situation,happiness_func,voting_scheme,StrategyType.COMPROMISING,False)
+        
+        result = self.merge_strategies(bury=bury,bullets=bullet,comp=comp)
+        if result[0]:  # if there is more than one voter with strategic moves. Otherwise no collusion possible
+            merged_strats, stratVoters = result[1], result[2]  
+            context = AnalysisContext.of(situation)
+            total_h, _ = context.honest_happiness(voting_scheme, happiness_func)
+            scores, ranking, original_winner = context.honest_outcome(voting_scheme)
+            original_rank = (ranking, scores)
 
-                groups = self.group_voters_by_preferences(situation.voters, merged_strats, stratVoters, original_winner)
-                coalitions = self.form_voter_pairs(groups, max_collusion)
+            groups = self.group_voters_by_preferences(situation.voters, merged_strats, stratVoters, original_winner)
+            coalitions = self.form_voter_pairs(groups, max(max_collusion_values))
 
-                collusion_stats=self.collude(coalitions, original_rank, total_h, merged_strats, situation, voting_scheme, happiness_func)
+            evaluated = {}
+            for max_collusion in max_collusion_values:
+                allowed = [coalition for coalition in coalitions if len(coalition[1]) <= max_collusion]
+                collusion_stats=self.collude(allowed, original_rank, total_h, merged_strats, situation, voting_scheme, happiness_func, evaluated)
             
                 if collusion_stats and isinstance(collusion_stats, dict):
-                    counter+=1
-                    if collusion_stats['new_total_happiness'] > total_h:
-                        happinessGain += 1
-                        
+                    results[max_collusion] = (True, collusion_stats['new_total_happiness'] > total_h)
+        return results
+
+    @instrumentation.timed('ATVA1.analyse_multiple_ATVA')
+    def analyse_multiple_ATVA(self, situations,num_repititions, voting_scheme, happiness_func, max_collusion, verbose=False, instrumentation_file=None):
+        return self.analyse_multiple_per_cap(situations, num_repititions, voting_scheme, happiness_func, [max_collusion], verbose, instrumentation_file)[max_collusion]
+
+    @instrumentation.timed('ATVA1.analyse_multiple_per_cap')
+    def analyse_multiple_per_cap(self, situations, num_repititions, voting_scheme, happiness_func, max_collusion_values, verbose=False, instrumentation_file=None):
+        """
+        analyse_multiple_ATVA for several maximum coalition sizes from one pass over the situations (see analyse_situation_per_cap).
+        Returns the risk and happiness improvement per maximum coalition size.
+        """
+        counter = {max_collusion: 0 for max_collusion in max_collusion_values}
+        happinessGain = {max_collusion: 0 for max_collusion in max_collusion_values}
+
+        for situation in tqdm.tqdm(situations, disable=not verbose):
+            for max_collusion, (colluded, gained) in self.analyse_situation_per_cap(situation, voting_scheme, happiness_func, max_collusion_values).items():
+                if colluded:
+                    counter[max_collusion]+=1
+                    if gained:
+                        happinessGain[max_collusion] += 1
                         
-        atva1_risk = (counter / (num_repititions)) * 100
-        happiness_improvement= (happinessGain/num_repititions)*100
+        if instrumentation_file is not None:
+            instrumentation.export_json(instrumentation_file)
+        return {
+            max_collusion: {
+                'atva1_risk': (counter[max_collusion] / (num_repititions)) * 100,
+                'happiness_improvement': (happinessGain[max_collusion]/num_repititions)*100
+            }
+            for max_collusion in max_collusion_values
+        }
+
+    @instrumentation.timed('ATVA1.analyse_adaptive_ATVA')
+    def analyse_adaptive_ATVA(self, num_voters, num_candidates, voting_scheme, happiness_func, max_collusion, risk_width=2.0, improvement_width=2.0,
+                              confidence=0.95, batch_size=100, max_samples=10000, seed=None, verbose=False):
+        """
+        Sequential version of analyse_multiple_ATVA: analyse random situations in batches until the Wilson intervals of the
+        risk and the happiness improvement are at most the given widths (percentage points), or `max_samples` situations were used.
+        """
+        risk = Proportion(None if risk_width is None else risk_width / 100)
+        improvement = Proportion(None if improvement_width is None else improvement_width / 100)
+
+        def analyse_batch(situations):
+            for situation in situations:
+                colluded, gained = self.analyse_situation_ATVA(situation, voting_scheme, happiness_func, max_collusion)
+                risk.add(colluded)
+                improvement.add(gained)
 
+        num_samples, converged = sample_until_converged(analyse_batch, [risk, improvement], num_voters, num_candidates, confidence,
+                                                        batch_size, max_samples, seed)
+        z = z_score(confidence)
         return {
-            'atva1_risk': atva1_risk,
-            'happiness_improvement': happiness_improvement
+            'atva1_risk': risk.estimate * 100,
+            'atva1_risk_interval': tuple(x * 100 for x in risk.interval(z)),
+            'happiness_improvement': improvement.estimate * 100,
+            'happiness_improvement_interval': tuple(x * 100 for x in improvement.interval(z)),
+            'num_samples': num_samples,
+            'converged': converged
         }
 
     def analyse_multiple_for_comparison(self, situations, voting_scheme, happiness_func, verbose=False):
@@ -1,6 +1,7 @@
-from copy import deepcopy
 from tva.situation import Situation
+from tva.context import AnalysisContext
 from tva.enums import HappinessFunc, VotingScheme, StrategyType
+from tva import instrumentation
 from tva.models.BTVA import BTVA
 import numpy as np
 
@@ -8,11 +9,12 @@ class ATVA2(BTVA):
     def __init__(self):
         BTVA.__init__(self)
 
+    @instrumentation.timed('ATVA2.analyse_single')
     def analyse_single(self, situation: Situation, happiness_func: HappinessFunc, voting_scheme: VotingScheme, strategy_type: StrategyType, verbose=False) -> dict[int, list[dict[str, float|int]]]:
         analysis = {}
         for voter in situation.voters[:1]:
             voter_index = voter.voter_id
-            original_total_happiness, original_individual_happiness= situation.calculate_happiness(situation.voters, happiness_func, voting_scheme) # type: ignore
+            original_total_happiness, original_individual_happiness = AnalysisContext.of(situation).honest_happiness(voting_scheme, happiness_func)
 
             strategic_preferences = self.strategy.apply_all_strategies_to_voter(situation,voter_index, voting_scheme, happiness_func, exhaustive_search=True, verbose=verbose)
         
@@ -21,9 +23,8 @@ class ATVA2(BTVA):
             for _, preference_list in strategic_preferences.items():
                 # For each set of preferences in the list, create a new situation
                 for preferences in preference_list:
-                    situation_copy = deepcopy(situation)
-                    situation_copy.voters[voter_index].preferences = preferences
-                    winner = self.schemes.apply_voting_scheme(voting_scheme, situation_copy.voters)
+                    situation_copy = situation.with_overrides({voter_index: preferences})
+                    winner = self.schemes.apply_voting_scheme(voting_scheme, situation_copy.get_profile())
                     # Check the strategic options of each of my opponents, select the ones that maximize their happiness 
                     # then, calculate my happiness after they have chosen their best strategy
                     all_other_voter_ids = [voter.voter_id for voter in situation_copy.voters if voter.voter_id != voter_index]
@@ -32,7 +33,8 @@ class ATVA2(BTVA):
                     for enemy_index in all_other_voter_ids:
                         enemy_situation = self.__find_situation_chosen_by_enemy(situation_copy, enemy_index, voting_scheme, happiness_func, verbose)
                         # Calculate my happiness after the enemy has chosen their best strategy
-                        strategic_total_happiness, strategic_individual_happiness= enemy_situation.calculate_happiness(situation.voters, happiness_func, voting_scheme) # type: ignore
+                        _, enemy_ranking, _ = enemy_situation.score_tally(voting_scheme).evaluate()
+                        strategic_total_happiness, strategic_individual_happiness= situation.calculate_outcome_happiness(enemy_ranking, happiness_func)
 
                         my_happiness = strategic_individual_happiness[voter_index]
                         my_happiness_list.append(my_happiness)
@@ -61,8 +63,7 @@ class ATVA2(BTVA):
         # Try all the strategies of the enemy voter
         for _, enemy_preference_list in enemy_strategies.items():
             for enemy_preferences in enemy_preference_list:
-                enemy_situation = deepcopy(situation)
-                enemy_situation.voters[enemy_index].preferences = enemy_preferences
+                enemy_situation = situation.with_overrides({enemy_index: enemy_preferences})
                 # Calculate the happiness of the enemy voter
                 enemy_happiness = float(enemy_situation.calculate_individual_happiness(enemy_preferences, happiness_func, voting_scheme)) # type: ignore
                 if enemy_happiness > best_enemy_happiness:
@@ -1,25 +1,28 @@
-from copy import deepcopy
 from tva.situation import Situation
 from tva.enums import HappinessFunc, VotingScheme, StrategyType
+from tva import instrumentation
 from tva.models.BTVA import BTVA
-import random
+import numpy as np
 
 class ATVA3(BTVA):
     def __init__(self):
         BTVA.__init__(self)
 
-    def monte_carlo_best_preferences(self, situation: Situation, voting_scheme: VotingScheme, num_simulations=1000, happiness_func=HappinessFunc.EXP):
+    @instrumentation.timed('ATVA3.monte_carlo_best_preferences')
+    def monte_carlo_best_preferences(self, situation: Situation, voting_scheme: VotingScheme, num_simulations=1000, happiness_func=HappinessFunc.EXP, seed=None):
+        """Complete the unknown preferences at random `num_simulations` times and keep the happiest completion. A seed (anything np.random.default_rng takes) makes the completion reproducible."""
+        rng = np.random.default_rng(seed)
         best_situation = None
         max_overall_happiness = -float('inf')
             
         for _ in range(num_simulations):
-            sim_situation = deepcopy(situation)
+            completed_preferences = {}
 
-            for voter in sim_situation.voters:
+            for voter in situation.voters:
                 if "?" in voter.preferences:
                     known_prefs = [c for c in voter.preferences if c != "?"]
-                    missing_candidates = [c for c in sim_situation.candidates if c not in known_prefs]
-                    random.shuffle(missing_candidates)
+                    missing_candidates = [c for c in situation.candidates if c not in known_prefs]
+                    rng.shuffle(missing_candidates)
                     
                     simulated = []
                     missing_iter = iter(missing_candidates)
@@ -29,14 +32,10 @@ class ATVA3(BTVA):
                         else:
                             simulated.append(entry)
                     simulated.extend(list(missing_iter))
-                    voter.preferences = simulated
+                    completed_preferences[voter.voter_id] = simulated
+            sim_situation = situation.with_overrides(completed_preferences)
                 
-            if happiness_func in (HappinessFunc.WEIGHTED_POSITIONAL, HappinessFunc.KENDALL_TAU):
-                election_ranking = self.schemes.apply_voting_scheme(voting_scheme, sim_situation.voters, return_ranking=True)
-                overall_happiness, _ = self.happiness.calculate_ranked(sim_situation.voters, election_ranking, happiness_func)
-            else:
-                winner = self.schemes.apply_voting_scheme(voting_scheme, sim_situation.voters)
-                overall_happiness, _ = self.happiness.calculate(sim_situation.voters, winner, happiness_func)
+            overall_happiness, _ = sim_situation.calculate_happiness(happiness_func, voting_scheme)
                 
             if overall_happiness > max_overall_happiness:
                 max_overall_happiness = overall_happiness
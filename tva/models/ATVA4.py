@@ -1,7 +1,10 @@
 from tva.models.BTVA import BTVA
 from tva.situation import Situation
+from tva.context import AnalysisContext
+from tva.results import encode_ballot, encode_mapping
+from tva.sampling import Proportion, Mean, sample_until_converged, z_score
 from tva.enums import VotingScheme, HappinessFunc, StrategyType
-from copy import deepcopy
+from tva import instrumentation
 import itertools
 from tqdm import tqdm
 import pandas as pd
@@ -34,22 +37,10 @@ class ATVA4(BTVA):
         Evaluate a specific combination of strategic voting preferences.
         Returns the outcome and happiness metrics if beneficial, None otherwise.
         """
-        test_situation = deepcopy(situation)
-        
-        # Apply the strategic preferences to test situation
-        for voter_id, prefs in voter_preferences:
-            test_situation.voters[voter_id].preferences = prefs
-            
-        # Calculate new outcome and happiness
-        if happiness_func in [HappinessFunc.KENDALL_TAU, HappinessFunc.WEIGHTED_POSITIONAL]:
-            new_ranking = self.schemes.apply_voting_scheme(voting_scheme, test_situation.voters, return_ranking=True)
-            new_winner = new_ranking[0]
-            new_total_happiness, new_individual_happiness = self.happiness.calculate_ranked(
-                situation.voters, new_ranking, happiness_func)
-        else:
-            new_winner = self.schemes.apply_voting_scheme(voting_scheme, test_situation.voters)
-            new_total_happiness, new_individual_happiness = self.happiness.calculate(
-                situation.voters, new_winner, happiness_func)
+        # Apply the strategic preferences on top of the honest tally, the situation itself is not copied
+        _, new_ranking, new_winner = situation.score_tally(voting_scheme).evaluate_with_overrides(dict(voter_preferences))
+        # Happiness is measured against the honest preferences
+        new_total_happiness, new_individual_happiness = situation.calculate_outcome_happiness(new_ranking, happiness_func)
             
         # Check if any strategic voter benefits
         strategic_voters = [voter_id for voter_id, _ in voter_preferences]
@@ -94,37 +85,26 @@ class ATVA4(BTVA):
                 strategic_prefs = prefs
                 break
         
-        test_solo = deepcopy(situation)
-        test_solo.voters[voter_id].preferences = strategic_prefs
-        
-        if happiness_func in [HappinessFunc.KENDALL_TAU, HappinessFunc.WEIGHTED_POSITIONAL]:
-            new_ranking = self.schemes.apply_voting_scheme(voting_scheme, test_solo.voters, return_ranking=True)
-            new_total_happiness, new_individual_happiness = self.happiness.calculate_ranked(
-                situation.voters, new_ranking, happiness_func)
-        else:
-            new_winner = self.schemes.apply_voting_scheme(voting_scheme, test_solo.voters)
-            new_total_happiness, new_individual_happiness = self.happiness.calculate(
-                situation.voters, new_winner, happiness_func)
+        _, new_ranking, _ = situation.score_tally(voting_scheme).evaluate_with_override(voter_id, strategic_prefs)
+        new_total_happiness, new_individual_happiness = situation.calculate_outcome_happiness(new_ranking, happiness_func)
         
         old_happiness = honest_individual_happiness[voter_id]
         new_happiness = new_individual_happiness[voter_id]
         
         return new_happiness > old_happiness
 
-    def analyse(self, situation, happiness_func, voting_scheme, strategy_type, verbose=False):
+    @instrumentation.timed('ATVA4.analyse')
+    def analyse(self, situation, happiness_func, voting_scheme, strategy_type, verbose=False, sink=None, situation_id=0, keep_opportunities=True):
         """
         Analyze a situation considering multiple simultaneous strategic voters.
         Returns detailed analysis of strategic voting opportunities.
+        With a sink (a ResultSink with ATVA4_OPPORTUNITY_SCHEMA) every opportunity is written as soon as it is found.
+        With keep_opportunities=False only their count, largest coalition and best total happiness are returned,
+        so memory does not grow with the number of combinations.
         """
-        if happiness_func in [HappinessFunc.KENDALL_TAU, HappinessFunc.WEIGHTED_POSITIONAL]:
-            honest_ranking = self.schemes.apply_voting_scheme(voting_scheme, situation.voters, return_ranking=True)
-            honest_winner = honest_ranking[0]
-            honest_total_happiness, honest_individual_happiness = self.happiness.calculate_ranked(
-                situation.voters, honest_ranking, happiness_func)
-        else:
-            honest_winner = self.schemes.apply_voting_scheme(voting_scheme, situation.voters)
-            honest_total_happiness, honest_individual_happiness = self.happiness.calculate(
-                situation.voters, honest_winner, happiness_func)
+        context = AnalysisContext.of(situation)
+        _, _, honest_winner = context.honest_outcome(voting_scheme)
+        honest_total_happiness, honest_individual_happiness = context.honest_happiness(voting_scheme, happiness_func)
 
         if verbose:
             print(f"\nHonest outcome analysis:")
@@ -145,6 +125,46 @@ class ATVA4(BTVA):
                 individual_opportunities.append(voter_index)
 
         multi_voter_opportunities = []
+        num_multi_voter_opportunities = 0
+        max_coalition_size = 0
+        best_new_total_happiness = None
+        for result in self.iter_multi_voter_opportunities(situation, all_voter_strategic_options, voting_scheme, happiness_func,
+                                                          honest_winner, honest_individual_happiness):
+            num_multi_voter_opportunities += 1
+            max_coalition_size = max(max_coalition_size, len(result['voter_ids']))
+            if best_new_total_happiness is None or result['new_total_happiness'] > best_new_total_happiness:
+                best_new_total_happiness = result['new_total_happiness']
+            if sink is not None:
+                sink.append(self.opportunity_record(result, situation_id, voting_scheme, happiness_func, strategy_type))
+            if keep_opportunities:
+                multi_voter_opportunities.append(result)
+
+        has_individual = len(individual_opportunities) > 0
+        has_multi_voter = num_multi_voter_opportunities > 0
+
+        if verbose:
+            self._print_analysis_results(
+                has_individual, has_multi_voter,
+                individual_opportunities, multi_voter_opportunities,
+                honest_winner, honest_total_happiness
+            )
+
+        return {
+            'has_individual_strategic': has_individual,
+            'has_multi_voter_strategic': has_multi_voter,
+            'individual_opportunities': individual_opportunities,
+            'multi_voter_opportunities': multi_voter_opportunities,
+            'num_multi_voter_opportunities': num_multi_voter_opportunities,
+            'max_coalition_size': max_coalition_size,
+            'best_new_total_happiness': best_new_total_happiness,
+            'honest_winner': honest_winner,
+            'honest_total_happiness': honest_total_happiness,
+            'honest_individual_happiness': dict(honest_individual_happiness)
+        }
+
+    def iter_multi_voter_opportunities(self, situation, all_voter_strategic_options, voting_scheme, happiness_func,
+                                       honest_winner, honest_individual_happiness):
+        """Yields the beneficial combinations of strategic ballots of two or more voters one at a time."""
         for num_strategic_voters in range(2, min(self.max_strategic_voters + 1, len(situation.voters) + 1)):
             for voter_subset in itertools.combinations(range(len(situation.voters)), num_strategic_voters):
                 if not any(v in all_voter_strategic_options for v in voter_subset):
@@ -161,26 +181,24 @@ class ATVA4(BTVA):
                         honest_winner, honest_individual_happiness
                     )
                     if result:
-                        multi_voter_opportunities.append(result)
-
-        has_individual = len(individual_opportunities) > 0
-        has_multi_voter = len(multi_voter_opportunities) > 0
-
-        if verbose:
-            self._print_analysis_results(
-                has_individual, has_multi_voter,
-                individual_opportunities, multi_voter_opportunities,
-                honest_winner, honest_total_happiness
-            )
+                        yield result
 
+    @staticmethod
+    def opportunity_record(opportunity, situation_id, voting_scheme, happiness_func, strategy_type):
+        """Flat record of a multi voter opportunity (ATVA4_OPPORTUNITY_SCHEMA)."""
         return {
-            'has_individual_strategic': has_individual,
-            'has_multi_voter_strategic': has_multi_voter,
-            'individual_opportunities': individual_opportunities,
-            'multi_voter_opportunities': multi_voter_opportunities,
-            'honest_winner': honest_winner,
-            'honest_total_happiness': honest_total_happiness,
-            'honest_individual_happiness': honest_individual_happiness
+            'situation': situation_id,
+            'voting_scheme': voting_scheme.value,
+            'happiness_func': happiness_func.value,
+            'strategy_type': strategy_type.value,
+            'voter_ids': ','.join(map(str, opportunity['voter_ids'])),
+            'num_voters': opportunity['num_voters'],
+            'new_winner': opportunity['new_winner'],
+            'new_total_happiness': opportunity['new_total_happiness'],
+            'total_happiness_change': opportunity['total_happiness_change'],
+            'collective_action_required': opportunity['collective_action_required'],
+            'strategic_preferences': encode_mapping(opportunity['strategic_preferences'], encode_ballot),
+            'individual_gains': encode_mapping(opportunity['individual_gains'])
         }
 
     def _print_analysis_results(self, has_individual, has_multi_voter, 
@@ -201,7 +219,9 @@ class ATVA4(BTVA):
                     print(f"  Voter {voter_id}: {gain:+.3f}")
                 print(f"Total happiness change: {opp['total_happiness_change']:+.3f}")
 
-    def analyse_multiple(self, num_repetitions, num_voters, num_candidates, voting_scheme, happiness_func, strategy_type, verbose=False):
+    @instrumentation.timed('ATVA4.analyse_multiple')
+    def analyse_multiple(self, num_repetitions, num_voters, num_candidates, voting_scheme, happiness_func, strategy_type, verbose=False, situations=None,
+                         sink=None, opportunity_sink=None, instrumentation_file=None):
         """
         Run multiple analyses to determine ATVA4 risk and happiness improvement.
         
@@ -212,26 +232,32 @@ class ATVA4(BTVA):
         
         And we compute the happiness improvement rate as the percentage of simulations
         where the best strategic total happiness exceeds the honest total happiness.
+        The simulations use `situations` when given (e.g. a SharedBatch), otherwise fresh random situations.
+        Per simulation records (ATVA4_SIMULATION_SCHEMA) go to `sink` and opportunities to `opportunity_sink` as they are found.
+        With an instrumentation_file the instrumentation snapshot is written there as JSON at the end.
         """
         total_coalition_sum = 0
         beneficial_simulations = 0
         
-        for _ in tqdm(range(num_repetitions), disable=not verbose):
-            situation = Situation(num_voters=num_voters, num_candidates=num_candidates)
-            result = self.analyse(situation, happiness_func, voting_scheme, strategy_type, verbose=False)
-            
-            if result['has_multi_voter_strategic']:
-                max_coalition = max(len(opp['voter_ids']) for opp in result['multi_voter_opportunities'])
-            elif result['has_individual_strategic']:
-                max_coalition = 1
-            else:
-                max_coalition = 0
+        if situations is None:
+            situations = Situation.generate(num_repetitions, num_voters, num_candidates)
+        for situation_id, situation in enumerate(tqdm(situations, disable=not verbose)):
+            max_coalition, beneficial = self.simulation_outcome(situation, voting_scheme, happiness_func, strategy_type, opportunity_sink, situation_id)
+            if sink is not None:
+                sink.append({
+                    'situation': situation_id,
+                    'voting_scheme': voting_scheme.value,
+                    'happiness_func': happiness_func.value,
+                    'strategy_type': strategy_type.value,
+                    'max_coalition': max_coalition,
+                    'beneficial': beneficial
+                })
             total_coalition_sum += max_coalition
-            
-            best_strategic_total = max((opp['new_total_happiness'] for opp in result['multi_voter_opportunities']), default=result['honest_total_happiness'])
-            if best_strategic_total > result['honest_total_happiness']:
+            if beneficial:
                 beneficial_simulations += 1
                 
+        if instrumentation_file is not None:
+            instrumentation.export_json(instrumentation_file)
         atva4_risk = (total_coalition_sum / (num_repetitions * num_voters)) * 100
         happiness_improvement_rate = (beneficial_simulations / num_repetitions) * 100
         
@@ -239,3 +265,48 @@ class ATVA4(BTVA):
             'atva4_risk': atva4_risk,
             'happiness_improvement_rate': happiness_improvement_rate
         }
+
+    def simulation_outcome(self, situation, voting_scheme, happiness_func, strategy_type, sink=None, situation_id=0):
+        """Largest number of voters with a beneficial strategic option, and whether strategic voting raises the total happiness."""
+        result = self.analyse(situation, happiness_func, voting_scheme, strategy_type, verbose=False,
+                              sink=sink, situation_id=situation_id, keep_opportunities=False)
+        
+        if result['has_multi_voter_strategic']:
+            max_coalition = result['max_coalition_size']
+        elif result['has_individual_strategic']:
+            max_coalition = 1
+        else:
+            max_coalition = 0
+        
+        if result['best_new_total_happiness'] is None:
+            return max_coalition, False
+        return max_coalition, result['best_new_total_happiness'] > result['honest_total_happiness']
+
+    @instrumentation.timed('ATVA4.analyse_adaptive')
+    def analyse_adaptive(self, num_voters, num_candidates, voting_scheme, happiness_func, strategy_type, risk_width=2.0, improvement_width=2.0,
+                         confidence=0.95, batch_size=100, max_samples=10000, seed=None, verbose=False):
+        """
+        Sequential version of analyse_multiple: simulate in batches until the CLT interval of the ATVA4 risk (a mean of
+        coalition shares) and the Wilson interval of the happiness improvement rate are at most the given widths
+        (percentage points), or `max_samples` simulations were used.
+        """
+        risk = Mean(width=None if risk_width is None else risk_width / 100)
+        improvement = Proportion(None if improvement_width is None else improvement_width / 100)
+
+        def analyse_batch(situations):
+            for situation in tqdm(situations, disable=not verbose):
+                max_coalition, beneficial = self.simulation_outcome(situation, voting_scheme, happiness_func, strategy_type)
+                risk.add(max_coalition / num_voters)
+                improvement.add(beneficial)
+
+        num_samples, converged = sample_until_converged(analyse_batch, [risk, improvement], num_voters, num_candidates, confidence,
+                                                        batch_size, max_samples, seed)
+        z = z_score(confidence)
+        return {
+            'atva4_risk': risk.estimate * 100,
+            'atva4_risk_interval': tuple(x * 100 for x in risk.interval(z)),
+            'happiness_improvement_rate': improvement.estimate * 100,
+            'happiness_improvement_rate_interval': tuple(x * 100 for x in improvement.interval(z)),
+            'num_samples': num_samples,
+            'converged': converged
+        }
@@ -1,8 +1,15 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
 from tva.situation import Situation
 from tva.happiness import Happiness
 from tva.schemes import Schemes
 from tva.strategies import Strategies
+from tva.context import AnalysisContext
+from tva.profile import EMPTY, stack_profiles
+from tva.results import encode_ballot
+from tva.sampling import Proportion, Mean, Conditional, sample_until_converged, z_score
 from tva.enums import HappinessFunc, VotingScheme, StrategyType
+from tva import instrumentation
 from tqdm import tqdm
 
 
@@ -25,9 +32,16 @@ class BTVA:
                 print(f"    - Original Total Happiness: {strategy['original_total_happiness']:.3f}")
                 print("  ")
 
-    def analyse_single(self, situation:Situation, happiness_func: HappinessFunc, voting_scheme: VotingScheme, strategy_type: StrategyType, verbose=False) -> dict[int, list[dict[str, float|int]]]:
-        output_dict = {}
-        total_h, individual_h, original_winner = situation.calculate_happiness(happiness_func, voting_scheme, return_winner=True) # type: ignore
+    @instrumentation.timed('BTVA.analyse_single')
+    def analyse_single(self, situation:Situation, happiness_func: HappinessFunc, voting_scheme: VotingScheme, strategy_type: StrategyType, verbose=False,
+                       sink=None, situation_id=0) -> dict[int, list[dict[str, float|int]]]:
+        """
+        Strategies that make a voter happier, per voter. With a sink (BTVA_STRATEGY_SCHEMA) every strategy is also written as a record.
+        The honest outcome and the strategies are memoized in the situation's AnalysisContext, so analysing the same
+        situation again (e.g. by another model stage) does not repeat the search.
+        """
+        context = AnalysisContext.of(situation)
+        total_h, individual_h = context.honest_happiness(voting_scheme, happiness_func)
         
         if verbose:
             print(f'{situation.get_num_candidates()} Candidates, {situation.get_num_voters()} Voters')
@@ -35,85 +49,229 @@ class BTVA:
             print('Strategy Type: ', strategy_type)
             print('Happiness Function: ', happiness_func)
             situation.print_preference_matrix()
-            print(f'Original winner: {original_winner}')
+            print(f'Original winner: {context.honest_outcome(voting_scheme)[2]}')
             print(f'Total happiness: {total_h:.3f}')
             print('Individual happiness')
             print(" | ".join(f'Voter {k}: {h}' for k, h in individual_h.items()))
 
+        output_dict = context.improving_strategies(voting_scheme, happiness_func, strategy_type,
+                                                   lambda: self.__improving_strategies(situation, happiness_func, voting_scheme, strategy_type, total_h, individual_h))
+        if sink is not None:
+            for voter_id, s_i in output_dict.items():
+                for s_ij in s_i:
+                    sink.append(dict(s_ij, strategy=encode_ballot(s_ij['strategy']), situation=situation_id, voter_id=voter_id,
+                                     voting_scheme=voting_scheme.value, happiness_func=happiness_func.value, strategy_type=strategy_type.value))
+        if verbose: self.display_strategic_data(output_dict)
+        # The lists of the memoized result stay untouched whatever the caller does with the returned ones
+        return {voter_id: list(s_i) for voter_id, s_i in output_dict.items()}
+
+    def __improving_strategies(self, situation:Situation, happiness_func, voting_scheme, strategy_type, total_h, individual_h):
+        output_dict = {}
         # ANALYSE STRATEGIC SITUATIONS HERE AND RETURN THE DATA IN THE OUTPUT_DICT
         strategic_situations = self.strategy.get_strategic_preferences_for_all_voters(situation, voting_scheme, happiness_func, strategy_type, exhaustive_search=False)
-        print(strategic_situations)
-        if len(strategic_situations) != 0:
-            for voter_id, strategic_situation in strategic_situations.items():
-                s_i = []
-                for strat in strategic_situation:
-                    temp_total_h, temp_individual_h, temp_winner = strat.calculate_happiness(happiness_func, voting_scheme, return_winner=True) # type: ignore
-
-                    # Choose only the strategies that increase a voters individual happiness
-                    if temp_individual_h[voter_id] > individual_h[voter_id]:
-                        s_ij = {
-                                'strategy': strat.voters[voter_id].preferences,
-                                'strategic_winner': temp_winner,
-                                'strategic_individual_happiness': temp_individual_h[voter_id],
-                                'original_individual_happiness': individual_h[voter_id],
-                                'strategic_total_happiness': temp_total_h,
-                                'original_total_happiness': total_h}
-                        if s_ij: s_i.append(s_ij)
-
-                output_dict[voter_id] = s_i
-            if verbose: self.display_strategic_data(output_dict)
-        else:
-            return {}
+        for voter_id, strategic_situation in strategic_situations.items():
+            s_i = []
+            for strat in strategic_situation:
+                temp_total_h, temp_individual_h, temp_winner = strat.calculate_happiness(happiness_func, voting_scheme, return_winner=True) # type: ignore
 
+                # Choose only the strategies that increase a voters individual happiness
+                if temp_individual_h[voter_id] > individual_h[voter_id]:
+                    s_i.append({
+                        'strategy': strat.voters[voter_id].preferences,
+                        'strategic_winner': temp_winner,
+                        'strategic_individual_happiness': temp_individual_h[voter_id],
+                        'original_individual_happiness': individual_h[voter_id],
+                        'strategic_total_happiness': temp_total_h,
+                        'original_total_happiness': total_h})
+
+            output_dict[voter_id] = s_i
         return output_dict
 
-    def analyse_multiple(self, situations:list[Situation], voting_scheme, happiness_func, strategy_type, return_avg_happiness=False, verbose=False):
-        print(len(situations), 'Repetitions')
-        print(f'{situations[0].get_num_candidates()} Candidates, {situations[0].get_num_voters()} Voters')
-        print('Voting Scheme: ', voting_scheme)
-        print('Strategy Type: ', strategy_type)
-        print('Happiness Function: ', happiness_func)
-        print('Analysing experiment...')
+    @instrumentation.timed('BTVA.honest_rankings')
+    def honest_rankings(self, situations:list[Situation], voting_scheme:VotingScheme) -> list[list[str]]:
+        """Honest election rankings of many situations, scored together in one batched pass."""
+        profiles = [situation.get_profile() for situation in situations]
+        if len({profile.get_num_voters() for profile in profiles}) > 1:
+            return [self.schemes.apply_voting_scheme(voting_scheme, profile, return_ranking=True) for profile in profiles]
+        ballots, candidates = stack_profiles(profiles)
+        _, rankings, _ = self.schemes.apply_voting_scheme_batch(voting_scheme, ballots, candidates)
+        return [[candidates[c] for c in ranking if c != EMPTY] for ranking in rankings.tolist()]
+
+    @instrumentation.timed('BTVA.analyse_situation')
+    def analyse_situation(self, situation:Situation, honest_ranking:list[str], voting_scheme, happiness_func, strategy_type, verbose=False, honest_happiness=None) -> tuple[float, float | None]:
+        """
+        Honest total happiness of one situation, and the total happiness after the first voter with a strategy uses it (None if nobody has one).
+        `honest_happiness` is the (total, individual) honest happiness if it is already known.
+        """
+        # Check if at least one voter has a good strategy
+        strategic_winner = None
+        strategic_h = None
+        strategic_indiv_h = None
+        honest_winner = honest_ranking[0]
+        if honest_happiness is None:
+            honest_happiness = situation.calculate_outcome_happiness(honest_ranking, happiness_func)
+        honest_h, honest_indiv_h = honest_happiness
+        # The strategy searches skip the voters that cannot overturn the winner's margin (see Situation.pivotal_voters)
+        for voter_index in range(situation.get_num_voters()):
+            # The first improving ballot is enough, so the search stops as soon as it is found
+            strategic_preferences = next(self.strategy.iter_strategic_preferences_for_voter(situation, voter_index, voting_scheme, happiness_func, strategy_type, verbose), None)
+            if strategic_preferences is not None:
+                strategic_situation = situation.with_overrides({voter_index: strategic_preferences})
+                # Calculate happiness level for each voter
+                strategic_h, strategic_indiv_h, strategic_winner = strategic_situation.calculate_happiness(happiness_func, voting_scheme, return_winner=True)  # type: ignore
+                break
+
+        if verbose:
+            print(f"Honest winner: {honest_winner}")
+            if strategic_winner: print(f"Strategic Winner: {strategic_winner}")
+            print(f"Honest overall happiness: {honest_h:.3f}")
+            if strategic_h: print(f"Strategic overall happiness: {strategic_h:.3f}")
+            print('Honest individual happiness:')
+            print(" | ".join(f'Voter {k}: {h}' for k, h in honest_indiv_h.items()))
+            if strategic_indiv_h:
+                print('Strategic individual happiness:')
+                print(" | ".join(f'Voter {k}: {h}' for k, h in strategic_indiv_h.items()))
+        return honest_h, strategic_h
+
+    @instrumentation.timed('BTVA.analyse_multiple')
+    def analyse_multiple(self, situations:list[Situation], voting_scheme, happiness_func, strategy_type, return_avg_happiness=False, verbose=False, workers=None, chunk_size=None,
+                         honest_rankings=None, honest_happiness=None, sink=None, instrumentation_file=None, progress=False):
+        """
+        Share of situations (in percent) in which some voter has a strategy, optionally with the average strategic and honest happiness.
+        Honest rankings and happiness that were already computed (e.g. by a SharedBatch) can be passed in.
+        With a sink (BTVA_SITUATION_SCHEMA) the outcome of every situation is written as a record.
+        With an instrumentation_file the instrumentation snapshot is written there as JSON at the end (see tva.instrumentation).
+        With workers > 1 the situations are analysed in chunks by a process pool. The per situation results come back
+        in order and are added up exactly as in the serial loop, so the results are identical.
+        With progress a progress bar (tqdm) follows the situations or chunks.
+        """
+        if verbose:
+            print(len(situations), 'Repetitions')
+            print(f'{situations[0].get_num_candidates()} Candidates, {situations[0].get_num_voters()} Voters')
+            print('Voting Scheme: ', voting_scheme)
+            print('Strategy Type: ', strategy_type)
+            print('Happiness Function: ', happiness_func)
+            print('Analysing experiment...')
 
         strategy_counter = 0
-        strategic_happiness = 0
-        honest_happiness = 0
-
-        for situation in tqdm(situations):
-            # Check if at least one voter has a good strategy
-            strategic_winner = None
-            strategic_h = None
-            strategic_indiv_h = None
-            honest_h, honest_indiv_h, honest_winner = situation.calculate_happiness(happiness_func, voting_scheme, return_winner=True)
-            honest_happiness += honest_h
-            for voter_index in range(situation.get_num_voters()):
-                strategic_situations = self.strategy.get_strategic_preferences_for_voter(situation, voter_index, voting_scheme, happiness_func, strategy_type, False, verbose)
-                if strategic_situations:
-                    situation.voters[voter_index].preferences = strategic_situations.pop()
-                    # Calculate happiness level for each voter
-                    strategic_h, strategic_indiv_h, strategic_winner = situation.calculate_happiness(happiness_func, voting_scheme, return_winner=True)  # type: ignore
-                    strategic_happiness += strategic_h
-                    strategy_counter += 1
-                    break
-
-            if verbose:
-                print(f"Honest winner: {honest_winner}")
-                if strategic_winner: print(f"Strategic Winner: {strategic_winner}")
-                print(f"Honest overall happiness: {honest_h:.3f}")
-                if strategic_h: print(f"Strategic overall happiness: {strategic_h:.3f}")
-                print('Honest individual happiness:')
-                print(" | ".join(f'Voter {k}: {h}' for k, h in honest_indiv_h.items()))
-                if strategic_indiv_h:
-                    print('Strategic individual happiness:')
-                    print(" | ".join(f'Voter {k}: {h}' for k, h in strategic_indiv_h.items()))
+        total_strategic_happiness = 0
+        total_honest_happiness = 0
+
+        results = self.__situation_results(situations, voting_scheme, happiness_func, strategy_type, verbose, workers, chunk_size, progress,
+                                           honest_rankings=honest_rankings, honest_happiness=honest_happiness)
+        for situation_id, (honest_h, strategic_h) in enumerate(results):
+            if sink is not None:
+                sink.append({
+                    'situation': situation_id,
+                    'voting_scheme': voting_scheme.value,
+                    'happiness_func': happiness_func.value,
+                    'strategy_type': strategy_type.value,
+                    'honest_happiness': honest_h,
+                    'strategic_happiness': strategic_h,
+                    'has_strategy': strategic_h is not None
+                })
+            total_honest_happiness += honest_h
+            if strategic_h is not None:
+                total_strategic_happiness += strategic_h
+                strategy_counter += 1
 
+        if instrumentation_file is not None:
+            instrumentation.export_json(instrumentation_file)
         if return_avg_happiness:
-            if strategy_counter != 0: avg_strategic_happiness = strategic_happiness / strategy_counter
+            if strategy_counter != 0: avg_strategic_happiness = total_strategic_happiness / strategy_counter
             else: avg_strategic_happiness = 0
-            avg_honest_happiness = honest_happiness / len(situations)
+            avg_honest_happiness = total_honest_happiness / len(situations)
             return (strategy_counter / len(situations)) * 100, avg_strategic_happiness, avg_honest_happiness
         return (strategy_counter / len(situations)) * 100
 
+    @instrumentation.timed('BTVA.analyse_adaptive')
+    def analyse_adaptive(self, num_voters:int, num_candidates:int, voting_scheme, happiness_func, strategy_type, risk_width=2.0, happiness_rel_width=0.02,
+                         confidence=0.95, batch_size=100, max_samples=10000, seed=None, info=None, workers=None, chunk_size=None) -> dict:
+        """
+        Sequential version of analyse_multiple: analyse random situations in batches until the Wilson interval of the risk
+        is at most `risk_width` percentage points wide and the CLT intervals of the average strategic and honest happiness
+        are at most `happiness_rel_width` of the averages wide (None skips a check), or `max_samples` situations were used.
+        The strategic happiness check is skipped while fewer than 2 situations have a strategy and the risk has converged.
+        Returns the estimates, their intervals, the number of situations used and whether the intervals converged.
+        """
+        risk = Proportion(None if risk_width is None else risk_width / 100)
+        strategic = Mean(rel_width=happiness_rel_width)
+        honest = Mean(rel_width=happiness_rel_width)
+
+        def analyse_batch(situations):
+            for honest_h, strategic_h in self.__situation_results(situations, voting_scheme, happiness_func, strategy_type, False, workers, chunk_size):
+                honest.add(honest_h)
+                risk.add(strategic_h is not None)
+                if strategic_h is not None:
+                    strategic.add(strategic_h)
+
+        # The strategic happiness only exists when some voter has a strategy, a risk of (nearly) 0 leaves it without an interval
+        num_samples, converged = sample_until_converged(analyse_batch, [risk, Conditional(strategic, risk), honest], num_voters, num_candidates, confidence,
+                                                        batch_size, max_samples, seed, info)
+        z = z_score(confidence)
+        risk_low, risk_high = risk.interval(z)
+        return {
+            'risk': risk.estimate * 100,
+            'risk_interval': (risk_low * 100, risk_high * 100),
+            'avg_strategic_happiness': strategic.estimate,
+            'strategic_happiness_interval': strategic.interval(z),
+            'avg_honest_happiness': honest.estimate,
+            'honest_happiness_interval': honest.interval(z),
+            'num_samples': num_samples,
+            'converged': converged
+        }
+
+    def __situation_results(self, situations, voting_scheme, happiness_func, strategy_type, verbose, workers, chunk_size, progress=False,
+                            honest_rankings=None, honest_happiness=None):
+        """(honest happiness, strategic happiness or None) of every situation, in order."""
+        if honest_rankings is None:
+            honest_rankings = self.honest_rankings(situations, voting_scheme)
+        if honest_happiness is None:
+            honest_happiness = [None] * len(situations)
+        if workers is not None and workers > 1:
+            return self.__analyse_in_processes(situations, honest_rankings, honest_happiness, voting_scheme, happiness_func, strategy_type, verbose, workers, chunk_size, progress)
+        return (self.analyse_situation(situation, honest_ranking, voting_scheme, happiness_func, strategy_type, verbose, situation_happiness)
+                for situation, honest_ranking, situation_happiness in zip(tqdm(situations, disable=not progress), honest_rankings, honest_happiness))
+
+    @staticmethod
+    def __analyse_in_processes(situations, honest_rankings, honest_happiness, voting_scheme, happiness_func, strategy_type, verbose, workers, chunk_size, progress=False):
+        if chunk_size is None:
+            # A few chunks per worker keeps the processes busy when some situations take longer than others
+            chunk_size = max(1, math.ceil(len(situations) / (workers * 4)))
+        chunks = [(situations[i:i + chunk_size], honest_rankings[i:i + chunk_size], honest_happiness[i:i + chunk_size], voting_scheme, happiness_func, strategy_type, verbose,
+                   instrumentation.enabled)
+                  for i in range(0, len(situations), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map returns the chunks in submission order, whichever process finishes first
+            for chunk_results, chunk_counters, chunk_phases in tqdm(executor.map(_analyse_chunk, chunks), total=len(chunks), disable=not progress):
+                # Counters and timings of the worker processes are added to the ones of this process
+                if instrumentation.enabled:
+                    instrumentation.merge(chunk_counters, chunk_phases)
+                yield from chunk_results
+
+
+_worker_btva = None
+
+def _analyse_chunk(chunk):
+    """
+    Process pool task of BTVA.analyse_multiple, the BTVA (and its strategy cache) is reused by all chunks of a process.
+    Returns the results of the chunk's situations and the instrumentation counters and phases recorded for them
+    (empty when instrumentation is off, a forked process would otherwise hand back the parent's old counters).
+    """
+    global _worker_btva
+    if _worker_btva is None:
+        _worker_btva = BTVA()
+    situations, honest_rankings, honest_happiness, voting_scheme, happiness_func, strategy_type, verbose, instrument = chunk
+    if instrument:
+        instrumentation.enable()
+    else:
+        instrumentation.disable()
+    results = [_worker_btva.analyse_situation(situation, honest_ranking, voting_scheme, happiness_func, strategy_type, verbose, situation_happiness)
+               for situation, honest_ranking, situation_happiness in zip(situations, honest_rankings, honest_happiness)]
+    if not instrument:
+        return results, {}, {}
+    return results, dict(instrumentation.counters), {name: list(phase) for name, phase in instrumentation.phases.items()}
+
 # Example Usage
 # btva = BTVA()
 # situation = Situation(10,5, seed=42)
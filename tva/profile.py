@@ -0,0 +1,265 @@
+import string
+import numpy as np
+from tva.enums import VotingScheme
+from tva.voter import UNKNOWN
+
+# Padding value for ballots that rank fewer candidates than the profile width (e.g. bullet votes)
+EMPTY = -1
+BALLOT_DTYPE = np.int8
+
+
+class Profile:
+    """
+    Array-backed preference profile.
+    `ballots` is an n x m integer matrix where row i holds the candidate indices of voter i
+    from most to least preferred, padded with EMPTY on the right for shorter ballots.
+    `candidates` maps those indices back to candidate labels.
+    """
+    # Multiplicity of every ballot, only set for compressed profiles
+    counts: np.ndarray | None = None
+
+    def __init__(self, ballots, candidates=None):
+        ballots = np.asarray(ballots, dtype=BALLOT_DTYPE)
+        if ballots.ndim != 2:
+            raise ValueError(f'A profile must be a 2-D matrix of candidate indices, got shape {ballots.shape}')
+        if candidates is None:
+            candidates = list(string.ascii_uppercase[:max(ballots.shape[1], int(ballots.max(initial=-1)) + 1)])
+        self.ballots = ballots
+        self.candidates: list[str] = list(candidates)
+        # Alphabetical position of each label, used to break score ties like the list based schemes
+        self.label_order = np.argsort(np.argsort(self.candidates, kind='stable'), kind='stable')
+
+    @classmethod
+    def from_voters(cls, voters, candidates=None):
+        """Build a profile from a list of Voter objects, adding any unseen label (e.g. '?') as an extra candidate."""
+        if candidates is None or any(voter.candidates is not candidates for voter in voters):
+            return cls.from_preferences([voter.preferences for voter in voters], candidates)
+        # The voters already store candidate indices, with len(candidates) standing for an unknown preference
+        rows = [voter.ballot for voter in voters]
+        width = max((len(row) for row in rows), default=0)
+        if any(len(row) != width for row in rows):
+            rows = [row + (EMPTY,) * (width - len(row)) for row in rows]
+        ballots = np.array(rows, dtype=BALLOT_DTYPE).reshape(len(rows), width)
+        candidates = list(candidates)
+        if (ballots == len(candidates)).any():
+            candidates.append(UNKNOWN)
+        return cls(ballots, candidates)
+
+    @classmethod
+    def from_preferences(cls, preference_lists:list[list[str]], candidates=None):
+        """Build a profile from lists of candidate labels, adding any unseen label (e.g. '?') as an extra candidate."""
+        candidates = list(candidates) if candidates is not None else []
+        index = {candidate: i for i, candidate in enumerate(candidates)}
+        rows = []
+        for preferences in preference_lists:
+            for candidate in preferences:
+                if candidate not in index:
+                    index[candidate] = len(candidates)
+                    candidates.append(candidate)
+            rows.append([index[candidate] for candidate in preferences])
+        width = max((len(row) for row in rows), default=0)
+        if any(len(row) != width for row in rows):
+            rows = [row + [EMPTY] * (width - len(row)) for row in rows]
+        ballots = np.array(rows, dtype=BALLOT_DTYPE).reshape(len(rows), width)
+        return cls(ballots, candidates)
+
+    def get_num_voters(self):
+        return self.ballots.shape[0]
+
+    def get_num_candidates(self):
+        return len(self.candidates)
+
+    def to_preferences(self) -> list[list[str]]:
+        """Convert the matrix back to lists of candidate labels."""
+        return [[self.candidates[i] for i in row if i != EMPTY] for row in self.ballots.tolist()]
+
+    def with_overrides(self, overrides:dict[int, list[str]]):
+        """Copy of the profile in which some voters cast different ballots (given as candidate labels)."""
+        if any(candidate not in self.candidates for ballot in overrides.values() for candidate in ballot):
+            preference_lists = self.to_preferences()
+            for voter_id, ballot in overrides.items():
+                preference_lists[voter_id] = ballot
+            return Profile.from_preferences(preference_lists, self.candidates)
+        index = {candidate: i for i, candidate in enumerate(self.candidates)}
+        width = max([self.ballots.shape[1]] + [len(ballot) for ballot in overrides.values()])
+        ballots = np.full((self.ballots.shape[0], width), EMPTY, dtype=BALLOT_DTYPE)
+        ballots[:, :self.ballots.shape[1]] = self.ballots
+        for voter_id, ballot in overrides.items():
+            ballots[voter_id] = EMPTY
+            ballots[voter_id, :len(ballot)] = [index[candidate] for candidate in ballot]
+        return Profile(ballots, self.candidates)
+
+    def compress(self):
+        """Anonymous version of this profile that keeps every distinct ballot once, with its multiplicity."""
+        ballots, counts = np.unique(self.ballots, axis=0, return_counts=True)
+        return CompressedProfile(ballots, counts, self.candidates)
+
+
+class CompressedProfile(Profile):
+    """
+    Anonymous preference profile stored as (ballot, multiplicity) pairs.
+    Positional scores and happiness only depend on the multiset of ballots, so their cost
+    scales with the number of distinct ballots (at most m! for complete rankings) instead of the number of voters.
+    """
+    def __init__(self, ballots, counts, candidates=None):
+        Profile.__init__(self, ballots, candidates)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        if self.counts.shape != (self.ballots.shape[0],):
+            raise ValueError('A compressed profile needs exactly one count per distinct ballot')
+
+    @classmethod
+    def from_voters(cls, voters, candidates=None):
+        return Profile.from_voters(voters, candidates).compress()
+
+    def get_num_voters(self):
+        return int(self.counts.sum())
+
+    def get_num_ballots(self):
+        return self.ballots.shape[0]
+
+    def compress(self):
+        return self
+
+    def expand(self) -> Profile:
+        """Profile with one row per voter, in the order of the distinct ballots."""
+        return Profile(np.repeat(self.ballots, self.counts, axis=0), self.candidates)
+
+
+def ballot_points(ballots:np.ndarray, voting_scheme:VotingScheme) -> np.ndarray:
+    """
+    Points awarded to the candidate in every ballot slot under a positional voting scheme.
+    Matches the list based rules: vote for n takes the first n entries of each ballot
+    (anti plurality drops the last one), Borda awards m - 1 - rank with m the longest ballot.
+    """
+    valid = ballots != EMPTY
+    ranks = np.arange(ballots.shape[-1])
+    if voting_scheme == VotingScheme.PLURALITY:
+        points = ranks < 1
+    elif voting_scheme == VotingScheme.VOTE_FOR_TWO:
+        points = ranks < 2
+    elif voting_scheme == VotingScheme.ANTI_PLURALITY:
+        points = ranks < valid.sum(axis=-1, keepdims=True) - 1
+    else:
+        # Longest ballot of each profile, so a stack of profiles is scored independently
+        width = valid.sum(axis=-1).max(axis=-1, initial=0)
+        points = width[..., None, None] - 1 - ranks
+    return np.where(valid, points, 0).astype(np.int64)
+
+
+def positional_scores(ballots:np.ndarray, voting_scheme:VotingScheme, num_candidates:int, counts:np.ndarray|None=None) -> np.ndarray:
+    """
+    Total score of every candidate, computed as a single weighted count over all ballot slots.
+    `counts` optionally gives the multiplicity of every ballot (see CompressedProfile).
+    """
+    valid = ballots != EMPTY
+    if valid.all():
+        # Complete rankings give every rank the same points, so weight the per-rank counts instead
+        weights = ballot_points(ballots[:1], voting_scheme)[0]
+        scores = np.zeros(num_candidates, dtype=np.int64)
+        for rank in np.flatnonzero(weights):
+            rank_counts = np.bincount(ballots[:, rank], weights=counts, minlength=num_candidates)
+            scores += weights[rank] * rank_counts.astype(np.int64)
+        return scores
+    points = ballot_points(ballots, voting_scheme)
+    if counts is not None:
+        points = points * counts[:, None]
+    return np.bincount(ballots[valid], weights=points[valid], minlength=num_candidates).astype(np.int64)
+
+
+def batch_positional_scores(ballots:np.ndarray, voting_scheme:VotingScheme, num_candidates:int) -> np.ndarray:
+    """Score vectors of a stack of S profiles (an S x n x m array) in one pass, shape S x num_candidates."""
+    num_profiles = ballots.shape[0]
+    valid = ballots != EMPTY
+    # Offset every profile's candidate indices so one bincount covers the whole stack
+    offsets = (np.arange(num_profiles) * num_candidates)[:, None, None]
+    flat = ballots.astype(np.int64) + offsets
+    if valid.all():
+        # Complete rankings give every rank the same points, so weight the per-rank counts instead
+        weights = ballot_points(ballots[:1, :1], voting_scheme)[0, 0]
+        scores = np.zeros(num_profiles * num_candidates, dtype=np.int64)
+        for rank in np.flatnonzero(weights):
+            scores += weights[rank] * np.bincount(flat[:, :, rank].ravel(), minlength=num_profiles * num_candidates)
+        return scores.reshape(num_profiles, num_candidates)
+    points = ballot_points(ballots, voting_scheme)
+    scores = np.bincount(flat[valid], weights=points[valid], minlength=num_profiles * num_candidates)
+    return scores.astype(np.int64).reshape(num_profiles, num_candidates)
+
+
+def batch_rank_candidates(ballots:np.ndarray, scores:np.ndarray, candidates:list[str]) -> np.ndarray:
+    """
+    Rankings of a stack of profiles, shape S x num_candidates.
+    Candidates that appear on no ballot of a profile are moved to the end and replaced by EMPTY.
+    """
+    num_profiles, num_candidates = scores.shape
+    valid = ballots != EMPTY
+    offsets = (np.arange(num_profiles) * num_candidates)[:, None, None]
+    present = np.bincount((ballots.astype(np.int64) + offsets)[valid], minlength=num_profiles * num_candidates)
+    present = present.reshape(num_profiles, num_candidates) > 0
+    label_order = np.broadcast_to(np.argsort(np.argsort(candidates, kind='stable'), kind='stable'), scores.shape)
+    order = np.lexsort((label_order, -scores, ~present), axis=-1)
+    return np.where(np.take_along_axis(present, order, axis=-1), order, EMPTY)
+
+
+def stack_profiles(profiles:list[Profile]) -> tuple[np.ndarray, list[str]]:
+    """
+    Stack profiles with the same number of voters into one S x n x m array.
+    Candidate indices are remapped onto a shared candidate list and shorter ballots are padded with EMPTY.
+    """
+    if len({profile.get_num_voters() for profile in profiles}) > 1:
+        raise ValueError('Only profiles with the same number of voters can be stacked')
+    candidates = list(profiles[0].candidates)
+    index = {candidate: i for i, candidate in enumerate(candidates)}
+    width = max(profile.ballots.shape[1] for profile in profiles)
+    stacked = np.full((len(profiles), profiles[0].get_num_voters(), width), EMPTY, dtype=BALLOT_DTYPE)
+    for i, profile in enumerate(profiles):
+        if profile.candidates != candidates:
+            for candidate in profile.candidates:
+                if candidate not in index:
+                    index[candidate] = len(candidates)
+                    candidates.append(candidate)
+            # Append a trailing EMPTY so padding maps to itself through the -1 index
+            lookup = np.array([index[candidate] for candidate in profile.candidates] + [EMPTY], dtype=BALLOT_DTYPE)
+            stacked[i, :, :profile.ballots.shape[1]] = lookup[profile.ballots]
+        else:
+            stacked[i, :, :profile.ballots.shape[1]] = profile.ballots
+    return stacked, candidates
+
+
+def pivotal_targets(profile:Profile, voting_scheme:VotingScheme, happiness_table:np.ndarray) -> np.ndarray:
+    """
+    Candidates each voter might make win with a different ballot, as an n x num_candidates boolean matrix.
+    A target has to make the voter happier than the current winner (per the happiness table), and the voter's
+    largest swing, top points to the target and no points to the winner, has to overturn the margin between them.
+    This is a necessary condition, so a voter without targets cannot manipulate under a winner based happiness function.
+    Ballots that repeat a label (several '?') and Borda profiles with partial ballots, where the longest ballot
+    and so every point can change, only get the happiness condition.
+    """
+    ballots = profile.ballots
+    num_voters, width = ballots.shape
+    num_candidates = len(profile.candidates)
+    valid = ballots != EMPTY
+    scores = positional_scores(ballots, voting_scheme, num_candidates)
+    winner = rank_candidates(scores, profile)[0]
+    with np.errstate(invalid='ignore'):
+        preferred = happiness_table > happiness_table[:, winner:winner + 1]
+    if voting_scheme == VotingScheme.BORDA and not valid.all():
+        return preferred
+    # Points every voter currently gives every candidate
+    rows = np.broadcast_to(np.arange(num_voters)[:, None] * num_candidates, ballots.shape)
+    given = np.bincount((rows + ballots)[valid], weights=ballot_points(ballots, voting_scheme)[valid], minlength=num_voters * num_candidates)
+    given = given.astype(np.int64).reshape(num_voters, num_candidates)
+    top_points = width - 1 if voting_scheme == VotingScheme.BORDA else 1
+    best_target_score = scores[None, :] + top_points - given
+    worst_winner_score = (scores[winner] - given[:, winner])[:, None]
+    overturns = (best_target_score > worst_winner_score) | ((best_target_score == worst_winner_score) & (profile.label_order < profile.label_order[winner]))
+    ordered = np.sort(ballots, axis=1)
+    repeated = ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] != EMPTY)).any(axis=1)
+    return preferred & (overturns | repeated[:, None])
+
+
+def rank_candidates(scores:np.ndarray, profile:Profile) -> np.ndarray:
+    """Candidate indices sorted by score (descending) and then alphabetically, skipping candidates on no ballot."""
+    present = np.zeros(len(profile.candidates), dtype=bool)
+    present[profile.ballots[profile.ballots != EMPTY]] = True
+    order = np.lexsort((profile.label_order, -scores))
+    return order[present[order]]
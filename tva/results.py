@@ -0,0 +1,185 @@
+import csv
+import math
+import os
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+
+# Column types of the records every model writes, in column order
+BTVA_SITUATION_SCHEMA = {
+    'situation': int,
+    'voting_scheme': str,
+    'happiness_func': str,
+    'strategy_type': str,
+    'honest_happiness': float,
+    'strategic_happiness': float,
+    'has_strategy': bool
+}
+
+BTVA_STRATEGY_SCHEMA = {
+    'situation': int,
+    'voting_scheme': str,
+    'happiness_func': str,
+    'strategy_type': str,
+    'voter_id': int,
+    'strategy': str,
+    'strategic_winner': str,
+    'strategic_individual_happiness': float,
+    'original_individual_happiness': float,
+    'strategic_total_happiness': float,
+    'original_total_happiness': float
+}
+
+ATVA4_OPPORTUNITY_SCHEMA = {
+    'situation': int,
+    'voting_scheme': str,
+    'happiness_func': str,
+    'strategy_type': str,
+    'voter_ids': str,
+    'num_voters': int,
+    'new_winner': str,
+    'new_total_happiness': float,
+    'total_happiness_change': float,
+    'collective_action_required': bool,
+    'strategic_preferences': str,
+    'individual_gains': str
+}
+
+ATVA4_SIMULATION_SCHEMA = {
+    'situation': int,
+    'voting_scheme': str,
+    'happiness_func': str,
+    'strategy_type': str,
+    'max_coalition': int,
+    'beneficial': bool
+}
+
+
+def encode_ballot(preferences) -> str:
+    """Ballot as one string, e.g. 'B>A>C'."""
+    return '>'.join(preferences)
+
+
+def encode_mapping(mapping:dict, encode=str) -> str:
+    """Dict of voter ids as one string, e.g. '0:B>A>C;3:A>C>B'."""
+    return ';'.join(f'{key}:{encode(value)}' for key, value in mapping.items())
+
+
+class ResultSink:
+    """
+    Columnar writer for analysis records with a fixed schema.
+    Records are buffered column by column and appended to the file every `batch_size` records, so memory stays
+    flat however many situations are analysed. The format follows the file extension: .csv, .parquet or .arrow
+    (the last two need pyarrow).
+    """
+    FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow'}
+
+    def __init__(self, path:str, schema:dict[str, type], batch_size=10000):
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in self.FORMATS:
+            raise ValueError(f'Unknown result format {extension!r}, use one of {", ".join(self.FORMATS)}')
+        self.format = self.FORMATS[extension]
+        if self.format != 'csv' and pa is None:
+            raise ImportError(f'Writing {extension} files needs pyarrow, install it or write a .csv file')
+        self.path = path
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.closed = False
+        self.__columns = {column: [] for column in schema}
+        self.__buffered = 0
+        self.__writer = None
+        self.__file = None
+
+    def append(self, record:dict):
+        """Add one record, every column of the schema must be present."""
+        if self.closed:
+            raise ValueError(f'Cannot append to the closed result sink of {self.path}')
+        for column, kind in self.schema.items():
+            self.__columns[column].append(self.__convert(column, kind, record[column]))
+        self.__buffered += 1
+        if self.__buffered >= self.batch_size:
+            self.flush()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        """Write the buffered records to the file."""
+        if not self.__buffered:
+            return
+        if self.format == 'csv':
+            self.__write_csv()
+        else:
+            self.__write_arrow()
+        self.rows_written += self.__buffered
+        self.__columns = {column: [] for column in self.schema}
+        self.__buffered = 0
+
+    def close(self):
+        """Write the remaining records and close the file. Closing again does nothing."""
+        if self.closed:
+            return
+        self.flush()
+        # Without records the file still gets its header (schema)
+        if self.rows_written == 0 and self.format == 'csv':
+            self.__write_csv()
+        elif self.rows_written == 0:
+            self.__write_arrow()
+        # A csv writer has no close, its file is closed instead
+        if self.__file is not None:
+            self.__file.close()
+        elif self.__writer is not None:
+            self.__writer.close()
+        self.__writer = None
+        self.__file = None
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def __convert(column:str, kind:type, value):
+        """Value of a column as its schema type, values of another type are rejected rather than coerced (bool('False') is True)."""
+        if value is None and kind is float:
+            return math.nan
+        if kind is bool:
+            if isinstance(value, (bool, np.bool_)):
+                return bool(value)
+        elif kind is float:
+            if isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_)):
+                return float(value)
+        elif kind is int:
+            if isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+                return int(value)
+        elif isinstance(value, str):
+            return value
+        raise TypeError(f'Column {column!r} holds {kind.__name__} values, got {value!r}')
+
+    def __write_csv(self):
+        if self.__file is None:
+            self.__file = open(self.path, 'w', newline='')
+            self.__writer = csv.writer(self.__file)
+            self.__writer.writerow(self.schema)
+        self.__writer.writerows(zip(*self.__columns.values()))
+        self.__file.flush()
+
+    def __write_arrow(self):
+        types = {int: pa.int64(), float: pa.float64(), str: pa.string(), bool: pa.bool_()}
+        schema = pa.schema([(column, types[kind]) for column, kind in self.schema.items()])
+        table = pa.Table.from_pydict(self.__columns, schema=schema)
+        if self.__writer is None:
+            if self.format == 'parquet':
+                self.__writer = pq.ParquetWriter(self.path, schema)
+            else:
+                self.__writer = ipc.new_file(self.path, schema)
+        self.__writer.write_table(table)
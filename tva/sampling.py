@@ -0,0 +1,118 @@
+import math
+from statistics import NormalDist
+from tva.situation import Situation
+
+
+def z_score(confidence:float) -> float:
+    """Two sided normal quantile of a confidence level, 1.96 for 0.95."""
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+class Proportion:
+    """
+    Running share of situations with some property (e.g. a voter has a strategy), with a Wilson score interval.
+    `width` is the target width of the interval as a share, None means any width is fine.
+    """
+    def __init__(self, width=None):
+        self.width = width
+        self.hits = 0
+        self.count = 0
+
+    def add(self, hit:bool):
+        self.hits += bool(hit)
+        self.count += 1
+
+    @property
+    def estimate(self) -> float:
+        return self.hits / self.count if self.count else 0.0
+
+    def interval(self, z:float) -> tuple[float, float]:
+        if not self.count:
+            return 0.0, 1.0
+        # Unlike the normal approximation, the Wilson interval stays inside [0, 1] and is not empty for shares near 0 or 1
+        n = self.count
+        p = self.hits / n
+        centre = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z / (1 + z * z / n) * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+        return max(0.0, centre - half), min(1.0, centre + half)
+
+    def converged(self, z:float) -> bool:
+        if self.width is None:
+            return True
+        low, high = self.interval(z)
+        return high - low <= self.width
+
+
+class Mean:
+    """
+    Running mean (Welford's update) with a normal (CLT) confidence interval.
+    `width` is the target width of the interval, `rel_width` the target width relative to the mean, None means any width is fine.
+    """
+    def __init__(self, width=None, rel_width=None):
+        self.width = width
+        self.rel_width = rel_width
+        self.count = 0
+        self.mean = 0.0
+        self.__m2 = 0.0
+
+    def add(self, value:float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.__m2 += delta * (value - self.mean)
+
+    @property
+    def estimate(self) -> float:
+        return self.mean
+
+    def interval(self, z:float) -> tuple[float, float]:
+        if self.count < 2:
+            return -math.inf, math.inf
+        half = z * math.sqrt(self.__m2 / (self.count - 1) / self.count)
+        return self.mean - half, self.mean + half
+
+    def converged(self, z:float) -> bool:
+        low, high = self.interval(z)
+        if self.width is not None and not high - low <= self.width:
+            return False
+        if self.rel_width is not None and not high - low <= self.rel_width * abs(self.mean):
+            return False
+        return True
+
+
+class Conditional:
+    """
+    Convergence of a Mean that is only sampled in some situations (e.g. the strategic happiness, which only exists when
+    a voter has a strategy), given the Proportion of those situations. With fewer than 2 samples the mean has no
+    interval, so it counts as converged once the proportion has converged: the situations it needs are too rare to wait for.
+    """
+    def __init__(self, mean:Mean, proportion:Proportion):
+        self.mean = mean
+        self.proportion = proportion
+
+    def converged(self, z:float) -> bool:
+        if self.mean.count < 2:
+            return self.proportion.converged(z)
+        return self.mean.converged(z)
+
+
+def sample_until_converged(analyse_batch, statistics:list, num_voters:int, num_candidates:int, confidence=0.95,
+                           batch_size=100, max_samples=10000, seed=None, info=None) -> tuple[int, bool]:
+    """
+    Sequential Monte Carlo: generate situations in batches, hand every batch to `analyse_batch` (which adds
+    its results to the statistics) and stop once all statistics have converged or `max_samples` situations were used.
+    Batch k is generated from the seed (seed, k), so a seeded run always samples the same situations.
+    Returns the number of situations used and whether the statistics converged.
+    """
+    z = z_score(confidence)
+    num_samples = 0
+    batch_index = 0
+    while num_samples < max_samples:
+        size = min(batch_size, max_samples - num_samples)
+        batch_seed = None if seed is None else [seed, batch_index]
+        analyse_batch(Situation.generate(size, num_voters, num_candidates, seed=batch_seed, info=info))
+        num_samples += size
+        batch_index += 1
+        if all(statistic.converged(z) for statistic in statistics):
+            return num_samples, True
+    return num_samples, False
@@ -1,6 +1,9 @@
 from collections import Counter, defaultdict
+import numpy as np
 from tva.voter import Voter
 from tva.enums import VotingScheme
+from tva import instrumentation
+from tva.profile import Profile, positional_scores, rank_candidates, batch_positional_scores, batch_rank_candidates
 
 class Schemes:
     def print_results(self, situation, verbose=False):
@@ -12,8 +15,13 @@ class Schemes:
         else:
             print("Anti plurality:", winner1, ", Two voting:", winner2, ", Borda:", winner3)
     
-    def apply_voting_scheme(self, voting_scheme:VotingScheme, voters:list[Voter], return_scores=False, return_ranking=False):
-        """ Apply the specified voting scheme to determine the winner. """
+    def apply_voting_scheme(self, voting_scheme:VotingScheme, voters:list[Voter]|Profile|np.ndarray, return_scores=False, return_ranking=False):
+        """ Apply the specified voting scheme to determine the winner. Accepts a list of voters or an array-backed (optionally compressed) profile. """
+        if instrumentation.enabled: instrumentation.count('elections')
+        if isinstance(voters, np.ndarray):
+            voters = Profile(voters)
+        if isinstance(voters, Profile):
+            return self.__positional_voting(voting_scheme, voters, return_scores, return_ranking)
         if voting_scheme == VotingScheme.PLURALITY:
             return self.__voting_for_n(1, voters, return_scores, return_ranking)
         elif voting_scheme == VotingScheme.VOTE_FOR_TWO:
@@ -23,6 +31,17 @@ class Schemes:
         # elif voting_scheme == VotingScheme.BORDA:
         return self.__borda_voting(voters, return_scores, return_ranking)
 
+    def apply_voting_scheme_batch(self, voting_scheme:VotingScheme, ballots:np.ndarray, candidates:list[str]):
+        """
+        Apply the voting scheme to a stack of S profiles (an S x n x m array of candidate indices) at once.
+        Returns the winners (S), rankings (S x num_candidates) and scores (S x num_candidates) as candidate indices.
+        """
+        ballots = np.asarray(ballots)
+        if instrumentation.enabled: instrumentation.count('elections', len(ballots))
+        scores = batch_positional_scores(ballots, voting_scheme, len(candidates))
+        rankings = batch_rank_candidates(ballots, scores, candidates)
+        return rankings[:, 0], rankings, scores
+
     def __voting_for_n(self, n, voters:list[Voter], return_scores=False, return_ranking=False):
         # Get all unique candidates
         all_candidates = self.__get_all_candidates(voters)
@@ -63,6 +82,22 @@ class Schemes:
             return ranked_candidates
         return ranked_candidates[0]
 
+    @staticmethod
+    def __positional_voting(voting_scheme:VotingScheme, profile:Profile, return_scores=False, return_ranking=False):
+        """ Score every positional scheme with one vectorized reduction over the ballot matrix. """
+        scores = positional_scores(profile.ballots, voting_scheme, len(profile.candidates), profile.counts)
+        order = rank_candidates(scores, profile)
+        ranked_candidates = [profile.candidates[i] for i in order]
+        if return_scores:
+            scores = {profile.candidates[i]: int(scores[i]) for i in order}
+        if return_scores and return_ranking:
+            return ranked_candidates, scores
+        elif return_scores:
+            return ranked_candidates[0], scores
+        elif return_ranking:
+            return ranked_candidates
+        return ranked_candidates[0]
+
     @staticmethod
     def __get_all_candidates(voters):
         """Extract all unique candidates from all voter preferences."""
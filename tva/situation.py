@@ -1,18 +1,25 @@
 import random
 import string
+import numpy as np
+from copy import copy
 from tabulate import tabulate
-from tva.voter import Voter
-from tva.schemes import Schemes
+from tva.voter import Voter, UNKNOWN
 from tva.happiness import Happiness
+from tva.tally import ScoreTally
+from tva.profile import Profile, BALLOT_DTYPE, pivotal_targets
 from tva.enums import HappinessFunc, VotingScheme
+from tva import instrumentation
 
-schemes = Schemes()
 happiness = Happiness()
 
 class Situation:
     def __init__(self, num_voters:int, num_candidates:int, seed=None, candidates=None, voters=None, info=None):
         assert num_candidates > 0, "Number of candidates must be greater than 0."
         assert num_candidates <= 20, "If the number of candidates is greater than 9, there are too many permutations to calculate quickly."
+        # Lazily computed data derived from the current preferences, cleared whenever they change
+        self._cache = {}
+        # Number of preference changes, lets views of this situation notice that their cache is stale
+        self._version = 0
         
         if seed is not None:
             # Generate a random seed if none is provided
@@ -38,10 +45,12 @@ class Situation:
                 new_preferences = []
                 for candidate in voter.preferences:
                     if self.rng.random() < info:
-                        new_preferences.append("?")
+                        new_preferences.append(UNKNOWN)
                     else:
                         new_preferences.append(candidate)
                 voter.preferences = new_preferences
+        for voter in self.voters:
+            voter.situation = self
 
     def __create_situation(self, num_voters=4) -> list[Voter]:
         """ Creates a preference matrix """
@@ -53,6 +62,27 @@ class Situation:
 
         return voters
 
+    @classmethod
+    def generate(cls, num_situations:int, num_voters:int, num_candidates:int, seed=None, info=None) -> list['Situation']:
+        """
+        Create many random situations at once, drawing all S x n x m ballots in a single NumPy call.
+        Ballots are argsorts of uniform noise (uniformly random rankings) and `info` hides every preference
+        with that probability, like the constructor. The same seed always gives the same situations.
+        """
+        assert num_candidates > 0, "Number of candidates must be greater than 0."
+        assert num_candidates <= 20, "If the number of candidates is greater than 9, there are too many permutations to calculate quickly."
+        candidates = cls.__create_candidates(num_candidates)
+        rng = np.random.default_rng(np.random.SeedSequence(seed))
+        ballots = np.argsort(rng.random((num_situations, num_voters, len(candidates))), axis=-1).astype(BALLOT_DTYPE)
+        if info is not None:
+            # Unknown preferences are stored as index len(candidates), like Voter does
+            ballots[rng.random(ballots.shape) < info] = len(candidates)
+        situations = []
+        for situation_ballots in ballots:
+            profile_candidates = candidates + [UNKNOWN] if (situation_ballots == len(candidates)).any() else candidates
+            situations.append(GeneratedSituation(Profile(situation_ballots, profile_candidates), candidates, seed))
+        return situations
+
     @staticmethod
     def __create_candidates(num_candidates=4):
         """Return a list of the first `n` uppercase letters of the alphabet."""
@@ -88,13 +118,69 @@ class Situation:
     def get_num_voters(self):
         return len(self.voters)
     
+    def __getstate__(self):
+        # Copies start with an empty cache, since they are usually made to change some preferences
+        if instrumentation.enabled: instrumentation.count('situation_copies')
+        state = self.__dict__.copy()
+        state['_cache'] = {}
+        return state
+
+    def set_preferences(self, voter_id:int, preferences:list[str]):
+        """Replace the preferences of a voter (the same as assigning voter.preferences)."""
+        # The voter tells the situation, which drops its cache
+        self.voters[voter_id].preferences = preferences
+
+    def _preferences_changed(self, voter:Voter):
+        """Called by a voter of this situation whose preferences changed, drops everything computed from the old ones."""
+        self._version += 1
+        self._cache.clear()
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def with_overrides(self, overrides:dict[int, list[str]]) -> 'SituationOverlay':
+        """View of this situation in which some voters cast different ballots, without copying it."""
+        if instrumentation.enabled: instrumentation.count('situation_overlays')
+        return SituationOverlay(self, overrides)
+
+    def get_profile(self) -> Profile:
+        """Array-backed copy of the current preferences."""
+        return self._cached('profile', lambda: Profile.from_voters(self.voters, self.candidates))
+
+    def score_tally(self, voting_scheme:VotingScheme) -> ScoreTally:
+        """Aggregate scores of the current preferences, used to evaluate changed ballots incrementally."""
+        return self._cached(('tally', voting_scheme), lambda: ScoreTally(self.get_profile(), voting_scheme))
+
+    def happiness_table(self, happiness_func:HappinessFunc):
+        """n x m matrix of every voter's happiness if each candidate wins (LOG, EXP and LINEAR), indexed like get_profile()."""
+        return self._cached(('happiness', happiness_func), lambda: happiness.happiness_table(self.get_profile(), happiness_func))
+
+    def pivotal_voters(self, voting_scheme:VotingScheme, happiness_func:HappinessFunc) -> dict[int, list[str]]:
+        """
+        Voters that may be able to manipulate, with the candidates they could make win (see pivotal_targets).
+        Ranked happiness functions also reward changes below the winner, so for those every voter is kept, as for
+        profiles with ballots that leave candidates out.
+        """
+        def compute():
+            profile = self.get_profile()
+            every_voter = {voter_id: list(profile.candidates) for voter_id in range(profile.get_num_voters())}
+            if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
+                return every_voter
+            table = self.happiness_table(happiness_func)
+            # Ballots that do not rank every candidate have no happiness for some winners, their searches raise as before
+            if np.isnan(table).any():
+                return every_voter
+            targets = pivotal_targets(profile, voting_scheme, table)
+            return {voter_id: [profile.candidates[c] for c in np.flatnonzero(row)] for voter_id, row in enumerate(targets) if row.any()}
+        return self._cached(('pivotal', voting_scheme, happiness_func), compute)
+
     def calculate_individual_happiness(self, individual_preferences: list[str], happiness_func:HappinessFunc, voting_scheme:VotingScheme, return_winner=False):
+        _, election_ranking, winner = self.score_tally(voting_scheme).evaluate()
         if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
-            election_ranking = schemes.apply_voting_scheme(voting_scheme, self.voters, return_ranking=True)
-            winner = election_ranking[0]
             winner_happiness = happiness.calculate_individual_ranked(individual_preferences, election_ranking, happiness_func)
         else:
-            winner = schemes.apply_voting_scheme(voting_scheme, self.voters)
             winner_happiness = happiness.calculate_individual(individual_preferences, winner, happiness_func)
         if return_winner:
             return winner_happiness, winner
@@ -102,15 +188,116 @@ class Situation:
             return winner_happiness
         
     def calculate_happiness(self, happiness_func:HappinessFunc, voting_scheme:VotingScheme, return_winner=False):
-        if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
-            election_ranking = schemes.apply_voting_scheme(voting_scheme, self.voters, return_ranking=True)
-            winner = election_ranking[0]
-            total_happiness, individual_happiness = happiness.calculate_ranked(self.voters, election_ranking, happiness_func)
-        else:
-            winner = schemes.apply_voting_scheme(voting_scheme, self.voters)
-            total_happiness, individual_happiness = happiness.calculate(self.voters, winner, happiness_func)
+        _, election_ranking, winner = self.score_tally(voting_scheme).evaluate()
+        total_happiness, individual_happiness = self.calculate_outcome_happiness(election_ranking, happiness_func)
         if return_winner:
             return total_happiness, individual_happiness, winner
         else:
             return total_happiness, individual_happiness
-    
\ No newline at end of file
+
+    def calculate_outcome_happiness(self, election_ranking:list[str], happiness_func:HappinessFunc):
+        """
+        Total and individual happiness of the voters for an election ranking.
+        Winner based functions read a column of the happiness table, ranked functions use the batched kernels.
+        """
+        if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
+            _, scores = happiness.calculate_ranked(self.get_profile(), election_ranking, happiness_func)
+            column = list(scores.values())
+        else:
+            if instrumentation.enabled: instrumentation.count('happiness_outcomes')
+            winner = election_ranking[0]
+            column = happiness.winner_column(self.happiness_table(happiness_func)[:, self.get_profile().candidates.index(winner)], winner).tolist()
+        total_happiness = 0.0
+        individual_happiness = {}
+        for voter, score in zip(self.voters, column):
+            individual_happiness[voter.voter_id] = score
+            total_happiness += score
+        return total_happiness, individual_happiness
+
+
+class SituationOverlay(Situation):
+    """
+    Copy-on-write view of a situation: the base situation plus a small dict of ballot overrides.
+    Behaves like a Situation for the schemes, happiness functions and models, but only the overridden
+    voters are copied and the profile and score tallies are derived from the base ones.
+    """
+    def __init__(self, base:Situation, overrides:dict[int, list[str]]):
+        if isinstance(base, SituationOverlay):
+            overrides = {**base.overrides, **overrides}
+            base = base.base
+        self._cache = {}
+        self._version = 0
+        self.base = base
+        # The cache is derived from the base situation as well, it is dropped when the base changes
+        self._base_version = base._version
+        self.overrides = {voter_id: list(preferences) for voter_id, preferences in overrides.items()}
+        self.candidates = base.candidates
+        self.seed = base.seed
+
+    @property
+    def voters(self) -> list[Voter]:
+        return self._cached('voters', self.__overlay_voters)
+
+    def __overlay_voters(self) -> list[Voter]:
+        voters = list(self.base.voters)
+        for voter_id, preferences in self.overrides.items():
+            voter = copy(voters[voter_id])
+            voter.situation = None
+            voter.preferences = preferences
+            # Later changes to the copy are overrides of this overlay, changes to the other voters change the base
+            voter.situation = self
+            voters[voter_id] = voter
+        return voters
+
+    def set_preferences(self, voter_id:int, preferences:list[str]):
+        self.overrides[voter_id] = list(preferences)
+        self._version += 1
+        self._cache.clear()
+
+    def _preferences_changed(self, voter:Voter):
+        self.set_preferences(voter.voter_id, voter.preferences)
+
+    def _cached(self, key, compute):
+        if self._base_version != self.base._version:
+            self._base_version = self.base._version
+            self._cache.clear()
+        return Situation._cached(self, key, compute)
+
+    def get_profile(self) -> Profile:
+        return self._cached('profile', lambda: self.base.get_profile().with_overrides(self.overrides))
+
+    def score_tally(self, voting_scheme:VotingScheme) -> ScoreTally:
+        return self._cached(('tally', voting_scheme), lambda: self.base.score_tally(voting_scheme).with_overrides(self.overrides))
+
+
+class GeneratedSituation(Situation):
+    """
+    Situation backed by a ballot matrix (see Situation.generate).
+    Voter objects are only created when something asks for them, the schemes and happiness
+    functions work on the matrix directly.
+    """
+    def __init__(self, profile:Profile, candidates:list[str], seed=None):
+        self._cache = {}
+        self._version = 0
+        self.profile = profile
+        self.candidates = candidates
+        self.seed = seed
+        self._voters = None
+
+    @property
+    def voters(self) -> list[Voter]:
+        if self._voters is None:
+            self._voters = [Voter.from_ballot(i, self.candidates, tuple(row)) for i, row in enumerate(self.profile.ballots.tolist())]
+            for voter in self._voters:
+                voter.situation = self
+        return self._voters
+
+    def get_num_voters(self):
+        return self.profile.get_num_voters()
+
+    def get_profile(self) -> Profile:
+        # Until the voters exist nothing can have changed the ballot matrix
+        if self._voters is None:
+            return self.profile
+        # Preferences may have been changed through the voters
+        return Situation.get_profile(self)
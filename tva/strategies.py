@@ -1,20 +1,46 @@
+import math
+from collections import OrderedDict
+from itertools import islice
+from functools import lru_cache
+import numpy as np
 from tva.schemes import Schemes
-from tva.situation import Situation
+from tva.situation import Situation, SituationOverlay
 from tva.happiness import Happiness
 from tva.voter import Voter
-from tva.enums import VotingScheme, HappinessFunc, StrategyType
-from copy import deepcopy
+from tva.enums import VotingScheme, HappinessFunc, StrategyType, HEURISTIC_STRATEGIES
+from tva import instrumentation
 
 
 class Strategies:
-    def __init__(self):
+    # Largest number of distinct point assignments enumerated for the ranked happiness functions (8! for Borda)
+    MAX_ENUMERATED_BALLOTS = 40320
+    # Budgets of the burying search, in evaluated ballots and in consecutive winner changes
+    BURY_MAX_NODES = 20000
+    BURY_MAX_DEPTH = 1000
+
+    def __init__(self, cache_size=10000):
         self.schemes = Schemes()
         self.happiness = Happiness()
+        # Strategic ballots found per (voter's ballot, other voters' aggregate scores), most recently used last
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.__cache = OrderedDict()
+
+    def cache_info(self) -> dict[str, int]:
+        """Hits, misses and size of the strategic ballot cache."""
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'size': len(self.__cache), 'max_size': self.cache_size}
+
+    def clear_cache(self):
+        self.__cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
         
-    def apply_all_strategies_to_voter(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, verbose=False) -> dict[StrategyType, list[list[str]]]:
-        """Apply all strategies to a single voter"""
+    def apply_all_strategies_to_voter(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, verbose=False,
+                                      strategy_types=None) -> dict[StrategyType, list[list[str]]]:
+        """Apply all strategies (the heuristic ones unless `strategy_types` is given) to a single voter"""
         strategies = {}
-        for strategy in StrategyType:
+        for strategy in HEURISTIC_STRATEGIES if strategy_types is None else strategy_types:
             if verbose:
                 print(f"Applying strategy {strategy}")
             strategic_preferences = self.get_strategic_preferences_for_voter(situation, voter_index, voting_scheme, happiness_func, strategy, exhaustive_search=exhaustive_search, verbose=False)
@@ -24,7 +50,7 @@ class Strategies:
                 strategies[strategy] = strategic_preferences
         return strategies
 
-    def get_strategic_preferences_for_all_voters(self, situation: Situation, voting_scheme:VotingScheme, happiness_func:HappinessFunc, strategy:StrategyType, exhaustive_search=False, verbose=False) -> dict[int, list[Situation]]:
+    def get_strategic_preferences_for_all_voters(self, situation: Situation, voting_scheme:VotingScheme, happiness_func:HappinessFunc, strategy:StrategyType, exhaustive_search=False, verbose=False) -> dict[int, list[SituationOverlay]]:
         """Returns a dictionary of voters and the strategic situations that increase their happiness after applying a single StrategyType"""
         strategic_situations = {}
         for voter in situation.voters:
@@ -36,133 +62,224 @@ class Strategies:
                 continue
             
             situations = []
-            print(strategic_preferences)
+            if verbose:
+                print(strategic_preferences)
             for preferences in strategic_preferences:
-                copied_situation = deepcopy(situation)
-                copied_situation.voters[voter.voter_id].preferences = preferences
-                situations.append(copied_situation)
+                situations.append(situation.with_overrides({voter.voter_id: preferences}))
 
             strategic_situations[voter.voter_id] = situations
         return strategic_situations
 
+    def iter_all_strategies_to_voter(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, verbose=False, strategy_types=None):
+        """Yields (strategy, ballot) for every improving ballot of every strategy (the heuristic ones unless `strategy_types` is given), one at a time."""
+        for strategy in HEURISTIC_STRATEGIES if strategy_types is None else strategy_types:
+            for preferences in self.iter_strategic_preferences_for_voter(situation, voter_index, voting_scheme, happiness_func, strategy, verbose=verbose):
+                yield strategy, preferences
+
     def get_strategic_preferences_for_voter(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, strategy:StrategyType, exhaustive_search, verbose=False) -> list[list[str]] | None:
         """Returns a new set of preferences for the voter to improve its happiness"""
-        
+        ballots = self.iter_strategic_preferences_for_voter(situation, voter_index, voting_scheme, happiness_func, strategy, verbose=verbose)
+        return self.__collect(ballots, exhaustive_search)
+
+    @instrumentation.timed('strategies.search')
+    def iter_strategic_preferences_for_voter(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, strategy:StrategyType, verbose=False):
+        """
+        Yields the ballots that improve the voter's happiness one at a time, in the order of the exhaustive search.
+        Stopping early skips the rest of the search, so taking the first ballot costs the same as a non exhaustive search.
+        The answer only depends on the voter's ballot and the other voters' aggregate scores, so complete answers
+        and first answers are cached on those.
+        Voters that cannot change the winner to a candidate they prefer are skipped without a search.
+        """
+        if voter_index not in situation.pivotal_voters(voting_scheme, happiness_func):
+            return
+        if verbose or not self.cache_size:
+            yield from self.__strategic_ballots(situation, voter_index, voting_scheme, happiness_func, strategy, verbose)
+            return
+        tally = situation.score_tally(voting_scheme)
+        key = (strategy, voting_scheme, happiness_func, tuple(situation.candidates), tuple(tally.candidates),
+               tuple(situation.voters[voter_index].preferences), tally.others(voter_index))
+        # Hand out copies so callers cannot change the cached ballots
+        if (key, True) in self.__cache:
+            self.cache_hits += 1
+            for preferences in self.__cached((key, True)) or []:
+                yield list(preferences)
+            return
+        skip = 0
+        if (key, False) in self.__cache:
+            self.cache_hits += 1
+            first = self.__cached((key, False))
+            if first is None:
+                return
+            yield list(first[0])
+            skip = 1
+        else:
+            self.cache_misses += 1
+        found = []
+        finished = False
+        try:
+            for preferences in self.__strategic_ballots(situation, voter_index, voting_scheme, happiness_func, strategy, verbose):
+                found.append(preferences)
+                if len(found) > skip:
+                    yield list(preferences)
+            finished = True
+        finally:
+            if finished:
+                self.__store((key, True), found or None)
+                self.__store((key, False), found[:1] or None)
+            elif found:
+                self.__store((key, False), found[:1])
+
+    def __cached(self, key):
+        self.__cache.move_to_end(key)
+        return self.__cache[key]
+
+    def __store(self, key, ballots:list[list[str]] | None):
+        self.__cache[key] = ballots
+        self.__cache.move_to_end(key)
+        if len(self.__cache) > self.cache_size:
+            self.__cache.popitem(last=False)
+
+    @staticmethod
+    def __collect(ballots, exhaustive_search) -> list[list[str]] | None:
+        """List of the ballots of a stream, or only its first ballot when the search is not exhaustive."""
+        if exhaustive_search:
+            found = list(ballots)
+        else:
+            found = list(islice(ballots, 1))
+            ballots.close()
+        return found if found else None
+
+    def __strategic_ballots(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, strategy:StrategyType, verbose=False):
         if strategy == StrategyType.BULLET:
-            return self.bullet_vote(situation, voter_index, voting_scheme, happiness_func, exhaustive_search=exhaustive_search)
+            return self.__bullet_ballots(situation, voter_index, voting_scheme, happiness_func)
         elif strategy == StrategyType.BURYING:
-            return self.bury(situation, voter_index, voting_scheme, happiness_func, exhaustive_search=exhaustive_search, verbose=verbose)
+            stats = {'nodes_expanded': 0, 'dedup_hits': 0, 'max_depth_reached': 0, 'truncated': False}
+            return self.__bury_ballots(situation, voter_index, voting_scheme, happiness_func, stats, self.BURY_MAX_DEPTH, self.BURY_MAX_NODES, verbose)
+        elif strategy == StrategyType.BEST_RESPONSE:
+            return self.__best_responses(situation, voter_index, voting_scheme, happiness_func, verbose)
         # elif strategy == StrategyType.COMPROMISING:
-        return self.compromise(situation, voter_index, voting_scheme, happiness_func, exhaustive_search=exhaustive_search, verbose=verbose)
+        return self.__compromise_ballots(situation, voter_index, voting_scheme, happiness_func, verbose)
     
+    @instrumentation.timed('strategies.bullet_vote')
     def bullet_vote(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False) -> None | list[list[str]]:
         """voting for just one alternative, despite having the option to vote for several"""
+        return self.__collect(self.__bullet_ballots(situation, voter_index, voting_scheme, happiness_func), exhaustive_search)
+
+    def __bullet_ballots(self, situation: Situation, voter_index: int, voting_scheme:VotingScheme, happiness_func:HappinessFunc):
         voter: Voter = situation.voters[voter_index]
-        original_happiness, current_winner = situation.calculate_individual_happiness(voter.preferences, happiness_func, voting_scheme, return_winner=True) # type: ignore
+        original_happiness, current_winner = self.__evaluate_ballot(situation, voter_index, voter.preferences, voting_scheme, happiness_func)
         if current_winner == voter.preferences[0]:
-            return None
+            return
 
-        new_situation = deepcopy(situation)
+        new_preferences = list(voter.preferences)
 
-        winning_strategies = []
         # If the winner is not the first preference of the voter, remove the winner from the voter's preferences
         # Repeat as long as the list of preferences is not empty
-        while len(new_situation.voters[voter_index].preferences) > 0:
-            if current_winner not in new_situation.voters[voter_index].preferences:
-                return None
+        while len(new_preferences) > 0:
+            if current_winner not in new_preferences:
+                return
             
-            new_situation.voters[voter_index].preferences.remove(current_winner)
-            current_happiness, current_winner = new_situation.calculate_individual_happiness(voter.preferences, happiness_func, voting_scheme, return_winner=True) # type: ignore
+            new_preferences.remove(current_winner)
+            current_happiness, current_winner = self.__evaluate_ballot(situation, voter_index, new_preferences, voting_scheme, happiness_func)
 
             if current_happiness > original_happiness:
-                new_preferences = new_situation.voters[voter_index].preferences
-                if exhaustive_search:
-                    winning_strategies.append(new_preferences)
-                else:
-                    return [new_preferences]
+                yield list(new_preferences)
             # If the happiness of the voter is not increased, try to remove the second preference
-        
-        if not winning_strategies:
-            return None
-        return winning_strategies
     
-    def __swap(self, situation:Situation, voter_id:int, candidate1_index:int, candidate2_index:int, verbose=False):
+    def __evaluate_ballot(self, situation:Situation, voter_index:int, ballot:list[str], voting_scheme:VotingScheme, happiness_func:HappinessFunc):
+        """Happiness (measured on the voter's own preferences) and winner of the election where the voter casts `ballot`."""
+        if instrumentation.enabled: instrumentation.count('strategy_probes')
+        tally = situation.score_tally(voting_scheme)
+        _, election_ranking, winner = tally.evaluate_with_override(voter_index, ballot)
+        if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
+            return self.happiness.calculate_individual_ranked(situation.voters[voter_index].preferences, election_ranking, happiness_func), winner
+        return self.happiness.winner_column(situation.happiness_table(happiness_func)[voter_index, tally.index[winner]], winner).item(), winner
+
+    def __swap(self, preferences:list[str], candidate1_index:int, candidate2_index:int, verbose=False):
         if verbose:
-            print(f"Swapping {situation.voters[voter_id].preferences[candidate1_index]} and {situation.voters[voter_id].preferences[candidate2_index]}")
-        situation.voters[voter_id].preferences[candidate1_index], situation.voters[voter_id].preferences[candidate2_index] = situation.voters[voter_id].preferences[candidate2_index], situation.voters[voter_id].preferences[candidate1_index]
+            print(f"Swapping {preferences[candidate1_index]} and {preferences[candidate2_index]}")
+        preferences[candidate1_index], preferences[candidate2_index] = preferences[candidate2_index], preferences[candidate1_index]
 
-    def bury(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, verbose=False) -> None | list[list[str]]:
-        original_voter = situation.voters[voter_index]
+    @instrumentation.timed('strategies.bury')
+    def bury(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, verbose=False, max_depth=None, max_nodes=None, return_stats=False):
+        """
+        Move the winner down the voter's ballot one place at a time, and continue from every ballot that changes the winner.
+        The search is an explicit depth first search over ballots, visiting each ballot once (tracked in a hash set).
+        It stops after `max_nodes` evaluated ballots or `max_depth` winner changes (defaults BURY_MAX_NODES and BURY_MAX_DEPTH).
+        With return_stats, also returns the nodes expanded, duplicate ballots skipped, deepest level and whether a budget cut the search.
+        """
+        max_depth = self.BURY_MAX_DEPTH if max_depth is None else max_depth
+        max_nodes = self.BURY_MAX_NODES if max_nodes is None else max_nodes
+        stats = {'nodes_expanded': 0, 'dedup_hits': 0, 'max_depth_reached': 0, 'truncated': False}
+        result = self.__collect(self.__bury_ballots(situation, voter_index, voting_scheme, happiness_func, stats, max_depth, max_nodes, verbose), exhaustive_search)
+        if return_stats:
+            return result, stats
+        return result
+
+    def __bury_ballots(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, stats:dict, max_depth:int, max_nodes:int, verbose=False):
         original_preferences = situation.voters[voter_index].preferences
 
-        if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
-            election_ranking, scores = self.schemes.apply_voting_scheme(voting_scheme, situation.voters, return_ranking=True, return_scores=True)
-            original_winner = election_ranking[0]
-            original_winner_index = original_preferences.index(original_winner)
-            original_winner_happiness = self.happiness.calculate_individual_ranked(original_preferences, election_ranking, happiness_func)
-        else:
-            original_winner, scores = self.schemes.apply_voting_scheme(voting_scheme, situation.voters, return_scores=True)
-            original_winner_index = original_preferences.index(original_winner) # type: ignore
-            original_winner_happiness = self.happiness.calculate_individual(original_voter.preferences, original_winner, happiness_func)
+        tally = situation.score_tally(voting_scheme)
+        scores, _, original_winner = tally.evaluate()
+        original_winner_index = original_preferences.index(original_winner)
+        original_winner_happiness, _ = self.__evaluate_ballot(situation, voter_index, original_preferences, voting_scheme, happiness_func)
 
         if verbose:
             print(original_preferences)
             print("Borda:", original_winner, scores)
 
-        # If the original winner is the first preference of the voter, return False
+        # If the original winner is the first preference of the voter, there is nothing to bury
         if original_winner_index == 0:
-            return None
-        past_preferences = [original_preferences]
-        winning_strategies = []
-        _ = self.__recursive_bury(situation, voter_index, past_preferences, original_voter, original_winner_happiness, voting_scheme, happiness_func, exhaustive_search, winning_strategies, verbose)
-        if not winning_strategies:
-            return None
-        return winning_strategies
-
-    def __recursive_bury(self, situation:Situation, voter_index:int, past_preferences:list, original_voter:Voter, original_winner_happiness:float, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, winning_strategies:list=[], verbose=False):
-        starting_preferences = situation.voters[voter_index].preferences
+            return
+        yield from self.__search_bury(situation, voter_index, list(original_preferences), original_winner, original_winner_happiness, voting_scheme, happiness_func, stats, max_depth, max_nodes, verbose)
+
+    def __search_bury(self, situation:Situation, voter_index:int, starting_preferences:list[str], starting_winner:str, original_winner_happiness:float, voting_scheme:VotingScheme, happiness_func:HappinessFunc, stats:dict, max_depth:int, max_nodes:int, verbose=False):
         num_candidates = len(starting_preferences)
-        modified_situation = deepcopy(situation)
-        # Save the original winner
-        starting_winner, scores = self.schemes.apply_voting_scheme(voting_scheme, situation.voters, return_scores=True)
-        starting_winner_index = starting_preferences.index(starting_winner) # type: ignore
-        # Initialize the current winner
-        
-        # Keep moving the winner to the right until it changes the winner or reaches the end of the loop
-        for i in range(starting_winner_index+1, num_candidates):
-            self.__swap(modified_situation, voter_index, i-1, i, verbose)
-            new_preferences = modified_situation.voters[voter_index].preferences
+        visited = {tuple(starting_preferences)}
+        # Every frame is a ballot whose winner is being moved right, that winner and the next position to move it to
+        stack = [[starting_preferences, starting_winner, starting_preferences.index(starting_winner) + 1]]
+        while stack:
+            frame = stack[-1]
+            new_preferences, winner, i = frame
+            if i >= num_candidates:
+                # The winner reached the end of the ballot without a strategy
+                if verbose:
+                    print("Left recursion")
+                stack.pop()
+                continue
+            frame[2] = i + 1
+            self.__swap(new_preferences, i-1, i, verbose)
             if verbose:
                 print(new_preferences)
 
-            if new_preferences in past_preferences:
+            ballot = tuple(new_preferences)
+            if ballot in visited:
                 if verbose:
                     print("Loop detected")
+                stats['dedup_hits'] += 1
                 continue
-            past_preferences.append(deepcopy(new_preferences))
-            current_winner_happiness, current_winner = modified_situation.calculate_individual_happiness(original_voter.preferences, happiness_func, voting_scheme, return_winner=True) # type: ignore
+            if stats['nodes_expanded'] >= max_nodes:
+                stats['truncated'] = True
+                return
+            visited.add(ballot)
+            stats['nodes_expanded'] += 1
+            current_winner_happiness, current_winner = self.__evaluate_ballot(situation, voter_index, new_preferences, voting_scheme, happiness_func)
 
-            if current_winner != starting_winner:
+            if current_winner != winner:
                 if verbose:
                     print("Winner changed")
 
-                # If the voter is happier, then we found a winning strategy 
+                # If the voter is happier, then we found a winning strategy
                 if current_winner_happiness > original_winner_happiness:
                     if verbose:
                         print("Found a winning strategy!")
-                    if exhaustive_search:
-                        winning_strategies.append(new_preferences)
-                    else:
-                        return True
-                    
-                found_winning_strategy = self.__recursive_bury(modified_situation, voter_index, past_preferences, original_voter, original_winner_happiness, voting_scheme, happiness_func, exhaustive_search, winning_strategies, verbose)
-                if found_winning_strategy and not exhaustive_search:
-                    return True
-
-        # If finished the loop, then the winner is still the same, so return False
-        if verbose:
-            print("Left recursion")
-        return False
+                    yield list(new_preferences)
+                # Continue from this ballot, moving the new winner right
+                if len(stack) < max_depth:
+                    stack.append([list(new_preferences), current_winner, new_preferences.index(current_winner) + 1])
+                    stats['max_depth_reached'] = max(stats['max_depth_reached'], len(stack))
+                else:
+                    stats['truncated'] = True
 
     def __get_indexes_to_iterate(self, preferences:list[str], scores:dict[str,int]):
         # Given a list of preferences and the scores of those preferences, return a list of indexes of candidates to the left of the current winner
@@ -182,48 +299,179 @@ class Strategies:
                 indexes_to_try.append(candidate_index)
         return indexes_to_try
 
+    @instrumentation.timed('strategies.compromise')
     def compromise(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, verbose=False) -> None | list[list[str]]:
-        # Copy the situation
-        new_situation = deepcopy(situation)
-        original_voter = new_situation.voters[voter_index]
-        original_preferences = new_situation.voters[voter_index].preferences
+        return self.__collect(self.__compromise_ballots(situation, voter_index, voting_scheme, happiness_func, verbose), exhaustive_search)
+
+    def __compromise_ballots(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, verbose=False):
+        original_voter = situation.voters[voter_index]
+        original_preferences = original_voter.preferences
+        # Work on a copy of the ballot, happiness is always measured on the original preferences
+        new_preferences = list(original_preferences)
+        tally = situation.score_tally(voting_scheme)
         # If the original winner is the first preference of the voter, return False
-        original_winner_happiness, original_winner = new_situation.calculate_individual_happiness(original_voter.preferences, happiness_func, voting_scheme, return_winner=True) # type: ignore
+        original_winner_happiness, original_winner = self.__evaluate_ballot(situation, voter_index, original_preferences, voting_scheme, happiness_func)
         
-        original_winner_index = original_voter.preferences.index(original_winner) # type: ignore
-        _, scores = self.schemes.apply_voting_scheme(voting_scheme, new_situation.voters, return_scores=True)
+        original_winner_index = original_preferences.index(original_winner)
+        scores, _, _ = tally.evaluate()
         
         if verbose:
             print(original_preferences)
             print("Borda:", original_winner, scores)
 
         if original_winner_index == 0:
-            return None
+            return
         
-        all_winning_preferences = []
-        indexes_to_iterate = self.__get_indexes_to_iterate(original_preferences, scores) # type: ignore
+        indexes_to_iterate = self.__get_indexes_to_iterate(original_preferences, scores)
         # Loop over all candidates to the left of the original winner sorted by score
         for i in indexes_to_iterate:
             # Move that candidate to the first position
-            self.__swap(new_situation, voter_index, i, 0, verbose=verbose)
+            self.__swap(new_preferences, i, 0, verbose=verbose)
             # Check if the winner changed and if the voter is happier
-            new_winner_happiness, new_winner = new_situation.calculate_individual_happiness(original_voter.preferences, happiness_func, voting_scheme, return_winner=True) # type: ignore
+            new_winner_happiness, new_winner = self.__evaluate_ballot(situation, voter_index, new_preferences, voting_scheme, happiness_func)
         
             if verbose:
-                print(new_situation.voters[voter_index].preferences)
+                print(new_preferences)
 
             if new_winner != original_winner and new_winner_happiness > original_winner_happiness:
-                if exhaustive_search:
-                    all_winning_preferences.append(new_situation.voters[voter_index].preferences)
-                    if verbose: print("Found a winning preference")
-                else:
-                    if verbose: print("Found a winning preference")
-                    return [new_situation.voters[voter_index].preferences]
+                if verbose: print("Found a winning preference")
+                yield list(new_preferences)
 
-        if exhaustive_search:
-            if not all_winning_preferences:
-                return None
+    @instrumentation.timed('strategies.best_response')
+    def best_response(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, exhaustive_search=False, verbose=False) -> None | list[list[str]]:
+        """
+        Exact best response of a voter over all complete rankings of the candidates.
+        The other voters' scores are fixed, so whether a candidate can be made to win is decided greedily:
+        it gets the top points and the smallest remaining points go to the candidates closest to beating it.
+        Returns the happiness-maximizing ballot, or with exhaustive_search one ballot per improving outcome (best first).
+        For the winner based functions every candidate is checked and given its own ballot with a sort of the other
+        candidates, so a voter costs O(m^2 log m) for m candidates (not O(m log m): writing out a ballot per winnable
+        candidate alone takes O(m^2)). The ranked functions score every distinct assignment of points instead, see
+        MAX_ENUMERATED_BALLOTS.
+        """
+        return self.__collect(self.__best_responses(situation, voter_index, voting_scheme, happiness_func, verbose), exhaustive_search)
+
+    def __best_responses(self, situation:Situation, voter_index:int, voting_scheme:VotingScheme, happiness_func:HappinessFunc, verbose=False):
+        tally = situation.score_tally(voting_scheme)
+        preferences = situation.voters[voter_index].preferences
+        original_happiness, _ = self.__evaluate_ballot(situation, voter_index, preferences, voting_scheme, happiness_func)
+        candidates = [tally.index[candidate] for candidate in situation.candidates]
+        others, appearances, points = tally.without(voter_index, len(candidates))
+        # Break ties between equivalent ballots in favour of the voter's sincere order
+        sincere_rank = {}
+        for rank, candidate in enumerate(preferences):
+            sincere_rank.setdefault(candidate, rank)
+
+        if happiness_func == HappinessFunc.WEIGHTED_POSITIONAL or happiness_func == HappinessFunc.KENDALL_TAU:
+            options = self.__ranked_best_responses(situation, voter_index, tally, others, appearances, points, candidates, sincere_rank, voting_scheme, happiness_func, original_happiness)
+        else:
+            happiness_row = situation.happiness_table(happiness_func)[voter_index]
+            options = [(self.happiness.winner_column(happiness_row[target], tally.candidates[target]).item(), ballot) for target, ballot in self.__winning_ballots(tally, others, appearances, points, candidates, sincere_rank)]
+
+        improving = sorted((option for option in options if option[0] > original_happiness), key=lambda option: -option[0])
+        if verbose:
+            print(preferences, original_happiness, improving)
+        for _, ballot in improving:
+            yield ballot
+
+    @staticmethod
+    def __winning_ballots(tally, others:list[int], appearances:list[int], points:list[int], candidates:list[int], sincere_rank:dict[str, int]) -> list[tuple[int, list[str]]]:
+        """Every candidate the voter can make win, with a ballot that does it. Sorts once per candidate, O(m^2 log m) in total."""
+        labels = tally.candidates
+        # Columns outside the candidates (e.g. '?') keep the score the other voters gave them
+        fixed = [c for c in range(len(labels)) if c not in candidates and appearances[c] > 0]
+        winning = []
+        for target in candidates + fixed:
+            # A candidate on the ballot gets the top points, a fixed column has to win with the points it already has
+            voted = target in candidates
+            total = others[target] + points[0] if voted else others[target]
+            remaining = sorted(points[1:] if voted else points)
+            if any(others[c] > total or (others[c] == total and labels[c] < labels[target]) for c in fixed if c != target):
+                continue
+            # Most points each rival can get without beating the target (ties go to the earlier label)
+            caps = {c: total - others[c] - (labels[c] < labels[target]) for c in candidates if c != target}
+            # Smallest points to the smallest caps is an optimal matching, so this check is exact
+            if all(p <= cap for p, cap in zip(remaining, sorted(caps.values()))):
+                rivals = sorted(caps, key=lambda c: (-caps[c], sincere_rank.get(labels[c], len(labels))))
+                winning.append((target, ([labels[target]] if voted else []) + [labels[c] for c in rivals]))
+        return winning
+
+    def __ranked_best_responses(self, situation:Situation, voter_index:int, tally, others:list[int], appearances:list[int], points:list[int], candidates:list[int], sincere_rank:dict[str, int], voting_scheme:VotingScheme, happiness_func:HappinessFunc, original_happiness:float) -> list[tuple[float, list[str]]]:
+        """
+        Happiness of every distinct outcome the voter can cause that beats `original_happiness`, with a ballot for each.
+        The ranked functions depend on the whole outcome, so every distinct assignment of points is scored in one array pass.
+        With too many assignments only the greedy winning ballots are tried, which is no longer exact.
+        """
+        labels = tally.candidates
+        preferences = situation.voters[voter_index].preferences
+        if math.factorial(len(points)) // math.prod(math.factorial(points.count(p)) for p in set(points)) > self.MAX_ENUMERATED_BALLOTS:
+            options = []
+            for _, ballot in self.__winning_ballots(tally, others, appearances, points, candidates, sincere_rank):
+                options.append((self.__evaluate_ballot(situation, voter_index, ballot, voting_scheme, happiness_func)[0], ballot))
+            return options
+
+        assignments = self.__point_assignments(tuple(points))
+        if instrumentation.enabled:
+            # Every assignment is an election the voter could cause
+            instrumentation.count('strategy_probes', len(assignments))
+            instrumentation.count('elections', len(assignments))
+        scores = np.tile(np.array(others, dtype=np.int64), (len(assignments), 1))
+        scores[:, candidates] += assignments
+        present = np.array([c for c in range(len(labels)) if c in candidates or appearances[c] > 0])
+        label_rank = np.argsort(np.argsort([labels[c] for c in present], kind='stable'), kind='stable')
+        # Outcome rankings as column indices, by score and then alphabetically like the schemes
+        order = np.lexsort((np.broadcast_to(label_rank, (len(assignments), len(present))), -scores[:, present]), axis=-1)
+        rankings = present[order]
+        # Keep the first assignment of every distinct ranking, comparing the rankings as raw bytes
+        keys = np.ascontiguousarray(rankings.astype(np.int8)).view(np.dtype((np.void, len(present))))
+        _, first = np.unique(keys.ravel(), return_index=True)
+        first = np.sort(first)
+
+        if sorted(preferences) == sorted(situation.candidates) and len(present) == len(candidates):
+            # Complete sincere ranking: score all outcomes at once (same arithmetic as the per-voter functions)
+            positions = np.empty_like(rankings[first])
+            np.put_along_axis(positions, rankings[first], np.arange(len(present)), axis=1)
+            sequence = positions[:, [tally.index[candidate] for candidate in preferences]]
+            num_candidates = len(preferences)
+            if happiness_func == HappinessFunc.KENDALL_TAU:
+                later = np.triu(np.ones((num_candidates, num_candidates), dtype=bool), k=1)
+                discordant = ((sequence[:, :, None] > sequence[:, None, :]) & later).sum(axis=(1, 2))
+                total_pairs = num_candidates * (num_candidates - 1) // 2
+                happiness = (total_pairs - discordant) / total_pairs if total_pairs else np.ones(len(first))
             else:
-                return all_winning_preferences
+                weights, max_distance = self.happiness.positional_weights(num_candidates)
+                actual_distance = (weights * np.abs(np.arange(num_candidates) - sequence)).sum(axis=1)
+                happiness = 1 - actual_distance / max_distance if num_candidates > 1 else np.ones(len(first))
+            happiness = happiness.tolist()
         else:
-            return None
+            happiness = [self.happiness.calculate_individual_ranked(preferences, [labels[c] for c in ranking], happiness_func) for ranking in rankings[first].tolist()]
+
+        options = []
+        for row, row_happiness in zip(assignments[first].tolist(), happiness):
+            if not row_happiness > original_happiness:
+                continue
+            ballot = sorted(range(len(candidates)), key=lambda j: (-row[j], sincere_rank.get(labels[candidates[j]], len(labels))))
+            options.append((row_happiness, [labels[candidates[j]] for j in ballot]))
+        return options
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def __point_assignments(points:tuple[int, ...]) -> np.ndarray:
+        """Every distinct way to hand out the points of one ballot to the candidates, one row per assignment."""
+        values = sorted(set(points), reverse=True)
+        remaining = [points.count(value) for value in values]
+        rows = []
+        row = []
+        def assign():
+            if len(row) == len(points):
+                rows.append(list(row))
+                return
+            for i, value in enumerate(values):
+                if remaining[i]:
+                    remaining[i] -= 1
+                    row.append(value)
+                    assign()
+                    row.pop()
+                    remaining[i] += 1
+        assign()
+        return np.array(rows, dtype=np.int64).reshape(len(rows), len(points))
@@ -0,0 +1,173 @@
+from copy import copy
+import numpy as np
+from tva.enums import VotingScheme
+from tva import instrumentation
+from tva.profile import Profile, EMPTY, BALLOT_DTYPE, positional_scores
+
+
+class ScoreTally:
+    """
+    Aggregate score vector of a situation under one voting scheme.
+    Changing a ballot only adds and removes that ballot's positional points, so
+    "what-if" elections with a few overridden ballots are rescored in O(m) per ballot
+    instead of recounting the whole electorate.
+    """
+    def __init__(self, voters, voting_scheme:VotingScheme, candidates=None):
+        profile = voters if isinstance(voters, Profile) else Profile.from_voters(voters, candidates)
+        if profile.counts is not None:
+            raise ValueError('A score tally needs one ballot per voter, expand the compressed profile first')
+        self.voting_scheme = voting_scheme
+        self.candidates = profile.candidates
+        self.index = {candidate: i for i, candidate in enumerate(self.candidates)}
+        ballots = profile.ballots
+        valid = ballots != EMPTY
+        self.rows: list[tuple[int, ...]] = [tuple(c for c in row if c != EMPTY) for row in ballots.tolist()]
+        self.scores: list[int] = positional_scores(ballots, voting_scheme, len(self.candidates)).tolist()
+        # Number of ballot slots holding each candidate, a candidate on no ballot is left out of the ranking
+        self.appearances: list[int] = np.bincount(ballots[valid], minlength=len(self.candidates)).tolist()
+        # Histogram of ballot lengths, Borda points depend on the longest ballot
+        self.length_counts: dict[int, int] = {}
+        for row in self.rows:
+            self.length_counts[len(row)] = self.length_counts.get(len(row), 0) + 1
+        self.width = max(self.length_counts, default=0)
+        self.__points_cache: dict[tuple[int, int], list[int]] = {}
+
+    def encode(self, ballot) -> tuple[int, ...]:
+        """Convert a ballot of candidate labels to candidate indices."""
+        return tuple(self.index[candidate] for candidate in ballot)
+
+    def evaluate(self):
+        """Scores, ranking and winner of the unchanged election."""
+        return self.evaluate_with_overrides({})
+
+    def evaluate_with_override(self, voter_id:int, ballot):
+        """Scores, ranking and winner of the election in which `voter_id` casts `ballot` instead."""
+        return self.evaluate_with_overrides({voter_id: ballot})
+
+    def evaluate_with_overrides(self, overrides:dict):
+        """Scores, ranking and winner of the election with several ballots replaced at once."""
+        if instrumentation.enabled: instrumentation.count('elections')
+        encoded = {voter_id: self.encode(ballot) for voter_id, ballot in overrides.items()}
+        scores, appearances, _ = self.__apply(encoded)
+        return self.__outcome(scores, appearances)
+
+    def ballot_delta(self, voter_id:int, ballot) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Change of the score and appearance vectors when `voter_id` casts `ballot` instead.
+        The deltas of different voters add up, so a coalition is scored from the sum of its members' deltas
+        (see evaluate_with_delta), unless its ballots shift the Borda points (see shifts_points).
+        """
+        old_ballot = self.rows[voter_id]
+        new_ballot = self.encode(ballot)
+        scores = np.zeros(len(self.candidates), dtype=np.int64)
+        appearances = np.zeros(len(self.candidates), dtype=np.int64)
+        for candidate, points in zip(old_ballot, self.__points(len(old_ballot), self.width)):
+            scores[candidate] -= points
+            appearances[candidate] -= 1
+        for candidate, points in zip(new_ballot, self.__points(len(new_ballot), self.width)):
+            scores[candidate] += points
+            appearances[candidate] += 1
+        return scores, appearances
+
+    def shifts_points(self, overrides:dict) -> bool:
+        """Whether replacing these ballots changes the longest ballot length, and with it every Borda point."""
+        return self.voting_scheme == VotingScheme.BORDA and self.__width_with(overrides) != self.width
+
+    def evaluate_with_delta(self, score_delta:np.ndarray, appearance_delta:np.ndarray):
+        """Scores, ranking and winner of the election whose score and appearance vectors changed by the given (summed) deltas."""
+        if instrumentation.enabled: instrumentation.count('elections')
+        return self.__outcome((score_delta + self.scores).tolist(), (appearance_delta + self.appearances).tolist())
+
+    def with_overrides(self, overrides:dict) -> 'ScoreTally':
+        """New tally in which several ballots are replaced, derived from this one without recounting."""
+        encoded = {voter_id: self.encode(ballot) for voter_id, ballot in overrides.items()}
+        tally = copy(self)
+        tally.scores, tally.appearances, tally.width = self.__apply(encoded)
+        tally.rows = self.rows.copy()
+        tally.length_counts = self.length_counts.copy()
+        for voter_id, new_ballot in encoded.items():
+            tally.length_counts[len(self.rows[voter_id])] -= 1
+            tally.length_counts[len(new_ballot)] = tally.length_counts.get(len(new_ballot), 0) + 1
+            tally.rows[voter_id] = new_ballot
+        return tally
+
+    def others(self, voter_id:int):
+        """
+        Scores, appearances and longest ballot length of every voter except `voter_id`.
+        Together with the ballot `voter_id` casts they fix the outcome, so they identify the voter's strategic problem.
+        """
+        scores, appearances, width = self.__apply({voter_id: ()})
+        return tuple(scores), tuple(appearances), width
+
+    def without(self, voter_id:int, length:int):
+        """
+        Scores and appearances of every candidate without `voter_id`'s ballot, and the points per rank
+        of a ballot of `length` candidates cast by that voter (used to build best responses).
+        """
+        placeholder = tuple(range(length))
+        scores, appearances, width = self.__apply({voter_id: placeholder})
+        points = self.__points(length, width)
+        for candidate, candidate_points in zip(placeholder, points):
+            scores[candidate] -= candidate_points
+            appearances[candidate] -= 1
+        return scores, appearances, points
+
+    def __apply(self, encoded:dict[int, tuple[int, ...]]):
+        """Scores, appearances and longest ballot length after replacing the encoded ballots."""
+        width = self.__width_with(encoded)
+        if width != self.width and self.voting_scheme == VotingScheme.BORDA:
+            # The longest ballot changed, so every Borda point shifts and a full recount is needed
+            scores, appearances = self.__recount(encoded)
+            return scores, appearances, width
+        scores = self.scores.copy()
+        appearances = self.appearances.copy()
+        for voter_id, new_ballot in encoded.items():
+            old_ballot = self.rows[voter_id]
+            for candidate, points in zip(old_ballot, self.__points(len(old_ballot), width)):
+                scores[candidate] -= points
+                appearances[candidate] -= 1
+            for candidate, points in zip(new_ballot, self.__points(len(new_ballot), width)):
+                scores[candidate] += points
+                appearances[candidate] += 1
+        return scores, appearances, width
+
+    def __outcome(self, scores:list[int], appearances:list[int]):
+        # Sort by score (descending) and then alphabetically for ties, as Schemes does
+        order = sorted((i for i, count in enumerate(appearances) if count > 0), key=lambda i: (-scores[i], self.candidates[i]))
+        ranking = [self.candidates[i] for i in order]
+        return {self.candidates[i]: scores[i] for i in order}, ranking, ranking[0]
+
+    def __width_with(self, encoded:dict[int, tuple[int, ...]]) -> int:
+        if not encoded:
+            return self.width
+        length_counts = self.length_counts.copy()
+        for voter_id, new_ballot in encoded.items():
+            length_counts[len(self.rows[voter_id])] -= 1
+            length_counts[len(new_ballot)] = length_counts.get(len(new_ballot), 0) + 1
+        return max((length for length, count in length_counts.items() if count > 0), default=0)
+
+    def __points(self, length:int, width:int) -> list[int]:
+        """Points per rank for a ballot of the given length."""
+        key = (length, width)
+        if key not in self.__points_cache:
+            if self.voting_scheme == VotingScheme.PLURALITY:
+                points = [1 if rank < 1 else 0 for rank in range(length)]
+            elif self.voting_scheme == VotingScheme.VOTE_FOR_TWO:
+                points = [1 if rank < 2 else 0 for rank in range(length)]
+            elif self.voting_scheme == VotingScheme.ANTI_PLURALITY:
+                points = [1 if rank < length - 1 else 0 for rank in range(length)]
+            else:
+                points = [width - 1 - rank for rank in range(length)]
+            self.__points_cache[key] = points
+        return self.__points_cache[key]
+
+    def __recount(self, encoded:dict[int, tuple[int, ...]]):
+        rows = [encoded.get(voter_id, row) for voter_id, row in enumerate(self.rows)]
+        width = max((len(row) for row in rows), default=0)
+        ballots = np.full((len(rows), width), EMPTY, dtype=BALLOT_DTYPE)
+        for i, row in enumerate(rows):
+            ballots[i, :len(row)] = row
+        valid = ballots != EMPTY
+        scores = positional_scores(ballots, self.voting_scheme, len(self.candidates)).tolist()
+        appearances = np.bincount(ballots[valid], minlength=len(self.candidates)).tolist()
+        return scores, appearances
@@ -2,17 +2,58 @@ import random
 import math
 from tva.enums import VotingScheme, HappinessFunc
 
+# Label of a preference the voter has no information about (see Situation's info parameter)
+UNKNOWN = '?'
+
+# A single generator reseeded for every voter, so a voter does not keep a Mersenne Twister state alive
+_shuffler = random.Random()
+
 class Voter:
+    """
+    Voter with a ballot stored as a tuple of candidate indices.
+    Index len(candidates) stands for UNKNOWN, `preferences` converts the ballot back to labels.
+    `situation` is the situation the voter belongs to, it is told when the preferences change so it can drop
+    everything it computed from the old ballot.
+    """
+    __slots__ = ('voter_id', 'candidates', 'ballot', 'situation')
+
     def __init__(self, voter_id, candidates, seed=None):
         self.voter_id = voter_id
-        self.rng = random.Random(seed)
-        self.preferences: list[str] = self.get_preferences(candidates)
+        self.candidates: list[str] = candidates
+        self.ballot: tuple[int, ...] = self.__shuffled_indices(len(candidates), seed)
+        self.situation = None
+
+    @classmethod
+    def from_ballot(cls, voter_id, candidates, ballot:tuple[int, ...]):
+        """Voter with a ballot of candidate indices that is already known, skipping the shuffle."""
+        voter = cls.__new__(cls)
+        voter.voter_id = voter_id
+        voter.candidates = candidates
+        voter.ballot = ballot
+        voter.situation = None
+        return voter
 
-    def get_preferences(self, c:list[str]) -> list[str]:
+    def get_preferences(self, c:list[str], seed=None) -> list[str]:
         # Shuffles the candidate list using random.Random with a seed
-        indices = list(range(len(c)))
-        self.rng.shuffle(indices)
-        return [c[i] for i in indices]
+        return [c[i] for i in self.__shuffled_indices(len(c), seed)]
+
+    @staticmethod
+    def __shuffled_indices(num_candidates:int, seed) -> tuple[int, ...]:
+        # Reseeding gives the same permutation as random.Random(seed).shuffle
+        indices = list(range(num_candidates))
+        _shuffler.seed(seed)
+        _shuffler.shuffle(indices)
+        return tuple(indices)
+
+    @property
+    def preferences(self) -> list[str]:
+        return [self.candidates[i] if i < len(self.candidates) else UNKNOWN for i in self.ballot]
+
+    @preferences.setter
+    def preferences(self, preferences:list[str]):
+        self.ballot = tuple(len(self.candidates) if candidate == UNKNOWN else self.candidates.index(candidate) for candidate in preferences)
+        if self.situation is not None:
+            self.situation._preferences_changed(self)
 
     def __repr__(self):
-        return f'Voter {self.voter_id}: {self.preferences}'
\ No newline at end of file
+        return f'Voter {self.voter_id}: {self.preferences}'